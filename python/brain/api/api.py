@@ -6,6 +6,7 @@ from requests.utils import get_netrc_auth
 from brain.core.exceptions import BrainError, BrainApiAuthError, BrainNotImplemented
 from brain import bconfig
 from brain.utils.general import uncompress_data
+from brain.utils.general.framing import FRAMED_MIMETYPE, FrameDecoder
 from brain.core.core import URLMapDict
 try:
     from urlparse import urlsplit, urlunsplit
@@ -168,6 +169,35 @@ class BrainInteraction(object):
                 data = uncompress_data(response.content, uncompress_with='msgpack')
         return data
 
+    def _get_frames(self, response, chunksize=None):
+        ''' Get the rows of a length-prefixed framed data stream
+
+        Decodes the frames incrementally as the response content arrives,
+        without decoding or splitting the content as a string.  See
+        `~brain.utils.general.framing` for the stream format.
+
+        Parameters:
+            response:
+                The full response
+            chunksize (int):
+                The unit of the chunk size in bytes.  When None, chunksize determined by
+                interal magic. Default is None
+
+        Returns:
+            A dictionary with the list of rows in the 'data' key
+
+        '''
+
+        decoder = FrameDecoder()
+        data = []
+        if self.stream:
+            for chunk in response.iter_content(chunk_size=chunksize):
+                data.extend(decoder.feed(chunk))
+        else:
+            data.extend(decoder.feed(response.content))
+        decoder.close()
+        return {'data': data}
+
     def _get_content(self, response):
         ''' Get the response content
 
@@ -184,7 +214,9 @@ class BrainInteraction(object):
         '''
 
         content_type = response.headers['Content-Type']
-        if 'json' in content_type:
+        if FRAMED_MIMETYPE in content_type:
+            data = self._get_frames(response)
+        elif 'json' in content_type:
             data = self._get_data(response, dtype='json')
         elif 'octet-stream' in content_type:
             data = self._get_data(response)
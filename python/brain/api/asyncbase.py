@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+asyncbase.py
+
+Licensed under a 3-clause BSD license.
+
+An async variant of `BrainBaseView`, for views that mostly wait on the
+database or the filesystem.  Routes of an `AsyncBrainBaseView` may be
+coroutines that await their I/O, and run concurrent I/O with `_gather` or
+offload blocking calls with `_run_sync`.  The ``before_request`` and
+``after_request`` hooks, the API authentication and the results envelope
+are the same as for `BrainBaseView`.
+
+Async views need the ``asgiref`` package (``pip install flask[async]``).
+`asgi_app` wraps a Flask app so it can be served by an ASGI server.  Flask
+is a WSGI framework, so each request still holds a thread while it runs:
+the ASGI server handles as many concurrent requests as `asgi_app` has
+worker threads.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import asyncio
+import contextvars
+import functools
+import inspect
+from flask import request, current_app
+from brain.api.base import BrainBaseView
+from brain.core.exceptions import BrainMissingDependence
+
+
+__all__ = ['AsyncBrainBaseView', 'asgi_app']
+
+
+async def _maybe_await(value):
+    ''' Awaits the value if it is awaitable, otherwise returns it '''
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncBrainBaseView(BrainBaseView):
+    """Super Class for API Views with async (coroutine) routes
+
+    Routes can be either regular methods or ``async def`` coroutines, as can
+    ``before_request``, ``before_<name>`` and ``after_<name>``.
+
+    Example:
+        >>> class CubeView(AsyncBrainBaseView):
+        >>>     route_base = '/cubes/'
+        >>>
+        >>>     async def get(self, name):
+        >>>         cube, header = await self._gather(self._run_sync(load_cube, name),
+        >>>                                           self._run_sync(load_header, name))
+        >>>         self.update_results({'data': {'cube': cube, 'header': header}})
+        >>>         return jsonify(self.results)
+
+    """
+
+    @classmethod
+    def make_proxy_method(cls, name, init_argument=None):
+        """Creates the async proxy function that Flask routes to.
+
+        Follows the request flow of Flask-Classful's proxy, awaiting the
+        view and the hooks when they are coroutines."""
+
+        i = cls() if init_argument is None else cls(init_argument)
+        view = getattr(i, name)
+
+        # wrap the bound method into a function so function attributes,
+        # e.g. is_public, can be set by the class decorators
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def view_func(*args, **kwargs):
+                return await view(*args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def view_func(*args, **kwargs):
+                return view(*args, **kwargs)
+        view_func.class_ = i
+
+        if cls.decorators:
+            for decorator in reversed(cls.decorators):
+                view_func = decorator(view_func)
+
+        @functools.wraps(view_func)
+        async def proxy(**forgettable_view_args):
+            # always use the request view_args, like Flask-Classful
+            del forgettable_view_args
+
+            response = await _maybe_await(i.before_request(name, **request.view_args))
+            if response is not None:
+                return response
+
+            before_view = getattr(i, 'before_' + name, None)
+            if before_view is not None:
+                response = await _maybe_await(before_view(**request.view_args))
+                if response is not None:
+                    return response
+
+            response = await _maybe_await(view_func(**request.view_args))
+            response = current_app.make_response(response)
+
+            after_view = getattr(i, 'after_' + name, None)
+            if after_view is not None:
+                response = await _maybe_await(after_view(response))
+
+            return await _maybe_await(i.after_request(name, response))
+
+        return proxy
+
+    async def _run_sync(self, func, *args, **kwargs):
+        ''' Runs a blocking function in a thread pool and awaits its result
+
+        The function runs in a copy of the current context, so it can use the
+        Flask ``request``, ``current_app`` and ``g`` of the view.
+
+        Parameters:
+            func (callable):
+                The blocking function, e.g. a database query
+            args, kwargs:
+                The arguments passed to ``func``
+
+        Returns:
+            The result of ``func``
+        '''
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run,
+                                          functools.partial(func, *args, **kwargs))
+
+    async def _gather(self, *aws):
+        ''' Awaits several coroutines concurrently and returns their results in order '''
+        return await asyncio.gather(*aws)
+
+
+def asgi_app(app, workers=None):
+    ''' Wraps a Flask app into an ASGI application
+
+    Unlike asgiref's ``WsgiToAsgi`` alone, which runs all the requests one
+    at a time on a single thread, each request runs in its own
+    ``ThreadSensitiveContext``, and so on its own thread, so the requests of
+    one worker process are handled concurrently.
+
+    Parameters:
+        app (Flask):
+            The Flask application
+        workers (int):
+            The maximum number of requests running at once.  Defaults to no limit.
+
+    Returns:
+        An ASGI application, to serve with e.g. uvicorn or hypercorn
+    '''
+
+    try:
+        from asgiref.sync import ThreadSensitiveContext
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError:
+        raise BrainMissingDependence('asgiref is required to serve Brain views with ASGI. '
+                                     'Install it with pip install flask[async]')
+
+    wsgi = WsgiToAsgi(app)
+    # created on the first request, in the event loop of the server
+    limit = {}
+
+    async def application(scope, receive, send):
+        if workers and 'semaphore' not in limit:
+            limit['semaphore'] = asyncio.Semaphore(workers)
+        semaphore = limit.get('semaphore', None)
+
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            async with ThreadSensitiveContext():
+                await wsgi(scope, receive, send)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    return application
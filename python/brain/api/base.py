@@ -11,10 +11,13 @@ Revision History:
 """
 from __future__ import print_function
 from __future__ import division
+import time
 from flask_classful import FlaskView
-from flask import request, current_app, jsonify
+from flask import Blueprint, request, current_app, jsonify, g
 from brain import bconfig
 from brain.core.exceptions import BrainError
+from brain.api.ratelimit import retry_after_header
+from brain.api.tokens import get_bearer_token
 
 
 def processRequest(request=None, as_dict=None, param=None):
@@ -64,13 +67,103 @@ def processRequest(request=None, as_dict=None, param=None):
     return form
 
 
+def _stopProfiling(error=None):
+    ''' Stops the profiler of a request that failed before reaching after_request
+
+    Registered as a teardown_request handler, which runs even when the view
+    raises, so the profiler is never left running on the worker thread.
+    '''
+
+    session = g.pop('brain_profile', None)
+    if session is not None:
+        session.stop()
+
+
+def _observe(metrics, status, response=None):
+    ''' Records the request in the metrics, with the status of its response '''
+
+    start = g.get('brain_request_start', None)
+    duration = time.time() - start if start is not None else 0.0
+    size = None
+    if response is not None and not response.is_streamed:
+        size = response.calculate_content_length()
+    metrics.observe(request.endpoint, request.method, status, duration, size=size)
+
+
+def _recordUnfinished(response):
+    ''' Records the metrics of a request that did not reach after_request
+
+    Registered as an app after_request handler, which also runs for the
+    error responses of views that raised, e.g. a 500 or an abort(404).
+    '''
+
+    metrics = g.pop('brain_metrics', None)
+    if metrics is not None:
+        _observe(metrics, response.status_code, response)
+    return response
+
+
+def _recordFailed(error=None):
+    ''' Records a request whose exception was not turned into a response as a 500
+
+    Registered as a teardown_request handler, for the exceptions that are
+    propagated, e.g. in testing, without an error response.
+    '''
+
+    metrics = g.pop('brain_metrics', None)
+    if metrics is not None:
+        _observe(metrics, 500)
+
+
+def _recordCacheEndpoints(app):
+    ''' Adds the endpoint names of an app to the routes decorated with ``@cached`` '''
+
+    for endpoint, view_func in app.view_functions.items():
+        endpoints = getattr(view_func, 'cache_endpoints', None)
+        if endpoints is not None:
+            endpoints.add(endpoint)
+
+
 class BrainBaseView(FlaskView):
     """Super Class for all API Views to handle all global API items of interest"""
 
+    # a brain.api.ratelimit.RateLimiter; rate limiting is disabled when None
+    limiter = None
+    # a brain.api.metrics.Metrics; request metrics are disabled when None
+    metrics = None
+    # a brain.api.profiling.RequestProfiler; request profiling is disabled when None
+    profiler = None
+    # a brain.api.tokens.TokenVerifier; bearer tokens are not verified by Brain when None
+    token_verifier = None
+    # the HTTP cache lifetime, in seconds, of the @public routes without a @cache_control
+    public_max_age = 0
+
     def __init__(self):
         self.reset_results()
         bconfig.mode = 'local'
 
+    @classmethod
+    def register(cls, app, *args, **kwargs):
+        ''' Registers the view, and the handlers of the requests whose view raised
+
+        The handlers stop failed profiles and record the failed requests in
+        the metrics.  Also records the endpoint names of the routes decorated
+        with ``@cached``, so their ``invalidate`` works before they serve a request.
+        '''
+
+        super(BrainBaseView, cls).register(app, *args, **kwargs)
+        if _stopProfiling not in app.teardown_request_funcs.get(None, []):
+            app.teardown_request(_stopProfiling)
+        if _recordFailed not in app.teardown_request_funcs.get(None, []):
+            app.teardown_request(_recordFailed)
+        if _recordUnfinished not in app.after_request_funcs.get(None, []):
+            app.after_request(_recordUnfinished)
+
+        if isinstance(app, Blueprint):
+            app.record(lambda state: _recordCacheEndpoints(state.app))
+        else:
+            _recordCacheEndpoints(app)
+
     def reset_results(self):
         self.results = {'data': None, 'status': -1, 'error': None, 'traceback': None}
 
@@ -84,7 +177,13 @@ class BrainBaseView(FlaskView):
         pass
 
     def before_request(self, *args, **kwargs):
+        g.brain_request_start = time.time()
+        if self.metrics is not None:
+            g.brain_metrics = self.metrics
         form = processRequest(request=request)
+        if self.profiler is not None:
+            g.brain_profile = self.profiler.start(request)
+            form = self.profiler.strip(form)
         self._release = form.get('release', None) if form else None
         self._endpoint = request.endpoint
         self.results['inconfig'] = form
@@ -95,12 +194,22 @@ class BrainBaseView(FlaskView):
         # after_request; obstensibly the in and out configs should match)
         self.add_config()
 
+        # check the per-address rate limit first, so unauthenticated floods are limited
+        response = self._checkRateLimit(before_auth=True)
+        if response is not None:
+            return self._finishRequest(response)
+
         # check API Authentication
         try:
             self._checkAuth()
         except BrainError as e:
             msg = 'Brain Authorization Error: {0}.  Check your token or netrc file'.format(e)
-            return jsonify({'error': msg, 'status': -1})
+            return self._finishRequest(jsonify({'error': msg, 'status': -1}))
+
+        # check the API rate limits
+        response = self._checkRateLimit()
+        if response is not None:
+            return self._finishRequest(response)
 
     def after_request(self, name, response):
         """This performs a reset of the results dict after every request method runs.
@@ -108,6 +217,63 @@ class BrainBaseView(FlaskView):
         See Flask-Classy for more info on after_request."""
 
         self.reset_results()
+        response = self._setCacheHeaders(response)
+        return self._finishRequest(response)
+
+    def _setCacheHeaders(self, response):
+        ''' Sets the HTTP cache headers of cacheable responses
+
+        Successful GET responses of routes decorated with ``@public`` or
+        ``@cache_control`` get an ETag and a Cache-Control header.  Conditional
+        requests matching the ETag are answered with a 304 Not Modified.
+        Responses already marked ``no-store`` by their view are left untouched.
+        '''
+
+        if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304) or \
+                response.is_streamed or response.cache_control.no_store:
+            return response
+
+        view_func = current_app.view_functions.get(request.endpoint, None)
+        control = getattr(view_func, 'cache_control', None)
+        if control is None:
+            if not getattr(view_func, 'is_public', False):
+                return response
+            control = {'max_age': self.public_max_age, 'public': True, 'must_revalidate': False}
+
+        public = control['public']
+        if public is None:
+            public = getattr(view_func, 'is_public', False)
+        if public:
+            response.cache_control.public = True
+        else:
+            response.cache_control.private = True
+        if control['max_age']:
+            response.cache_control.max_age = control['max_age']
+        else:
+            response.cache_control.no_cache = True
+        if control['must_revalidate']:
+            response.cache_control.must_revalidate = True
+
+        if response.status_code == 304:
+            return response
+        if not response.get_etag()[0]:
+            response.add_etag()
+        return response.make_conditional(request)
+
+    def _finishRequest(self, response):
+        ''' Performs the bookkeeping on the outgoing response of every request
+
+        Called from after_request, and for responses returned early from
+        before_request, which Flask-Classful does not pass to after_request.
+        '''
+
+        session = g.pop('brain_profile', None)
+        if session is not None:
+            response = self.profiler.finish(session, response)
+
+        metrics = g.pop('brain_metrics', None)
+        if metrics is not None:
+            _observe(metrics, response.status_code, response)
         return response
 
     def _checkAuth(self):
@@ -122,7 +288,47 @@ class BrainBaseView(FlaskView):
         if ispublic:
             return
 
+        self._verifyAuth()
+
+    def _verifyAuth(self):
+        ''' Verifies the Authorization header of the request, public route or not
+
+        Raises a BrainError when the request is not authenticated.
+        '''
+
         if 'Authorization' not in request.headers:
             raise BrainError('Authorization is required to access!')
 
+        # verify bearer tokens, with the verified claims cached across requests
+        if self.token_verifier is not None:
+            token = get_bearer_token(request)
+            if token is not None:
+                g.brain_token_claims = self.token_verifier.verify(token)
+
+    def _checkRateLimit(self, before_auth=False):
+        ''' Checks the request against the API rate limits
+
+        Returns a 429 response, with a Retry-After header, when the client
+        has exhausted its token bucket, and None otherwise.  With
+        ``before_auth``, only the per-address limit is checked.
+        '''
+
+        if self.limiter is None:
+            return None
+
+        view_func = current_app.view_functions.get(request.endpoint, None)
+        if before_auth:
+            allowed, wait = self.limiter.check_ip(request, view_func=view_func)
+        else:
+            allowed, wait = self.limiter.check(request, request.endpoint, view_func=view_func)
+        if allowed:
+            return None
+
+        msg = 'Rate Limit Exceeded: too many requests to {0}.  Retry in {1} seconds'.format(
+            request.endpoint, retry_after_header(wait))
+        response = jsonify({'error': msg, 'status': -1})
+        response.status_code = 429
+        response.headers['Retry-After'] = retry_after_header(wait)
+        return response
+
 
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+caching.py
+
+Licensed under a 3-clause BSD license.
+
+Server-side caching of serialized API responses.  Routes decorated with
+`~brain.utils.general.decorators.cached` store their response bytes in a
+cache backend, keyed on the endpoint, the release and the normalized
+request parameters.  Repeated requests are answered from the cache without
+running the view or serializing its results again.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import glob
+import hashlib
+import json
+import os
+import time
+from brain.utils.general.cache import TTLCache
+
+
+__all__ = ['CachedResponse', 'MemoryResponseCache', 'DiskResponseCache', 'response_cache_key']
+
+
+def _digest(text, size=40):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:size]
+
+
+class CachedResponse(object):
+    ''' The serialized content of a cached response
+
+    Parameters:
+        body (bytes):
+            The response body
+        status (int):
+            The HTTP status code
+        mimetype (str):
+            The response mimetype
+        created (float):
+            When the response was cached.  Defaults to now.
+        etag (str):
+            The entity tag of the body.  Defaults to its md5 digest.
+
+    '''
+
+    def __init__(self, body, status=200, mimetype='application/json', created=None, etag=None):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.created = created if created is not None else time.time()
+        self.etag = etag if etag is not None else hashlib.md5(body).hexdigest()
+
+    def __repr__(self):
+        return 'CachedResponse(status={0}, size={1}, etag={2})'.format(
+            self.status, len(self.body), self.etag)
+
+    def to_response(self):
+        ''' Returns a Flask response with the cached content '''
+        from flask import Response
+        response = Response(self.body, status=self.status, mimetype=self.mimetype)
+        response.set_etag(self.etag)
+        response.last_modified = self.created
+        response.headers['X-Brain-Cache'] = 'hit'
+        return response
+
+
+def response_cache_key(endpoint, release, params, view_args=None, ignore=(), identity=None):
+    ''' Builds the cache key of a request
+
+    Parameters:
+        endpoint (str):
+            The name of the endpoint
+        release (str):
+            The release of the request
+        params (dict):
+            The request parameters.  Lists are values of repeated keys.
+        view_args (dict):
+            The arguments of the route, e.g. the name of a cube
+        ignore (list):
+            Parameters that do not change the response, e.g. the session_id
+        identity (str):
+            An optional client identity, for responses that depend on the user
+
+    Returns:
+        A tuple of the (endpoint, release) prefix and the full key
+    '''
+
+    params = {key: val for key, val in (params or {}).items() if key not in ignore}
+    normalized = json.dumps([params, view_args or {}, identity], sort_keys=True, default=str)
+    prefix = (endpoint, str(release))
+    return prefix, '{0}|{1}|{2}'.format(endpoint, release, normalized)
+
+
+class MemoryResponseCache(object):
+    ''' An in-process LRU cache of responses
+
+    Parameters:
+        maxsize (int):
+            The maximum number of cached responses.  Default is 256.
+        ttl (float):
+            The lifetime of a cached response in seconds.  If None, responses
+            are only evicted when the cache is full.  Default is 300.
+
+    '''
+
+    def __init__(self, maxsize=256, ttl=300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        ''' Returns the `CachedResponse` of a key, or None '''
+        return self._cache.get(key[1])
+
+    def set(self, key, entry):
+        ''' Caches a `CachedResponse` under a key '''
+        self._cache.set(key[1], entry)
+
+    def invalidate(self, endpoint=None, release=None):
+        ''' Removes the cached responses of an endpoint and/or release, or all of them '''
+
+        def match(key):
+            keyendpoint, keyrelease, params = key.split('|', 2)
+            return (endpoint is None or keyendpoint == endpoint) and \
+                (release is None or keyrelease == str(release))
+        return self._cache.discard(match)
+
+    def info(self):
+        ''' Returns the cache statistics '''
+        return self._cache.info()
+
+
+class DiskResponseCache(object):
+    ''' A cache of responses stored as files in a local directory
+
+    The directory can be shared by all the worker processes of a host.
+    Each response is a file holding a JSON header line and the body bytes.
+
+    Parameters:
+        path (str):
+            The cache directory.  It is created if needed.
+        maxsize (int):
+            The maximum number of cached responses.  The oldest files are removed
+            first.  Default is 10000.
+        ttl (float):
+            The lifetime of a cached response in seconds.  If None, responses
+            are only evicted when the cache is full.  Default is 3600.
+
+    '''
+
+    def __init__(self, path, maxsize=10000, ttl=3600):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _filename(self, key):
+        (endpoint, release), fullkey = key
+        return os.path.join(self.path, '{0}_{1}_{2}.cache'.format(
+            _digest(endpoint, 12), _digest(release, 12), _digest(fullkey)))
+
+    def get(self, key):
+        ''' Returns the `CachedResponse` of a key, or None '''
+
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if header.get('key') != key[1] or \
+                (self.ttl is not None and header['created'] + self.ttl <= time.time()):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return CachedResponse(body, status=header['status'], mimetype=header['mimetype'],
+                              created=header['created'], etag=header['etag'])
+
+    def set(self, key, entry):
+        ''' Caches a `CachedResponse` under a key '''
+
+        filename = self._filename(key)
+        header = {'key': key[1], 'status': entry.status, 'mimetype': entry.mimetype,
+                  'created': entry.created, 'etag': entry.etag}
+        tmpfile = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(tmpfile, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(entry.body)
+        os.replace(tmpfile, filename)
+        self._prune()
+
+    def _prune(self):
+        ''' Removes the oldest files when there are more than maxsize '''
+
+        files = glob.glob(os.path.join(self.path, '*.cache'))
+        if len(files) <= self.maxsize:
+            return
+        files.sort(key=lambda name: os.path.getmtime(name))
+        for filename in files[:len(files) - self.maxsize]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def invalidate(self, endpoint=None, release=None):
+        ''' Removes the cached responses of an endpoint and/or release, or all of them '''
+
+        pattern = '{0}_{1}_*.cache'.format(
+            _digest(endpoint, 12) if endpoint is not None else '*',
+            _digest(str(release), 12) if release is not None else '*')
+        count = 0
+        for filename in glob.glob(os.path.join(self.path, pattern)):
+            try:
+                os.remove(filename)
+                count += 1
+            except OSError:
+                pass
+        return count
+
+    def info(self):
+        ''' Returns the cache statistics '''
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(glob.glob(os.path.join(self.path, '*.cache'))),
+                'maxsize': self.maxsize, 'hit_rate': self.hits / total if total else 0.0}
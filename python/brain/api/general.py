@@ -18,9 +18,11 @@ from __future__ import division
 from __future__ import print_function
 from flask_classful import route
 from brain.api.base import BrainBaseView
-from brain.utils.general.decorators import public
+from brain.utils.general.decorators import public, ratelimit_exempt
 from brain.utils.general import build_routemap
-from flask import current_app, jsonify
+from brain.core.warmup import warmup
+from brain.core.exceptions import BrainError
+from flask import current_app, jsonify, Response
 
 
 class BrainGeneralRequestsView(BrainBaseView):
@@ -88,5 +90,113 @@ class BrainGeneralRequestsView(BrainBaseView):
         self.update_results(res)
         return jsonify(self.results)
 
+    @ratelimit_exempt
+    @route('/metrics/', endpoint='metrics')
+    def getMetrics(self):
+        """ Returns the API request metrics in the Prometheus text format
 
+        .. :quickref: General; Returns the per-endpoint request metrics
 
+        Reports the request counts, error counts, latency histograms and response
+        sizes of each endpoint, aggregated over all worker processes.  Metrics
+        are only collected when a `~brain.api.metrics.Metrics` is attached to
+        ``BrainBaseView.metrics``.  The route requires authorization, but is
+        exempt from the rate limits, so the scrapes are never throttled.
+
+        :reqheader Authorization: Basic or Bearer authentication
+        :resheader Content-Type: text/plain
+        :statuscode 200: no error
+        :statuscode 404: metrics are not enabled
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /marvin/api/general/metrics/ HTTP/1.1
+           Host: api.sdss.org
+           Authorization: Bearer <token>
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: text/plain; version=0.0.4
+           # TYPE brain_requests_total counter
+           brain_requests_total{endpoint="getroutemap",method="GET",status="200"} 12
+           ...
+
+        """
+
+        if self.metrics is None:
+            self.update_results({'error': 'Request metrics are not enabled'})
+            return jsonify(self.results), 404
+
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @public
+    @ratelimit_exempt
+    @route('/ready/', endpoint='ready')
+    def getReady(self):
+        """ Reports if the application has completed its startup warmup
+
+        .. :quickref: General; Returns the readiness of the application
+
+        Returns a 200 status once all the required initializers registered in the
+        application `~brain.core.warmup.WarmupRegistry` have completed, and a
+        503 status otherwise, so load balancers only route traffic to warm workers.
+        The route is exempt from the rate limits and never cached.  Anonymous
+        requests only get the state of each initializer, and authenticated
+        requests also get their durations and errors.
+
+        :resjson int status: status of response. 1 if ready, -1 if not.
+        :resjson json data: dictionary of returned data
+        :json bool ready: whether the application is ready
+        :json dict warmup: the status of each initializer
+        :reqheader Authorization: optional, Basic or Bearer authentication
+        :resheader Content-Type: application/json
+        :resheader Cache-Control: no-store
+        :statuscode 200: the application is ready
+        :statuscode 503: the application is still warming up, or a warmup step failed
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /marvin/api/general/ready/ HTTP/1.1
+           Host: api.sdss.org
+           Accept: application/json, */*
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+           {
+              "status": 1,
+              "error": null,
+              "traceback": null,
+              "data": {"ready": true,
+                       "warmup": {"modelgraph": {"state": "done", "duration": 1.2,
+                                                 "error": null, "required": true}}
+                      }
+           }
+
+        """
+
+        registry = current_app.extensions.get('brain_warmup', warmup)
+        ready = registry.ready
+        status = registry.status()
+        try:
+            self._verifyAuth()
+        except BrainError:
+            # don't leak the error messages, e.g. connection strings, to anonymous probes
+            status = {name: {'state': task['state'], 'required': task['required']}
+                      for name, task in status.items()}
+        res = {'data': {'ready': ready, 'warmup': status}, 'status': 1 if ready else -1}
+        self.update_results(res)
+        response = jsonify(self.results)
+        response.status_code = 200 if ready else 503
+        response.cache_control.no_store = True
+        return response
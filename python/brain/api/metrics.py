@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+metrics.py
+
+Licensed under a 3-clause BSD license.
+
+Per-endpoint request metrics for the Brain API views.  A `Metrics` instance
+is attached to `BrainBaseView.metrics` and records the request counts,
+latencies, response sizes and error counts of every request.  When given a
+directory, each worker process periodically writes its own counters there,
+so the metrics route can report totals across all workers.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+__all__ = ['Metrics']
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    ''' Escapes a Prometheus label value '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**kwargs):
+    ''' Formats a set of Prometheus labels '''
+    return ','.join('{0}="{1}"'.format(key, _escape(val)) for key, val in kwargs.items())
+
+
+def _format_bound(bound):
+    ''' Formats a histogram bucket bound '''
+    return '{0:g}'.format(bound)
+
+
+class Metrics(object):
+    ''' Collects per-endpoint latency, size and status metrics
+
+    Parameters:
+        path (str):
+            A directory shared by all worker processes.  If set, each process
+            writes its counters to a file in this directory, and `collect`
+            aggregates all of them.  If None, only this process is reported.
+        buckets (tuple):
+            The upper bounds, in seconds, of the latency histogram buckets
+        flush_interval (float):
+            The minimum number of seconds between two writes of the process
+            counters to ``path``.  Default is 1.
+        prefix (str):
+            The prefix of the exported metric names.  Default is "brain".
+
+    Example:
+        >>> BrainBaseView.metrics = Metrics(path='/tmp/brain_metrics')
+
+    '''
+
+    def __init__(self, path=None, buckets=DEFAULT_BUCKETS, flush_interval=1.0, prefix='brain'):
+        self.path = os.path.abspath(os.path.expanduser(path)) if path else None
+        self.buckets = tuple(sorted(buckets))
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self.reset()
+
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def reset(self):
+        ''' Resets the counters of this process '''
+        with self._lock:
+            self._requests = {}
+            self._latency = {}
+            self._sizes = {}
+
+    def observe(self, endpoint, method, status, duration, size=None):
+        ''' Records a finished request
+
+        Parameters:
+            endpoint (str):
+                The name of the requested endpoint
+            method (str):
+                The HTTP method of the request
+            status (int):
+                The HTTP status code of the response
+            duration (float):
+                The request duration in seconds
+            size (int):
+                The response body size in bytes, if known
+        '''
+
+        endpoint = endpoint or 'unknown'
+        with self._lock:
+            key = '{0}|{1}|{2}'.format(endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            hist = self._latency.get(endpoint, None)
+            if hist is None:
+                hist = self._latency[endpoint] = {'buckets': [0] * len(self.buckets),
+                                                  'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['sum'] += duration
+            hist['count'] += 1
+
+            if size is not None:
+                sizes = self._sizes.setdefault(endpoint, {'sum': 0, 'count': 0})
+                sizes['sum'] += size
+                sizes['count'] += 1
+
+        if self.path:
+            self._maybe_flush()
+
+    def snapshot(self):
+        ''' Returns a copy of the counters of this process '''
+
+        with self._lock:
+            return {'buckets': list(self.buckets),
+                    'requests': dict(self._requests),
+                    'latency': {key: {'buckets': list(val['buckets']), 'sum': val['sum'],
+                                      'count': val['count']}
+                                for key, val in self._latency.items()},
+                    'sizes': {key: dict(val) for key, val in self._sizes.items()}}
+
+    @property
+    def _process_file(self):
+        return os.path.join(self.path, 'metrics_{0}.json'.format(os.getpid()))
+
+    def _maybe_flush(self):
+        ''' Writes the process counters if the flush interval has passed
+
+        Called at the end of requests, so it never blocks on, or raises
+        from, a flush: it is skipped when another thread is flushing, and
+        write errors are logged.
+        '''
+
+        if time.time() - self._last_flush < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(False):
+            return
+        try:
+            if time.time() - self._last_flush >= self.flush_interval:
+                self._write()
+        except (IOError, OSError, ValueError) as e:
+            from brain import log
+            log.warning('Could not write the metrics to {0}: {1}'.format(self.path, e))
+        finally:
+            self._flush_lock.release()
+
+    def flush(self):
+        ''' Writes the process counters to the shared metrics directory '''
+
+        if not self.path:
+            return
+
+        with self._flush_lock:
+            self._write()
+
+    def _write(self):
+        ''' Atomically replaces the process file, through a unique temporary file '''
+
+        self._last_flush = time.time()
+        fd, tmpfile = tempfile.mkstemp(dir=self.path, prefix='.metrics_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmpfile, self._process_file)
+        except BaseException:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+
+    def collect(self):
+        ''' Returns the counters aggregated across all worker processes '''
+
+        snapshots = [self.snapshot()]
+        if self.path:
+            own = self._process_file
+            for filename in glob.glob(os.path.join(self.path, 'metrics_*.json')):
+                if filename == own:
+                    continue
+                try:
+                    with open(filename, 'r') as f:
+                        snapshots.append(json.load(f))
+                except (IOError, ValueError):
+                    # a file being replaced or from a crashed worker
+                    continue
+
+        total = {'requests': {}, 'latency': {}, 'sizes': {}}
+        for snap in snapshots:
+            if snap.get('buckets', list(self.buckets)) != list(self.buckets):
+                continue
+            for key, val in snap['requests'].items():
+                total['requests'][key] = total['requests'].get(key, 0) + val
+            for key, val in snap['latency'].items():
+                hist = total['latency'].setdefault(
+                    key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+                hist['buckets'] = [aa + bb for aa, bb in zip(hist['buckets'], val['buckets'])]
+                hist['sum'] += val['sum']
+                hist['count'] += val['count']
+            for key, val in snap['sizes'].items():
+                sizes = total['sizes'].setdefault(key, {'sum': 0, 'count': 0})
+                sizes['sum'] += val['sum']
+                sizes['count'] += val['count']
+        return total
+
+    def render(self):
+        ''' Renders the aggregated metrics in the Prometheus text format '''
+
+        data = self.collect()
+        name = self.prefix
+        lines = []
+
+        lines.append('# HELP {0}_requests_total Total number of API requests.'.format(name))
+        lines.append('# TYPE {0}_requests_total counter'.format(name))
+        errors = []
+        for key in sorted(data['requests']):
+            endpoint, method, status = key.rsplit('|', 2)
+            count = data['requests'][key]
+            lines.append('{0}_requests_total{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint, method=method, status=status), count))
+            if int(status) >= 400:
+                errors.append((endpoint, status, count))
+
+        lines.append('# HELP {0}_request_errors_total Total number of API requests that '
+                     'returned an error status.'.format(name))
+        lines.append('# TYPE {0}_request_errors_total counter'.format(name))
+        merged = {}
+        for endpoint, status, count in errors:
+            merged[(endpoint, status)] = merged.get((endpoint, status), 0) + count
+        for (endpoint, status), count in sorted(merged.items()):
+            lines.append('{0}_request_errors_total{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint, status=status), count))
+
+        lines.append('# HELP {0}_request_duration_seconds API request latency.'.format(name))
+        lines.append('# TYPE {0}_request_duration_seconds histogram'.format(name))
+        for endpoint in sorted(data['latency']):
+            hist = data['latency'][endpoint]
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist['buckets']):
+                cumulative += count
+                lines.append('{0}_request_duration_seconds_bucket{{{1}}} {2}'.format(
+                    name, _labels(endpoint=endpoint, le=_format_bound(bound)), cumulative))
+            lines.append('{0}_request_duration_seconds_bucket{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint, le='+Inf'), hist['count']))
+            lines.append('{0}_request_duration_seconds_sum{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint), repr(hist['sum'])))
+            lines.append('{0}_request_duration_seconds_count{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint), hist['count']))
+
+        lines.append('# HELP {0}_response_size_bytes API response body size.'.format(name))
+        lines.append('# TYPE {0}_response_size_bytes summary'.format(name))
+        for endpoint in sorted(data['sizes']):
+            sizes = data['sizes'][endpoint]
+            lines.append('{0}_response_size_bytes_sum{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint), sizes['sum']))
+            lines.append('{0}_response_size_bytes_count{{{1}}} {2}'.format(
+                name, _labels(endpoint=endpoint), sizes['count']))
+
+        return '\n'.join(lines) + '\n'
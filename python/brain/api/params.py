@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+params.py
+
+Licensed under a 3-clause BSD license.
+
+Declarative, typed parsing of the API request parameters.  A `ParamSchema`
+lists the `Param` definitions of a route and is compiled once, when it is
+created.  It parses the form, JSON and route path parameters of a request
+in a single pass, and the parsed values are cached on the request so that
+they are never re-parsed inside the views.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+from functools import lru_cache
+from brain.core.exceptions import BrainError
+
+
+__all__ = ['Param', 'ParamSchema', 'BrainValidationError', 'parse_route_path', 'get_params']
+
+
+class BrainValidationError(BrainError):
+    ''' Raised when the request parameters do not validate against a schema '''
+
+    def __init__(self, errors):
+        self.errors = errors
+        msg = '; '.join('{0}: {1}'.format(key, val) for key, val in sorted(errors.items()))
+        super(BrainValidationError, self).__init__('Invalid parameters. {0}'.format(msg))
+
+
+_true_values = ('true', 't', 'yes', 'y', '1', 'on')
+_false_values = ('false', 'f', 'no', 'n', '0', 'off', '')
+
+
+def _to_bool(value):
+    ''' Converts a request string to a boolean '''
+
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _true_values:
+        return True
+    if text in _false_values:
+        return False
+    raise ValueError('cannot interpret {0!r} as a boolean'.format(value))
+
+
+def _to_none(value):
+    return None if str(value).lower() in ('none', 'null') else value
+
+
+class Param(object):
+    ''' The definition of one request parameter
+
+    Parameters:
+        name (str):
+            The name of the parameter
+        type (type or callable):
+            The type the string value is converted to, e.g. str, int, float or bool, or
+            any callable taking the raw value.  Default is str.
+        default (object):
+            The value used when the parameter is not in the request
+        required (bool):
+            If True, a missing parameter is a validation error.  Default is False.
+        multiple (bool):
+            If True, the parameter is a list of values.  Repeated keys are collected,
+            and single values are split on ``separator``.  Default is False.
+        separator (str):
+            The separator of a list given as a single string.  Default is ",".
+        choices (list):
+            The allowed values, after conversion
+        validate (callable):
+            An additional check taking the converted value and returning False
+            (or raising ValueError) when the value is invalid
+        nullable (bool):
+            If True, the strings "None" and "null" are converted to None.  Default is False.
+
+    '''
+
+    def __init__(self, name, type=str, default=None, required=False, multiple=False,
+                 separator=',', choices=None, validate=None, nullable=False):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.required = required
+        self.multiple = multiple
+        self.separator = separator
+        self.choices = frozenset(choices) if choices is not None else None
+        self.validate = validate
+        self.nullable = nullable
+        self._convert = self._compile()
+
+    def __repr__(self):
+        return 'Param({0}, type={1})'.format(self.name, getattr(self.type, '__name__', self.type))
+
+    def _compile(self):
+        ''' Builds the conversion function of a single value '''
+
+        if self.type is bool:
+            convert = _to_bool
+        elif self.type is str:
+            def convert(value):
+                return value if isinstance(value, str) else str(value)
+        elif isinstance(self.type, type):
+            ptype = self.type
+
+            def convert(value):
+                return value if type(value) is ptype else ptype(value)
+        else:
+            convert = self.type
+
+        if self.nullable:
+            base = convert
+
+            def convert(value):
+                value = _to_none(value)
+                return None if value is None else base(value)
+
+        return convert
+
+    def parse(self, raw):
+        ''' Converts and validates the raw request value
+
+        Parameters:
+            raw (str or list):
+                The raw value from the request.  A list for repeated keys.
+
+        Returns:
+            The converted value
+
+        Raises:
+            ValueError: when the value cannot be converted or is invalid
+        '''
+
+        if self.multiple:
+            if isinstance(raw, (list, tuple)):
+                values = raw
+            elif isinstance(raw, str):
+                values = [item for item in raw.split(self.separator) if item] \
+                    if self.separator else [raw]
+            else:
+                values = [raw]
+            value = [self._convert(item) for item in values]
+            check = value
+        else:
+            if isinstance(raw, (list, tuple)):
+                raw = raw[-1]
+            value = self._convert(raw)
+            check = [value]
+
+        if self.choices is not None:
+            bad = [item for item in check if item not in self.choices]
+            if bad:
+                raise ValueError('{0} not one of {1}'.format(
+                    bad[0], sorted(self.choices, key=str)))
+        if self.validate is not None:
+            for item in check:
+                if self.validate(item) is False:
+                    raise ValueError('{0!r} failed validation'.format(item))
+        return value
+
+
+class ParamSchema(object):
+    ''' A compiled set of request parameter definitions
+
+    Parameters:
+        params (Param):
+            The parameter definitions
+        allow_unknown (bool):
+            If True, parameters not in the schema are kept, as strings, in the parsed
+            output.  If False, they are dropped.  Default is False.
+
+    Example:
+        >>> schema = ParamSchema(Param('release', required=True),
+        >>>                      Param('limit', int, default=100),
+        >>>                      Param('params', multiple=True))
+        >>> schema.parse({'release': 'MPL-5', 'limit': '10'})
+        {'release': 'MPL-5', 'limit': 10, 'params': None}
+
+    '''
+
+    def __init__(self, *params, **kwargs):
+        self.allow_unknown = kwargs.pop('allow_unknown', False)
+        assert not kwargs, 'unknown arguments {0}'.format(list(kwargs))
+        self.params = tuple(params)
+        self._byname = {param.name: param for param in params}
+        assert len(self._byname) == len(self.params), 'parameter names must be unique'
+        self._required = tuple(param.name for param in params if param.required)
+        self._defaults = {param.name: param.default for param in params if not param.required}
+
+    def __repr__(self):
+        return 'ParamSchema({0})'.format(', '.join(self._byname))
+
+    def parse(self, *sources):
+        ''' Parses and validates parameters in a single pass
+
+        Parameters:
+            sources (dict):
+                The raw parameter dictionaries, e.g. the form and the route path.
+                Values in later sources override the earlier ones.
+
+        Returns:
+            A dict of the converted parameters
+
+        Raises:
+            BrainValidationError: when any parameter is missing or invalid
+        '''
+
+        out = dict(self._defaults)
+        errors = {}
+        seen = set()
+        for source in sources:
+            if not source:
+                continue
+            for key, raw in source.items():
+                param = self._byname.get(key, None)
+                if param is None:
+                    if self.allow_unknown:
+                        out[key] = raw
+                    continue
+                try:
+                    out[key] = param.parse(raw)
+                except (ValueError, TypeError) as e:
+                    errors[key] = str(e)
+                else:
+                    errors.pop(key, None)
+                seen.add(key)
+
+        for key in self._required:
+            if key not in seen:
+                errors[key] = 'missing required parameter'
+
+        if errors:
+            raise BrainValidationError(errors)
+        return out
+
+
+@lru_cache(maxsize=1024)
+def _split_route_path(path):
+    ''' Splits a route path like a=1/b=2 into a tuple of (key, value) pairs '''
+
+    pairs = []
+    for kw in path.split('/'):
+        if len(kw) == 0:
+            continue
+        var, sep, value = kw.partition('=')
+        if not sep or not var:
+            raise BrainValidationError({kw: 'route path parameters must be of the form key=value'})
+        pairs.append((var, value))
+    return tuple(pairs)
+
+
+def parse_route_path(path):
+    ''' Returns the key=value parameters of a generic route path as a dict
+
+    The split of each distinct path string is computed once and cached.
+
+    Parameters:
+        path (str):
+            The route path, e.g. "a=1/b=2"
+
+    Returns:
+        A dict of the string parameters, e.g. {'a': '1', 'b': '2'}
+    '''
+
+    return dict(_split_route_path(path)) if path else {}
+
+
+def get_params(request, schema, path=None):
+    ''' Parses the parameters of a request with a schema
+
+    Parses the form or JSON parameters, and the route path parameters, of
+    the request.  The result is cached on the request, so repeated calls
+    with the same schema do not parse again.
+
+    Parameters:
+        request (Request):
+            The Flask request object
+        schema (ParamSchema):
+            The parameter schema
+        path (str):
+            The generic route path, e.g. "a=1/b=2".  Its parameters override
+            the form parameters.
+
+    Returns:
+        A dict of the converted parameters
+
+    Raises:
+        BrainValidationError: when any parameter is missing or invalid
+    '''
+
+    cache = request.environ.setdefault('brain.params', {})
+    key = (id(schema), path)
+    if key not in cache:
+        cache[key] = (schema, schema.parse(_request_form(request), parse_route_path(path)))
+    return dict(cache[key][1])
+
+
+def _request_form(request):
+    ''' Returns the form or JSON parameters of a request as a plain dict
+
+    Repeated keys of a multidict are grouped into a list.  The conversion is
+    done once per request and cached in the request environ.
+    '''
+
+    from brain.api.base import processRequest
+
+    form = request.environ.get('brain.form', None)
+    if form is None:
+        data = processRequest(request=request)
+        if hasattr(data, 'lists'):
+            form = {key: val if len(val) > 1 else val[0] for key, val in data.lists()}
+        else:
+            form = data or {}
+        request.environ['brain.form'] = form
+    return form
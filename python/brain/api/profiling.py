@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+profiling.py
+
+Licensed under a 3-clause BSD license.
+
+On-demand profiling of single API requests.  A `RequestProfiler` is attached
+to `BrainBaseView.profiler`.  Authorized requests carrying the profiling
+header (or parameter) run under either a deterministic (cProfile) or a
+sampling profiler, and the profile is stored under the request id or
+returned to the client as an attachment.  A small fraction of all requests
+can also be profiled continuously with the low-overhead sampling profiler.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+
+__all__ = ['RequestProfiler', 'SamplingProfiler']
+
+
+class SamplingProfiler(object):
+    ''' A statistical profiler sampling the call stack of one thread
+
+    A background thread periodically records the stack of the profiled
+    thread.  The overhead is set by the sampling interval and does not
+    depend on the number of function calls.
+
+    Parameters:
+        interval (float):
+            The number of seconds between two samples.  Default is 0.005.
+        thread_id (int):
+            The id of the thread to profile.  Defaults to the current thread.
+
+    '''
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = {}
+        self.nsamples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        ''' Starts sampling '''
+        self._thread = threading.Thread(target=self._run, name='brain-sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        ''' Stops sampling '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id, None)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0}:{1}:{2}'.format(os.path.basename(code.co_filename),
+                                                  frame.f_lineno, code.co_name))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.nsamples += 1
+
+    def folded(self):
+        ''' Returns the samples as folded stacks, for use with flame graph tools '''
+        return '\n'.join('{0} {1}'.format(key, val) for key, val in
+                         sorted(self.stacks.items(), key=lambda item: -item[1])) + '\n'
+
+    def report(self, limit=30):
+        ''' Returns a text summary of the functions seen in most samples '''
+
+        total = {}
+        for key, count in self.stacks.items():
+            # count each function once per stack, even when recursive
+            for func in set(key.split(';')):
+                total[func] = total.get(func, 0) + count
+
+        lines = ['{0} samples every {1} s'.format(self.nsamples, self.interval),
+                 '{0:>8} {1:>7}  {2}'.format('samples', 'percent', 'function')]
+        for func, count in sorted(total.items(), key=lambda item: -item[1])[:limit]:
+            percent = 100. * count / self.nsamples if self.nsamples else 0.
+            lines.append('{0:>8} {1:>6.1f}%  {2}'.format(count, percent, func))
+        return '\n'.join(lines) + '\n'
+
+
+class _ProfileSession(object):
+    ''' The profiler running for one request '''
+
+    def __init__(self, mode, attach, request_id, interval):
+        self.mode = mode
+        self.attach = attach
+        self.request_id = request_id
+        self.started = time.time()
+        if mode == 'deterministic':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler(interval=interval)
+            self.profiler.start()
+
+    def stop(self):
+        if self.mode == 'deterministic':
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        self.duration = time.time() - self.started
+
+    def report(self):
+        ''' Returns a text report of the profile '''
+
+        header = 'Profile of request {0} ({1}, {2:.4f} s)\n\n'.format(
+            self.request_id, self.mode, self.duration)
+        if self.mode == 'deterministic':
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(50)
+            return header + stream.getvalue()
+        return header + self.profiler.report()
+
+    def save(self, path):
+        ''' Saves the raw profile into the directory ``path`` and returns the filename '''
+
+        if self.mode == 'deterministic':
+            filename = os.path.join(path, '{0}.prof'.format(self.request_id))
+            self.profiler.dump_stats(filename)
+        else:
+            filename = os.path.join(path, '{0}.folded'.format(self.request_id))
+            with open(filename, 'w') as f:
+                f.write(self.profiler.folded())
+        return filename
+
+
+class RequestProfiler(object):
+    ''' Profiles selected API requests
+
+    A request is profiled on demand when it carries the profiling header, or
+    parameter, set to the profiling secret (or passes the ``authorize``
+    check).  The header ``X-Brain-Profile-Mode`` (or parameter ``profile_mode``)
+    selects the ``'deterministic'`` or ``'sampling'`` profiler, and the header
+    ``X-Brain-Profile-Output`` (or parameter ``profile_output``) set to
+    ``'attach'`` returns the profile report as the response body instead of
+    the normal response.  Otherwise the profile is saved to ``path`` and its
+    request id returned in the ``X-Brain-Profile-Id`` header.
+
+    Parameters:
+        secret (str):
+            The shared secret authorizing on-demand profiling.  If None and no
+            ``authorize`` function is given, on-demand profiling is disabled.
+        path (str):
+            The directory where profiles are stored.  If None, profiles can only
+            be attached to the response.
+        authorize (callable):
+            An optional function taking the request and returning True when the
+            request may be profiled, e.g. to allow admin tokens.
+        mode (str):
+            The default profiler for on-demand requests.  Default is ``'deterministic'``.
+        sample_rate (float):
+            The fraction of all requests to profile continuously with the sampling
+            profiler.  These profiles are always stored to ``path``.  Default is 0.
+        interval (float):
+            The sampling profiler interval in seconds.  Default is 0.005.
+        header (str):
+            The name of the request header enabling profiling
+        param (str):
+            The name of the request parameter enabling profiling
+
+    Example:
+        >>> BrainBaseView.profiler = RequestProfiler(secret=os.environ['BRAIN_PROFILE_KEY'],
+        >>>                                          path='/tmp/profiles', sample_rate=0.001)
+
+    '''
+
+    modes = ['deterministic', 'sampling']
+
+    def __init__(self, secret=None, path=None, authorize=None, mode='deterministic',
+                 sample_rate=0.0, interval=0.005, header='X-Brain-Profile', param='profile'):
+        assert mode in self.modes, 'mode must be one of {0}'.format(self.modes)
+        self.secret = secret
+        self.path = os.path.abspath(os.path.expanduser(path)) if path else None
+        self.authorize = authorize
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.header = header
+        self.param = param
+
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @property
+    def params(self):
+        ''' The names of the request parameters used by the profiler '''
+        return (self.param, 'profile_mode', 'profile_output')
+
+    def strip(self, form):
+        ''' Removes the profiling parameters from a request form
+
+        Keeps the profiling secret out of the echoed ``inconfig`` and out of
+        the Brain config.
+        '''
+
+        if not form or not any(param in form for param in self.params):
+            return form
+        return {key: val for key, val in form.items() if key not in self.params}
+
+    def _option(self, request, header, param):
+        ''' Gets a profiling option from the request headers or parameters '''
+        value = request.headers.get(header, None)
+        if value is None:
+            value = request.values.get(param, None)
+        return value
+
+    def _is_authorized(self, request, value):
+        ''' Checks if a request asking to be profiled is allowed to '''
+
+        if self.authorize is not None:
+            return bool(self.authorize(request))
+        if self.secret is None or value is None:
+            return False
+        return hmac.compare_digest(str(value).encode('utf-8'), str(self.secret).encode('utf-8'))
+
+    def _request_id(self, request):
+        ''' Returns a safe request id, from the X-Request-ID header if set '''
+
+        request_id = request.headers.get('X-Request-ID', '')
+        if not re.match(r'^[\w\-]{1,64}$', request_id):
+            request_id = uuid.uuid4().hex
+        return request_id
+
+    def start(self, request):
+        ''' Starts profiling a request if requested and authorized
+
+        Returns:
+            The profiling session, or None if the request is not profiled
+        '''
+
+        value = self._option(request, self.header, self.param)
+        if value is not None and self._is_authorized(request, value):
+            mode = self._option(request, 'X-Brain-Profile-Mode', 'profile_mode') or self.mode
+            if mode not in self.modes:
+                mode = self.mode
+            attach = self._option(request, 'X-Brain-Profile-Output', 'profile_output') == 'attach'
+            if not attach and not self.path:
+                attach = True
+        elif self.sample_rate and self.path and random.random() < self.sample_rate:
+            mode, attach = 'sampling', False
+        else:
+            return None
+
+        try:
+            return _ProfileSession(mode, attach, self._request_id(request), self.interval)
+        except ValueError:
+            # another profiler is already active in this thread
+            return None
+
+    def finish(self, session, response):
+        ''' Stops profiling and attaches or stores the profile
+
+        Parameters:
+            session (_ProfileSession):
+                The session returned by `start`
+            response (Response):
+                The outgoing response
+
+        Returns:
+            The response, or a new response with the profile report as attachment
+        '''
+
+        from flask import Response
+
+        session.stop()
+        if session.attach:
+            report = Response(session.report(), mimetype='text/plain')
+            report.headers['Content-Disposition'] = \
+                'attachment; filename=profile_{0}.txt'.format(session.request_id)
+            report.headers['X-Brain-Profile-Id'] = session.request_id
+            report.headers['X-Brain-Profile-Status'] = str(response.status_code)
+            return report
+
+        session.save(self.path)
+        response.headers['X-Brain-Profile-Id'] = session.request_id
+        return response
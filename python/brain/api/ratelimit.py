@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+ratelimit.py
+
+Licensed under a 3-clause BSD license.
+
+Token-bucket rate limiting for the Brain API views.  A `RateLimiter` is
+attached to `BrainBaseView.limiter` and is checked in ``before_request``.
+Bucket state lives in-process by default, or in a `SQLiteBucketStore` when
+it needs to be shared between the worker processes of a host.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+__all__ = ['RateLimit', 'RateLimiter', 'MemoryBucketStore', 'SQLiteBucketStore']
+
+
+def _consume(state, rate, capacity, now, cost=1):
+    ''' Refill a bucket and try to take ``cost`` tokens from it
+
+    Parameters:
+        state (tuple):
+            The (tokens, timestamp) of the bucket, or None for a new (full) bucket
+        rate (float):
+            The refill rate, in tokens per second
+        capacity (float):
+            The maximum number of tokens in the bucket
+        now (float):
+            The current time
+        cost (float):
+            The number of tokens the request costs
+
+    Returns:
+        A tuple of (allowed, new state, seconds until the request would be allowed)
+    '''
+
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, last = state
+        tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+
+    if tokens >= cost:
+        return True, (tokens - cost, now), 0.0
+
+    retry_after = (cost - tokens) / rate if rate > 0 else float('inf')
+    return False, (tokens, now), retry_after
+
+
+class MemoryBucketStore(object):
+    ''' In-process storage of the token buckets
+
+    Buckets are kept in a dictionary guarded by a lock, so the store is
+    safe to share between the threads of one worker.  Once the store holds
+    more than ``maxsize`` buckets, the buckets that have refilled completely
+    are dropped, at most once every ``prune_interval`` seconds.  If the store
+    is still over ``maxsize``, the least recently used buckets are dropped,
+    which resets them to full.
+
+    Parameters:
+        maxsize (int):
+            The maximum number of buckets to keep.  Default is 100000.
+        prune_interval (float):
+            The minimum number of seconds between two scans for idle buckets.
+            Default is 10.
+
+    '''
+
+    def __init__(self, maxsize=100000, prune_interval=10.0):
+        self.maxsize = maxsize
+        self.prune_interval = prune_interval
+        self._buckets = {}
+        self._pruned = None
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity, now, cost=1):
+        ''' Atomically refill and consume from the bucket ``key`` '''
+
+        with self._lock:
+            # buckets are (tokens, timestamp, seconds to refill completely), and are
+            # re-inserted on each use so the dictionary is ordered by last use
+            bucket = self._buckets.pop(key, None)
+            allowed, state, retry_after = _consume(bucket[:2] if bucket else None, rate,
+                                                   capacity, now, cost=cost)
+            self._buckets[key] = state + (capacity / rate if rate > 0 else 0.0,)
+            if len(self._buckets) > self.maxsize:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now):
+        ''' Drop the buckets that have refilled completely, then the least recently used '''
+
+        if self._pruned is None or now - self._pruned >= self.prune_interval:
+            self._pruned = now
+            stale = [key for key, (tokens, last, idle) in self._buckets.items()
+                     if now - last >= idle]
+            for key in stale:
+                del self._buckets[key]
+
+        while len(self._buckets) > self.maxsize:
+            del self._buckets[next(iter(self._buckets))]
+
+    def clear(self):
+        ''' Remove all buckets '''
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore(object):
+    ''' Token buckets shared between processes through a local SQLite file
+
+    Each check runs inside an immediate transaction, so concurrent workers
+    on the same host see a consistent bucket state.
+
+    Parameters:
+        path (str):
+            The path to the SQLite database file.  It is created if needed.
+        timeout (float):
+            Seconds to wait for the database lock.  Default is 5.
+
+    '''
+
+    def __init__(self, path, timeout=5.0):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                     '(key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connect(self):
+        ''' Returns the sqlite connection of the current thread '''
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, rate, capacity, now, cost=1):
+        ''' Atomically refill and consume from the bucket ``key`` '''
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?',
+                               (key,)).fetchone()
+            allowed, state, retry_after = _consume(row, rate, capacity, now, cost=cost)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) '
+                         'VALUES (?, ?, ?)', (key, state[0], state[1]))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        return allowed, retry_after
+
+    def clear(self):
+        ''' Remove all buckets '''
+        self._connect().execute('DELETE FROM buckets')
+
+
+class RateLimit(object):
+    ''' A token-bucket limit definition
+
+    Parameters:
+        rate (float):
+            The number of requests allowed per ``per`` seconds
+        per (float):
+            The period, in seconds, over which ``rate`` requests are allowed.  Default is 1.
+        burst (int):
+            The bucket capacity, i.e. the number of requests that can be made
+            at once.  Defaults to ``rate``.
+        key (str or callable):
+            How clients are identified.  One of ``'token'``, ``'user'``, ``'ip'``, or
+            ``'auto'`` (token, then user, then ip), or a callable taking the request
+            and returning a string.  Default is ``'auto'``.
+        scope (str):
+            The bucket namespace.  Defaults to the endpoint name, so each endpoint
+            has its own buckets.  Limits sharing a scope share their buckets.
+        cost (float):
+            The number of tokens each request costs.  Default is 1.
+
+    '''
+
+    key_types = ['auto', 'token', 'user', 'ip']
+
+    def __init__(self, rate, per=1.0, burst=None, key='auto', scope=None, cost=1):
+        assert rate > 0, 'rate must be positive'
+        assert per > 0, 'per must be positive'
+        assert callable(key) or key in self.key_types, \
+            'key must be a callable or one of {0}'.format(self.key_types)
+        self.rate = rate / per
+        self.capacity = burst if burst is not None else rate
+        self.key = key
+        self.scope = scope
+        self.cost = cost
+
+    def __repr__(self):
+        return ('RateLimit(rate={0}/s, burst={1}, key={2})'
+                .format(self.rate, self.capacity, self.key))
+
+    def identify(self, request):
+        ''' Returns the client identifier of a request '''
+
+        if callable(self.key):
+            return str(self.key(request))
+
+        if self.key in ('auto', 'token'):
+            auth = request.headers.get('Authorization', None)
+            if auth:
+                # never keep raw credentials around in the bucket store
+                return 'token:' + hashlib.sha256(auth.encode('utf-8')).hexdigest()[:32]
+
+        if self.key in ('auto', 'user'):
+            user = request.authorization.username if request.authorization else None
+            user = user or request.environ.get('REMOTE_USER', None)
+            if user:
+                return 'user:{0}'.format(user)
+
+        return 'ip:{0}'.format(request.remote_addr)
+
+
+class RateLimiter(object):
+    ''' Checks requests against token-bucket rate limits
+
+    Attach an instance to ``BrainBaseView.limiter`` (or to a subclass) to enable
+    rate limiting.  The limit for a request is taken, in order, from the
+    `~brain.utils.general.decorators.ratelimit` decorator on the route, from
+    the ``limits`` dictionary keyed by endpoint name, and finally from ``default``.
+    These limits are checked after authentication.  The ``ip_limit`` is
+    checked before it, so floods of unauthenticated requests are limited too.
+
+    Parameters:
+        default (RateLimit):
+            The limit applied to all endpoints without a specific one.  If None,
+            only endpoints with a specific limit are rate limited.
+        limits (dict):
+            A dictionary of endpoint name: `RateLimit`
+        store (object):
+            The bucket store.  Defaults to an in-process `MemoryBucketStore`.
+        exempt_public (bool):
+            If True, routes decorated with ``@public`` only get limited by
+            a specific limit and not by ``default``.  Default is False.
+        ip_limit (RateLimit):
+            The limit of all the requests of each client IP address, shared by
+            all endpoints and checked before authentication.  Its ``key`` is
+            ignored, since the credentials are not verified yet.  Disabled when None.
+
+    Example:
+        >>> BrainBaseView.limiter = RateLimiter(default=RateLimit(10, burst=20),
+        >>>                                     ip_limit=RateLimit(100, burst=200),
+        >>>                                     store=SQLiteBucketStore('/tmp/buckets.db'))
+
+    '''
+
+    def __init__(self, default=None, limits=None, store=None, exempt_public=False,
+                 ip_limit=None):
+        self.default = default
+        self.limits = limits if limits is not None else {}
+        self.store = store if store is not None else MemoryBucketStore()
+        self.exempt_public = exempt_public
+        self.ip_limit = ip_limit
+
+    def get_limit(self, endpoint, view_func=None):
+        ''' Returns the `RateLimit` that applies to an endpoint '''
+
+        if getattr(view_func, 'rate_limit_exempt', False):
+            return None
+        limit = getattr(view_func, 'rate_limit', None)
+        if limit is None:
+            limit = self.limits.get(endpoint, None)
+        if limit is None:
+            if self.exempt_public and getattr(view_func, 'is_public', False):
+                return None
+            limit = self.default
+        return limit
+
+    def check(self, request, endpoint, view_func=None, now=None):
+        ''' Checks a request against its rate limit
+
+        Parameters:
+            request (Request):
+                The Flask request object
+            endpoint (str):
+                The name of the requested endpoint
+            view_func (function):
+                The view function of the endpoint
+            now (float):
+                The current time.  Defaults to time.time().
+
+        Returns:
+            A tuple of (boolean if the request is allowed, seconds to wait before retrying)
+        '''
+
+        limit = self.get_limit(endpoint, view_func=view_func)
+        if limit is None:
+            return True, 0.0
+
+        now = time.time() if now is None else now
+        key = '{0}|{1}'.format(limit.scope or endpoint, limit.identify(request))
+        return self.store.consume(key, limit.rate, limit.capacity, now, cost=limit.cost)
+
+    def check_ip(self, request, view_func=None, now=None):
+        ''' Checks a request against the ``ip_limit`` of its client address
+
+        See `check` for the parameters and the returned value.
+        '''
+
+        limit = self.ip_limit
+        if limit is None or getattr(view_func, 'rate_limit_exempt', False):
+            return True, 0.0
+
+        now = time.time() if now is None else now
+        key = '{0}|ip:{1}'.format(limit.scope or '__ip__', request.remote_addr)
+        return self.store.consume(key, limit.rate, limit.capacity, now, cost=limit.cost)
+
+
+def retry_after_header(seconds):
+    ''' Formats a wait time as a Retry-After header value '''
+    return str(max(1, int(math.ceil(seconds))))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+tokens.py
+
+Licensed under a 3-clause BSD license.
+
+A cache of verified API tokens.  A `TokenVerifier` is attached to
+`BrainBaseView.token_verifier` and is used by ``_checkAuth`` to verify the
+bearer token of each request.  The claims of verified tokens are cached
+until the token expires, so the signature check and any user lookup made
+by the verification function only run once per token.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+from brain.core.exceptions import BrainError
+from brain.utils.general.cache import TTLCache
+
+
+__all__ = ['TokenVerifier', 'get_bearer_token']
+
+
+def get_bearer_token(request):
+    ''' Returns the bearer token of the request Authorization header, or None '''
+
+    auth = request.headers.get('Authorization', '')
+    scheme, _, token = auth.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+class TokenVerifier(object):
+    ''' Verifies API tokens and caches their claims
+
+    Parameters:
+        verify (callable):
+            The function verifying a token.  It takes the raw token string and
+            returns its claims as a dict, or raises an exception if the token
+            is invalid.  E.g. ``flask_jwt_extended.decode_token``.
+        maxsize (int):
+            The maximum number of cached tokens.  Default is 10000.  Revocations
+            are kept separately and are never evicted before they expire.
+        ttl (float):
+            The maximum number of seconds a verified token is trusted before it
+            is verified again.  Tokens are never trusted past their ``exp`` claim.
+            Default is 300.
+        is_revoked (callable):
+            An optional function taking the claims and returning True if the
+            token has been revoked, e.g. by checking a blocklist.  It is called
+            on every request, including cache hits.
+        timer (callable):
+            The clock.  Default is time.time.
+
+    Example:
+        >>> BrainBaseView.token_verifier = TokenVerifier(decode_token, ttl=600)
+
+    '''
+
+    def __init__(self, verify, maxsize=10000, ttl=300, is_revoked=None, timer=time.time):
+        self.verify_func = verify
+        self.ttl = ttl
+        self.is_revoked = is_revoked
+        self.timer = timer
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        # revoked keys and their expiry, with a heap of the expiring ones to purge them;
+        # the counter orders equal expiries, as the str and tuple keys do not compare
+        self._revoked = {}
+        self._expiries = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        # never keep the raw tokens in memory longer than needed
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def verify(self, token):
+        ''' Verifies a token and returns its claims
+
+        Parameters:
+            token (str):
+                The raw token
+
+        Returns:
+            The dict of token claims
+
+        Raises:
+            BrainError: when the token is invalid, expired or revoked
+        '''
+
+        key = self._key(token)
+        claims = self._cache.get(key)
+        if claims is None:
+            try:
+                claims = self.verify_func(token)
+            except Exception as e:
+                raise BrainError('Invalid token: {0}'.format(e))
+            if claims is None:
+                raise BrainError('Invalid token')
+
+            expires = self.timer() + self.ttl if self.ttl is not None else None
+            exp = claims.get('exp', None) if isinstance(claims, dict) else None
+            if exp is not None:
+                if exp <= self.timer():
+                    raise BrainError('Token has expired')
+                expires = min(expires, exp) if expires is not None else exp
+            self._cache.set(key, claims, expires=expires)
+
+        if self._is_key_revoked(key) or self._is_jti_revoked(claims) or \
+                (self.is_revoked is not None and self.is_revoked(claims)):
+            self._cache.pop(key)
+            raise BrainError('Token has been revoked')
+        return claims
+
+    def _is_key_revoked(self, key):
+        with self._lock:
+            if key not in self._revoked:
+                return False
+            expires = self._revoked[key]
+            return expires is None or expires > self.timer()
+
+    def _is_jti_revoked(self, claims):
+        jti = claims.get('jti', None) if isinstance(claims, dict) else None
+        return jti is not None and self._is_key_revoked(('jti', jti))
+
+    def _add_revoked(self, key, expires):
+        ''' Records a revocation and forgets the ones that have expired '''
+
+        with self._lock:
+            now = self.timer()
+            while self._expiries and self._expiries[0][0] <= now:
+                expired, _, old = heapq.heappop(self._expiries)
+                if self._revoked.get(old, None) == expired:
+                    del self._revoked[old]
+
+            if key in self._revoked:
+                current = self._revoked[key]
+                expires = None if current is None or expires is None else max(current, expires)
+            self._revoked[key] = expires
+            if expires is not None:
+                heapq.heappush(self._expiries, (expires, next(self._counter), key))
+
+    def revoke(self, token=None, jti=None, expires=None):
+        ''' Revokes a token, by raw token or by its ``jti`` claim
+
+        Parameters:
+            token (str):
+                The raw token to revoke
+            jti (str):
+                The unique token id (``jti`` claim) to revoke
+            expires (float):
+                When the revocation can be forgotten, i.e. the token expiry.  If None
+                the revocation is kept for the lifetime of the verifier.
+        '''
+
+        if token is not None:
+            key = self._key(token)
+            self._cache.pop(key)
+            self._add_revoked(key, expires)
+        if jti is not None:
+            self._add_revoked(('jti', jti), expires)
+            for key in self._cache.keys():
+                claims = self._cache.get(key, count=False)
+                if isinstance(claims, dict) and claims.get('jti', None) == jti:
+                    self._cache.pop(key)
+
+    def clear(self):
+        ''' Removes all the cached tokens '''
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        ''' The cache statistics, including the hit rate '''
+        return self._cache.info()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+warmup.py
+
+Licensed under a 3-clause BSD license.
+
+A registry of the expensive initializers of a Brain application, e.g. the
+route map, the `~brain.db.modelGraph.ModelGraph` instances or the database
+connection pools.  The initializers run when the application is created,
+in parallel where their dependencies allow it, and the readiness route of
+`~brain.api.general.BrainGeneralRequestsView` only reports the worker as
+ready once all of them are done.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from brain.core.exceptions import BrainError
+
+
+__all__ = ['WarmupRegistry', 'warmup']
+
+
+class _WarmupTask(object):
+
+    def __init__(self, name, func, after, required):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.required = required
+        self.reset()
+
+    def reset(self):
+        self.state = 'pending'
+        self.duration = None
+        self.error = None
+
+    def status(self):
+        return {'state': self.state, 'duration': self.duration, 'error': self.error,
+                'required': self.required}
+
+
+class WarmupRegistry(object):
+    ''' A registry of application initializers run at startup
+
+    Parameters:
+        max_workers (int):
+            The number of initializers run in parallel.  Default is 4.
+
+    Example:
+        >>> from brain.core.warmup import warmup
+        >>>
+        >>> @warmup.register(name='modelgraph')
+        >>> def build_graph():
+        >>>     current_app.modelgraph = ModelGraph([datadb, sampledb])
+        >>>
+        >>> @warmup.register(after=['modelgraph'])
+        >>> def build_routemap():
+        >>>     ...
+        >>>
+        >>> app = create_app()
+        >>> warmup.init_app(app)
+
+    '''
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def register(self, func=None, name=None, after=(), required=True):
+        ''' Registers an initializer
+
+        Can be used as a function or as a decorator.
+
+        Parameters:
+            func (callable):
+                The initializer.  It is called without arguments, inside an app
+                context when the registry is run with an app.
+            name (str):
+                The name of the initializer.  Defaults to the function name.
+            after (list):
+                The names of the initializers that must complete first
+            required (bool):
+                If True, the application is not ready when the initializer fails.
+                Default is True.
+
+        Returns:
+            The initializer, unchanged
+        '''
+
+        if func is None:
+            return lambda func: self.register(func, name=name, after=after, required=required)
+
+        name = name or func.__name__
+        with self._lock:
+            if name in self._tasks:
+                raise BrainError('warmup task {0} is already registered'.format(name))
+            self._tasks[name] = _WarmupTask(name, func, after, required)
+            self._done.clear()
+        return func
+
+    def unregister(self, name):
+        ''' Removes an initializer '''
+        with self._lock:
+            self._tasks.pop(name, None)
+
+    def _waves(self):
+        ''' Orders the tasks into waves of tasks whose dependencies are all done '''
+
+        for task in self._tasks.values():
+            missing = [dep for dep in task.after if dep not in self._tasks]
+            if missing:
+                raise BrainError('warmup task {0} depends on unknown tasks {1}'.format(
+                    task.name, missing))
+
+        waves = []
+        done = set()
+        remaining = list(self._tasks.values())
+        while remaining:
+            wave = [task for task in remaining if all(dep in done for dep in task.after)]
+            if not wave:
+                raise BrainError('circular warmup dependencies between {0}'.format(
+                    [task.name for task in remaining]))
+            waves.append(wave)
+            done.update(task.name for task in wave)
+            remaining = [task for task in remaining if task.name not in done]
+        return waves
+
+    def _run_task(self, task, app):
+        failed = [dep for dep in task.after if self._tasks[dep].state != 'done']
+        if failed:
+            task.state = 'skipped'
+            task.error = 'dependencies {0} did not complete'.format(failed)
+            return
+
+        task.state = 'running'
+        start = time.time()
+        try:
+            if app is not None:
+                with app.app_context():
+                    task.func()
+            else:
+                task.func()
+        except Exception as e:
+            task.state = 'failed'
+            task.error = '{0}: {1}'.format(type(e).__name__, e)
+            task.traceback = traceback.format_exc()
+        else:
+            task.state = 'done'
+        task.duration = time.time() - start
+
+    def run(self, app=None, raise_errors=False):
+        ''' Runs all the initializers
+
+        Parameters:
+            app (Flask):
+                The Flask application.  The initializers run inside its app context.
+            raise_errors (bool):
+                If True, raises a BrainError when a required initializer failed.
+
+        Returns:
+            A dict of the status of each initializer
+
+        Raises:
+            BrainError: when the dependencies are unknown or circular.  The
+                initializers are then all marked as failed with the error.
+        '''
+
+        self._done.clear()
+        for task in self._tasks.values():
+            task.reset()
+
+        try:
+            waves = self._waves()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for wave in waves:
+                    list(executor.map(lambda task: self._run_task(task, app), wave))
+        except Exception as e:
+            for task in self._tasks.values():
+                if task.state == 'pending':
+                    task.state = 'failed'
+                    task.error = '{0}: {1}'.format(type(e).__name__, e)
+            raise
+        finally:
+            # always set, so wait() returns and ready reports the failure
+            self._done.set()
+
+        status = self.status()
+        failed = [name for name, task in self._tasks.items()
+                  if task.required and task.state != 'done']
+        if failed and raise_errors:
+            raise BrainError('warmup failed for {0}'.format(failed))
+        return status
+
+    def init_app(self, app, background=True, raise_errors=False):
+        ''' Runs the initializers for a Flask app and registers the registry on it
+
+        Parameters:
+            app (Flask):
+                The Flask application
+            background (bool):
+                If True, the initializers run in a background thread so the app
+                can start answering the readiness route right away.  Default is True.
+            raise_errors (bool):
+                If True and not in the background, raises a BrainError when a
+                required initializer failed.
+        '''
+
+        app.extensions['brain_warmup'] = self
+        if background:
+            self._thread = threading.Thread(target=self._run_background, args=(app,),
+                                            name='brain-warmup')
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self.run(app=app, raise_errors=raise_errors)
+
+    def _run_background(self, app):
+        ''' Runs the initializers, logging the errors that the status records '''
+
+        try:
+            self.run(app=app)
+        except Exception as e:
+            from brain import log
+            log.error('Brain warmup failed: {0}'.format(e))
+
+    def wait(self, timeout=None):
+        ''' Waits for the initializers to complete.  Returns True if they did. '''
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self):
+        ''' True when all the required initializers have completed '''
+
+        if not self._tasks:
+            return True
+        if not self._done.is_set():
+            return False
+        return all(task.state == 'done' for task in self._tasks.values() if task.required)
+
+    def status(self):
+        ''' Returns a dict of the status of each initializer '''
+        return {name: task.status() for name, task in self._tasks.items()}
+
+    def clear(self):
+        ''' Removes all the initializers '''
+        with self._lock:
+            self._tasks.clear()
+            self._done.clear()
+
+
+# the default, application-wide registry
+warmup = WarmupRegistry()
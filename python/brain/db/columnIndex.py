@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+columnIndex.py
+
+Licensed under a 3-clause BSD license.
+
+An index of the columns of the model classes of a
+`~brain.db.modelGraph.ModelGraph`, used to find the tables referenced by a
+filter string such as ``'ifu.nfiber == 127 and nsa.z > 0.1'``.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import re
+from brain.utils.general.cache import TTLCache
+
+
+__all__ = ['ColumnIndex']
+
+
+_strings = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_identifiers = re.compile(r'(?<![\w.])([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)(\s*\()?')
+
+KEYWORDS = frozenset(['and', 'or', 'not', 'in', 'is', 'null', 'none', 'true', 'false',
+                      'between', 'like', 'ilike', 'asc', 'desc', 'inf', 'nan'])
+
+
+class ColumnIndex(object):
+    """An index from column names to the tables that contain them.
+
+    Each column is indexed by its full name, ``schema.table.column``, by
+    ``table.column``, by ``alias.column`` for each alias of its table, and
+    by its bare name. Names are case-insensitive.
+
+    Parameters:
+        models (list):
+            The model classes to index
+        aliases (dict):
+            Short names of tables, e.g. ``{'ifu': 'mangadatadb.ifudesign'}``
+        cache_size (int):
+            The number of parsed filter strings kept in an LRU cache.
+            Default is 1024.
+
+    Example:
+        >>> index = ColumnIndex(models, aliases={'ifu': 'mangadatadb.ifudesign'})
+        >>> index.parseFilter('ifu.nfiber == 127 and nsa.z > 0.1')
+        ['mangadatadb.ifudesign', 'mangasampledb.nsa']
+
+    """
+
+    def __init__(self, models, aliases=None, cache_size=1024):
+        self.names = {}
+        self.aliases = {}
+        self._tableColumns = {}
+        self._parsed = TTLCache(maxsize=cache_size)
+
+        for model in models:
+            self._addModel(model)
+        self.addAliases(aliases or {})
+
+    def __repr__(self):
+        return 'ColumnIndex(tables={0}, names={1})'.format(len(self._tableColumns),
+                                                           len(self.names))
+
+    def _add(self, name, table):
+        tables = self.names.setdefault(name.lower(), [])
+        if table not in tables:
+            tables.append(table)
+
+    def _addModel(self, model):
+        table = model.__table__
+        path = '{0}.{1}'.format(table.schema, table.name)
+
+        columns = [column.name for column in table.columns]
+        mapper = getattr(model, '__mapper__', None)
+        if mapper is not None:
+            columns.extend(attr.key for attr in mapper.column_attrs if attr.key not in columns)
+
+        self._tableColumns[path] = columns
+        for column in columns:
+            self._add('{0}.{1}'.format(path, column), path)
+            self._add('{0}.{1}'.format(table.name, column), path)
+            self._add(column, path)
+
+    def addModels(self, models):
+        """Adds the columns of more model classes to the index."""
+
+        for model in models:
+            self._addModel(model)
+        self._parsed.clear()
+
+    def addAliases(self, aliases):
+        """Adds short names of tables, as a dict of alias to ``schema.table``."""
+
+        for alias, path in aliases.items():
+            if path not in self._tableColumns:
+                raise ValueError('table {0} of alias {1} is not indexed.'.format(path, alias))
+            self.aliases[alias.lower()] = path
+            for column in self._tableColumns[path]:
+                self._add('{0}.{1}'.format(alias, column), path)
+        self._parsed.clear()
+
+    def lookup(self, name):
+        """Returns the list of the tables that contain a column name."""
+        return list(self.names.get(name.lower(), []))
+
+    def parseFilter(self, filterString, strict=True):
+        """Returns the tables referenced by a filter string.
+
+        The identifiers of the filter, outside quoted strings, SQL keywords
+        and function names, are looked up in the index. An identifier found
+        in several tables, e.g. ``pk``, is resolved to the one table among
+        them that is also referenced by another identifier, otherwise it is
+        an error. The results are cached.
+
+        Parameters:
+            filterString (str):
+                The filter, e.g. ``'ifu.nfiber == 127 and nsa.z > 0.1'``
+            strict (bool):
+                If True (the default), identifiers that are not columns raise a
+                ValueError. Otherwise they are ignored.
+
+        Returns:
+            The list of ``schema.table`` paths, in order of first reference
+        """
+
+        key = (filterString, strict)
+        tables = self._parsed.get(key)
+        if tables is None:
+            tables = tuple(self._parse(filterString, strict))
+            self._parsed.set(key, tables)
+
+        return list(tables)
+
+    def _parse(self, filterString, strict):
+
+        tables = []
+        ambiguous = []
+        for match in _identifiers.finditer(_strings.sub(' ', filterString)):
+            name, call = match.groups()
+            if call or name.lower() in KEYWORDS:
+                continue
+
+            candidates = self.names.get(name.lower(), [])
+            if len(candidates) == 1:
+                if candidates[0] not in tables:
+                    tables.append(candidates[0])
+            elif candidates:
+                ambiguous.append((name, candidates))
+            elif strict:
+                raise ValueError('{0} is not a column of any table.'.format(name))
+
+        for name, candidates in ambiguous:
+            referenced = [table for table in candidates if table in tables]
+            if len(referenced) != 1:
+                raise ValueError('column {0} is ambiguous, it could be any of {1}.'.format(
+                    name, ', '.join(candidates)))
+
+        return tables
+
+    def cacheInfo(self):
+        """Returns the statistics of the parsed filter cache."""
+        return self._parsed.info()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+csrGraph.py
+
+Licensed under a 3-clause BSD license.
+
+A compact, read-only graph stored as compressed sparse row (CSR) arrays,
+used as the ``'csr'`` backend of `~brain.db.modelGraph.ModelGraph`.
+
+Nodes are integer ids, with an index between table names and ids, and the
+adjacency is two integer arrays: ``indices[indptr[ii]:indptr[ii + 1]]`` are
+the neighbours of node ``ii``. The searches over the whole graph, e.g. the
+shortest path trees, expand a whole frontier at once with numpy, and the
+path between two nodes is found with a bidirectional search. The class
+offers the subset of the `networkx.Graph` API used by ModelGraph
+(``nodes``, ``edges``, ``adj``, ``has_edge``, ``in``) so the rest of
+ModelGraph works unchanged.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import heapq
+import numpy as np
+import networkx as nx
+
+
+__all__ = ['CSRGraph']
+
+
+class _NodeView(object):
+    """A read-only view of the nodes, like `networkx.Graph.nodes`."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        if data:
+            return list(zip(self._graph.names, self._graph.nodeData))
+        return self
+
+    def __iter__(self):
+        return iter(self._graph.names)
+
+    def __len__(self):
+        return len(self._graph.names)
+
+    def __contains__(self, name):
+        return name in self._graph.index
+
+    def __getitem__(self, name):
+        return self._graph.nodeData[self._graph.index[name]]
+
+    def __repr__(self):
+        return 'NodeView({0})'.format(tuple(self._graph.names))
+
+
+class _EdgeView(object):
+    """A read-only view of the edges, like `networkx.Graph.edges`."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        names = self._graph.names
+        edges = zip(self._graph.edgeSource.tolist(), self._graph.edgeTarget.tolist())
+        if data:
+            return [(names[uu], names[vv], dd)
+                    for (uu, vv), dd in zip(edges, self._graph.edgeData)]
+        return [(names[uu], names[vv]) for uu, vv in edges]
+
+    def __iter__(self):
+        return iter(self())
+
+    def __len__(self):
+        return len(self._graph.edgeData)
+
+    def __contains__(self, edge):
+        return self._graph.has_edge(*edge)
+
+    def __getitem__(self, edge):
+        edgeId = self._graph._edgeId(*edge)
+        if edgeId is None:
+            raise KeyError('edge {0}-{1} not in graph'.format(*edge))
+        return self._graph.edgeData[edgeId]
+
+
+class CSRGraph(object):
+    """An undirected graph stored in CSR arrays.
+
+    Use `CSRGraph.fromNetworkx` or `CSRGraph.fromEdges` to create it.
+
+    Parameters:
+        names (list):
+            The name of each node, in id order
+        nodeData (list):
+            The attribute dict of each node
+        edges (list):
+            The ``(nameA, nameB, data)`` tuples of the edges
+
+    """
+
+    def __init__(self, names, nodeData, edges):
+
+        self.names = list(names)
+        self.nodeData = list(nodeData)
+        self.index = {name: ii for ii, name in enumerate(self.names)}
+
+        nNodes = len(self.names)
+        self.edgeSource = np.array([self.index[uu] for uu, vv, dd in edges], dtype=np.int32)
+        self.edgeTarget = np.array([self.index[vv] for uu, vv, dd in edges], dtype=np.int32)
+        self.edgeData = [dict(dd) for uu, vv, dd in edges]
+
+        # Each undirected edge is stored in both directions, sorted by source
+        # node and, for each node, in the order the edges were added.
+        nEdges = len(self.edgeData)
+        sources = np.concatenate([self.edgeSource, self.edgeTarget])
+        targets = np.concatenate([self.edgeTarget, self.edgeSource])
+        edgeIds = np.concatenate([np.arange(nEdges, dtype=np.int32)] * 2)
+        order = np.lexsort((edgeIds, sources))
+
+        self.indices = targets[order]
+        self.edgeIds = edgeIds[order]
+        self.indptr = np.zeros(nNodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=nNodes), out=self.indptr[1:])
+
+        self.weights = None
+        self.refreshWeights()
+
+    @classmethod
+    def fromNetworkx(cls, graph):
+        """Creates a CSRGraph from a `networkx.Graph`."""
+
+        names = list(graph.nodes())
+        return cls(names, [graph.nodes[name] for name in names], list(graph.edges(data=True)))
+
+    @classmethod
+    def fromEdges(cls, nodes, edges):
+        """Creates a CSRGraph from ``(name, data)`` nodes and ``(nameA, nameB, data)`` edges."""
+
+        return cls([name for name, data in nodes], [data for name, data in nodes], edges)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return 'CSRGraph(nodes={0}, edges={1})'.format(len(self.names), len(self.edgeData))
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def edges(self):
+        return _EdgeView(self)
+
+    @property
+    def adj(self):
+        """The neighbours of each node, by name."""
+        return {name: self.neighbours(name) for name in self.names}
+
+    def neighbours(self, name):
+        """Returns the names of the neighbours of a node."""
+        ii = self.index[name]
+        neighbours = self.indices[self.indptr[ii]:self.indptr[ii + 1]]
+        return [self.names[jj] for jj in neighbours.tolist()]
+
+    def _edgeId(self, nameA, nameB):
+        ii = self.index.get(nameA, None)
+        jj = self.index.get(nameB, None)
+        if ii is None or jj is None:
+            return None
+        start, end = self.indptr[ii], self.indptr[ii + 1]
+        found = np.flatnonzero(self.indices[start:end] == jj)
+        return int(self.edgeIds[start + found[0]]) if found.size else None
+
+    def has_edge(self, nameA, nameB):
+        return self._edgeId(nameA, nameB) is not None
+
+    def refreshWeights(self, attribute='weight'):
+        """Reads the weight array from the edge attributes. Missing weights are one."""
+
+        if any(attribute in data for data in self.edgeData):
+            weights = np.array([data.get(attribute, 1.0) for data in self.edgeData],
+                               dtype=np.float64)
+            self.weights = weights[self.edgeIds]
+        else:
+            self.weights = None
+
+    def _expand(self, frontier):
+        """Returns the origin ids and the indices positions of all the edges out of frontier."""
+
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + offsets
+        return np.repeat(frontier, counts), positions
+
+    def _bfs(self, sources, targets=None):
+        """Vectorized BFS from sources. Returns the parent array, -1 for unreached.
+
+        Sources are their own parents. If targets is a boolean array, stops
+        after the first level that reaches a target.
+
+        """
+
+        parents = np.full(len(self.names), -1, dtype=np.int64)
+        frontier = np.asarray(sources, dtype=np.int64)
+        parents[frontier] = frontier
+
+        while frontier.size:
+            if targets is not None and targets[frontier].any():
+                break
+            origins, positions = self._expand(frontier)
+            neighbours = self.indices[positions]
+            new = parents[neighbours] == -1
+            neighbours, origins = neighbours[new], origins[new]
+            # The first edge found to each node is its parent
+            frontier, first = np.unique(neighbours, return_index=True)
+            parents[frontier] = origins[first]
+
+        return parents
+
+    def _dijkstra(self, sources):
+        """Dijkstra from sources with the edge weights. Returns the distance and parent arrays."""
+
+        distances = np.full(len(self.names), np.inf)
+        parents = np.full(len(self.names), -1, dtype=np.int64)
+        heap = []
+        for source in sources:
+            distances[source] = 0.0
+            parents[source] = source
+            heap.append((0.0, source))
+        heapq.heapify(heap)
+        done = np.zeros(len(self.names), dtype=bool)
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if done[node]:
+                continue
+            done[node] = True
+            for position in range(indptr[node], indptr[node + 1]):
+                neighbour = int(indices[position])
+                newDistance = distance + weights[position]
+                if newDistance < distances[neighbour]:
+                    distances[neighbour] = newDistance
+                    parents[neighbour] = node
+                    heapq.heappush(heap, (newDistance, neighbour))
+
+        return distances, parents
+
+    def _search(self, sources, targets=None, weight=None):
+        if weight and self.weights is not None:
+            return self._dijkstra(sources)
+        parents = self._bfs(sources, targets)
+        return None, parents
+
+    def _path(self, parents, node):
+        path = [node]
+        while parents[path[-1]] != path[-1]:
+            path.append(int(parents[path[-1]]))
+        return [self.names[ii] for ii in reversed(path)]
+
+    def pathTree(self, source, weight=None):
+        """Returns the dict of the parent of each node in the shortest path tree of source."""
+
+        distances, parents = self._search([self.index[source]], weight=weight)
+        reached = np.flatnonzero(parents >= 0)
+        names = self.names
+        return {names[ii]: (names[parents[ii]] if parents[ii] != ii else None)
+                for ii in reached.tolist()}
+
+    def shortestPath(self, source, target, weight=None):
+        """Returns the shortest path between two nodes, as a list of names."""
+
+        if weight and self.weights is not None:
+            distances, parents = self._dijkstra([self.index[source]])
+            if parents[self.index[target]] < 0:
+                raise nx.NetworkXNoPath('no path between {0} and {1}'.format(source, target))
+            return self._path(parents, self.index[target])
+
+        path = self._bidirectionalPath(self.index[source], self.index[target])
+        if path is None:
+            raise nx.NetworkXNoPath('no path between {0} and {1}'.format(source, target))
+        return [self.names[ii] for ii in path]
+
+    def _bidirectionalPath(self, source, target):
+        """Bidirectional BFS between two node ids. Returns the list of ids or None.
+
+        The frontiers of a single pair search stay small, so they are
+        expanded one node at a time rather than with array operations.
+
+        """
+
+        if source == target:
+            return [source]
+
+        indptr = memoryview(self.indptr)
+        indices = memoryview(self.indices)
+        forward = {source: (None, 0)}
+        backward = {target: (None, 0)}
+        frontiers = {id(forward): [source], id(backward): [target]}
+
+        while frontiers[id(forward)] and frontiers[id(backward)]:
+            # Expands a whole level of the smallest frontier
+            if len(frontiers[id(forward)]) <= len(frontiers[id(backward)]):
+                mine, other = forward, backward
+            else:
+                mine, other = backward, forward
+
+            nextFrontier = []
+            best = None
+            for node in frontiers[id(mine)]:
+                depth = mine[node][1] + 1
+                for position in range(indptr[node], indptr[node + 1]):
+                    neighbour = indices[position]
+                    if neighbour in mine:
+                        continue
+                    mine[neighbour] = (node, depth)
+                    nextFrontier.append(neighbour)
+                    if neighbour in other:
+                        total = depth + other[neighbour][1]
+                        if best is None or total < best[0]:
+                            best = (total, neighbour)
+            frontiers[id(mine)] = nextFrontier
+
+            if best is not None:
+                meet = best[1]
+                path = []
+                node = meet
+                while node is not None:
+                    path.append(node)
+                    node = forward[node][0]
+                path.reverse()
+                node = backward[meet][0]
+                while node is not None:
+                    path.append(node)
+                    node = backward[node][0]
+                return path
+
+        return None
+
+    def nearest(self, sources, targets, weight=None):
+        """Finds the target closest to any of the sources, and the path to it.
+
+        Ties are broken by the order of targets. Returns ``(None, None)``
+        if no target can be reached.
+
+        """
+
+        targetIds = np.array([self.index[table] for table in targets], dtype=np.int64)
+        isTarget = np.zeros(len(self.names), dtype=bool)
+        isTarget[targetIds] = True
+        distances, parents = self._search([self.index[table] for table in sources],
+                                          isTarget, weight=weight)
+
+        reached = parents[targetIds] >= 0
+        if not reached.any():
+            return None, None
+        if distances is not None:
+            best = np.flatnonzero(reached)[np.argmin(distances[targetIds[reached]])]
+        else:
+            # The BFS stopped at the first level reaching a target, so all the
+            # reached targets are at the same distance.
+            best = np.flatnonzero(reached)[0]
+        return targets[best], self._path(parents, int(targetIds[best]))
+
+    def connectedComponents(self):
+        """Returns the list of the sets of node names of each connected component."""
+
+        components = []
+        label = np.full(len(self.names), -1, dtype=np.int64)
+        for start in range(len(self.names)):
+            if label[start] >= 0:
+                continue
+            members = np.flatnonzero(self._bfs([start]) >= 0)
+            label[members] = len(components)
+            components.append(set(self.names[ii] for ii in members.tolist()))
+        return components
@@ -16,10 +16,21 @@ Revision history:
 
 from __future__ import division
 from __future__ import print_function
+from sqlalchemy import and_, select
+from sqlalchemy.dialects import registry
 from sqlalchemy.ext.declarative import DeclarativeMeta
+import importlib
 import itertools
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import networkx as nx
+from brain.utils.general.cache import TTLCache
+from brain.db.tableStats import TableStatistics
+from brain.db.csrGraph import CSRGraph
+from brain.db.columnIndex import ColumnIndex
 
 
 def isModel(model):
@@ -53,6 +64,50 @@ def getModels(module):
     return models
 
 
+JoinStep = namedtuple('JoinStep', ['left', 'right', 'columns'])
+JoinStep.__doc__ = """A step of a join plan: joins the right table to the left table.
+
+``columns`` is a tuple of ``(leftColumn, rightColumn)`` pairs, the columns
+of the foreign key relating both tables, so the ON clause of the join is
+``left.leftColumn = right.rightColumn`` for each pair.
+
+"""
+
+
+def getSchemaFingerprint(modelSchemas):
+    """Returns a fingerprint of the schema modules.
+
+    The fingerprint is a list with the name, file, modification time and size
+    of each module. It changes when the file of any of the modules changes.
+
+    """
+
+    fingerprint = []
+    for schema in np.atleast_1d(modelSchemas):
+        path = getattr(schema, '__file__', None)
+        if path and path.endswith('.pyc'):
+            path = path[:-1]
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        fingerprint.append([schema.__name__, path,
+                            stat.st_mtime if stat else None,
+                            stat.st_size if stat else None])
+
+    return fingerprint
+
+
+def _importObject(module, qualname):
+    """Imports an object, e.g. a model class, from its module and name."""
+
+    obj = importlib.import_module(module)
+    for attr in qualname.split('.'):
+        obj = getattr(obj, attr)
+
+    return obj
+
+
 class ModelGraph(object):
     """Creates a `networkx` graph between the model classes.
 
@@ -77,6 +132,25 @@ class ModelGraph(object):
             A module or list of modules containing model classes.
             Each model class will be considered a node in the graph, and their
             relationships will define the edges between nodes.
+        precompute (bool):
+            If True, the breadth-first search tree of each node and the
+            connected components of the graph are computed when the graph is
+            built, so shortest paths are looked up instead of searched for,
+            and tables that cannot be joined are rejected immediately.
+        cache_size (int):
+            The number of join plans returned by `getJoins` that are kept in
+            an LRU cache. Set to 0 to disable the cache. Default is 256.
+        statistics (`~brain.db.tableStats.TableStatistics`):
+            Optional table statistics. If set, the edges are weighted by the
+            cost of the joins and the planner chooses the cheapest paths
+            instead of the ones with fewest tables. See `setStatistics`.
+        backend (str):
+            The graph storage. If ``'networkx'`` (the default), ``graph`` is a
+            `networkx.Graph`. If ``'csr'``, the graph is converted, once built,
+            to a compact `~brain.db.csrGraph.CSRGraph` with integer node ids
+            and array adjacency, searched with vectorized BFS. It uses less
+            memory and plans faster on large graphs, and offers the same
+            `nodes`, `edges` and `getJoins` API.
 
     Example:
       >>> graph = ModelGraph([datadb, sampledb])
@@ -85,14 +159,10 @@ class ModelGraph(object):
 
     """
 
-    def __init__(self, modelSchemas):
-
-        self.schemas = np.atleast_1d(modelSchemas)
-        self.models = {}
+    def __init__(self, modelSchemas, precompute=False, cache_size=256, statistics=None,
+                 backend='networkx'):
 
-        # Initialites a graph in which the tables (schema.tablename) will be
-        # the nodes.
-        self.graph = nx.Graph()
+        self._setup(modelSchemas, cache_size, backend)
 
         # Creates the nodes
         for schema in self.schemas:
@@ -102,6 +172,438 @@ class ModelGraph(object):
         for schema in self.schemas:
             self._createEdges(schema)
 
+        if statistics is not None:
+            self._applyStatistics(statistics)
+
+        if backend == 'csr':
+            self.graph = CSRGraph.fromNetworkx(self.graph)
+
+        if precompute:
+            self.precomputePaths()
+
+    def _setup(self, modelSchemas, cache_size, backend='networkx'):
+        """Initialises the attributes of an empty graph."""
+
+        assert backend in ['networkx', 'csr'], \
+            'backend must be either \'networkx\' or \'csr\'.'
+
+        self.backend = backend
+        self.schemas = np.atleast_1d(modelSchemas)
+        self.models = {}
+        self.fingerprint = getSchemaFingerprint(self.schemas)
+        self._trees = None
+        self._components = None
+        self.statistics = None
+        self.aliases = {}
+        self._columnIndex = None
+        self._plans = TTLCache(maxsize=cache_size) if cache_size else None
+        self._selects = TTLCache(maxsize=cache_size) if cache_size else None
+
+        # Initialites a graph in which the tables (schema.tablename) will be
+        # the nodes.
+        self.graph = nx.Graph()
+
+    def save(self, path):
+        """Saves a snapshot of the graph to a JSON file.
+
+        The snapshot contains the nodes, the edges and their foreign keys,
+        the import path of each model, the precomputed paths, if any, and the
+        fingerprint of the schema modules. It can be loaded with
+        `ModelGraph.load` much faster than the graph can be built from the
+        schema modules. Graphs loaded from the same snapshot always return
+        the same joins, but without precomputed paths they may choose a
+        different path than the original graph when several paths have the
+        same length.
+
+        """
+
+        nodes = []
+        for schemaName, models in self.models.items():
+            for model in models:
+                nodes.append([self.getTablePath(model), schemaName,
+                              model.__module__, model.__qualname__])
+
+        snapshot = {'version': 2,
+                    'fingerprint': self.fingerprint,
+                    'nodes': nodes,
+                    'edges': [[tableA, tableB, data.get('foreign_keys', [])]
+                              for tableA, tableB, data in self.graph.edges(data=True)],
+                    'components': self._components,
+                    'trees': self._trees,
+                    'statistics': self.statistics.toDict() if self.statistics else None}
+
+        tmpPath = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmpPath, 'w') as ff:
+            json.dump(snapshot, ff)
+        os.replace(tmpPath, path)
+
+    @classmethod
+    def load(cls, path, modelSchemas=None, precompute=False, cache_size=256,
+             rebuild=True, backend='networkx'):
+        """Loads a graph from a snapshot created with `save`.
+
+        Parameters
+        ----------
+        path : string
+            The path of the snapshot file.
+        modelSchemas : module or list of modules or None
+            The schema modules of the graph. If None, the modules are imported
+            by the names stored in the snapshot.
+        precompute, cache_size, backend :
+            As in `ModelGraph`. Used when the graph is rebuilt, or when the
+            snapshot does not contain precomputed paths.
+        rebuild : bool
+            If True, and the snapshot is missing or was created from different
+            versions of the schema modules, the graph is built from the modules
+            and the snapshot is saved again. Otherwise, a ValueError is raised.
+
+        Returns
+        -------
+        graph : `ModelGraph`
+            The loaded graph.
+
+        """
+
+        snapshot = None
+        if os.path.exists(path):
+            with open(path, 'r') as ff:
+                snapshot = json.load(ff)
+
+        if modelSchemas is None:
+            if snapshot is None:
+                raise ValueError('cannot find the ModelGraph snapshot {0}.'.format(path))
+            modelSchemas = [importlib.import_module(name)
+                            for name, __, __, __ in snapshot['fingerprint']]
+
+        schemas = np.atleast_1d(modelSchemas)
+        statistics = None
+        if snapshot is not None and snapshot.get('statistics'):
+            statistics = TableStatistics.fromDict(snapshot['statistics'])
+
+        if snapshot is None or snapshot.get('version') != 2 or \
+                snapshot['fingerprint'] != getSchemaFingerprint(schemas):
+            if not rebuild:
+                raise ValueError('the ModelGraph snapshot {0} is out of date.'.format(path))
+            graph = cls(schemas, precompute=precompute, cache_size=cache_size,
+                        statistics=statistics, backend=backend)
+            graph.save(path)
+            return graph
+
+        graph = cls.__new__(cls)
+        graph._setup(schemas, cache_size, backend)
+        for schema in schemas:
+            graph.models[schema.__name__] = []
+
+        for table, schemaName, module, qualname in snapshot['nodes']:
+            model = _importObject(module, qualname)
+            graph.models[schemaName].append(model)
+            graph.graph.add_node(table, model=model)
+
+        for tableA, tableB, foreignKeys in snapshot['edges']:
+            foreignKeys = [(table, tuple(columns), refTable, tuple(refColumns))
+                           for table, columns, refTable, refColumns in foreignKeys]
+            graph.graph.add_edge(tableA, tableB, foreign_keys=foreignKeys)
+
+        if statistics is not None:
+            graph._applyStatistics(statistics)
+
+        if backend == 'csr':
+            graph.graph = CSRGraph.fromNetworkx(graph.graph)
+
+        if snapshot['trees'] is not None:
+            graph._components = snapshot['components']
+            graph._trees = snapshot['trees']
+        elif precompute:
+            graph.precomputePaths()
+
+        return graph
+
+    def precomputePaths(self):
+        """Computes the BFS tree of each node and the connected components."""
+
+        self._components = self._getComponents()
+        self._trees = {table: self._bfsTree(table) for table in self.graph.nodes()}
+        self.clearCache()
+
+    def _getComponents(self):
+        """Returns a dict of the connected component number of each node."""
+
+        if self.backend == 'csr':
+            components = self.graph.connectedComponents()
+        else:
+            components = nx.connected_components(self.graph)
+
+        componentMap = {}
+        for ii, component in enumerate(components):
+            for table in component:
+                componentMap[table] = ii
+
+        return componentMap
+
+    def setStatistics(self, statistics):
+        """Sets the table statistics used to weight the edges.
+
+        The join plan cache is emptied and the precomputed paths, if any, are
+        computed again with the new weights. Set to None to go back to paths
+        with the fewest tables.
+
+        """
+
+        self._applyStatistics(statistics)
+        if self._trees is not None:
+            self.precomputePaths()
+        else:
+            self.clearCache()
+
+    def collectStatistics(self, bind, exact=True, **kwargs):
+        """Collects the statistics of the tables from a database and sets them.
+
+        See `~brain.db.tableStats.TableStatistics.collect` for the parameters.
+        Returns the statistics.
+
+        """
+
+        statistics = TableStatistics.collect(bind, list(self.graph.nodes()), exact=exact, **kwargs)
+        self.setStatistics(statistics)
+        return statistics
+
+    def _applyStatistics(self, statistics):
+        """Sets the weight of each edge from the statistics."""
+
+        self.statistics = statistics
+        for tableA, tableB, data in self.graph.edges(data=True):
+            if statistics is None:
+                data.pop('weight', None)
+            else:
+                data['weight'] = statistics.edgeCost(tableA, tableB,
+                                                     data.get('foreign_keys', []))
+
+        if isinstance(self.graph, CSRGraph):
+            self.graph.refreshWeights()
+
+    @property
+    def _weight(self):
+        """The edge attribute used as weight by the path searches, or None."""
+        return 'weight' if self.statistics is not None else None
+
+    def _bfsTree(self, source):
+        """Returns the dict of the BFS parent of each node reachable from source.
+
+        With statistics, the tree is the tree of cheapest paths from source.
+
+        """
+
+        if self.backend == 'csr':
+            return self.graph.pathTree(source, weight=self._weight)
+
+        if self._weight:
+            paths = nx.single_source_dijkstra_path(self.graph, source, weight=self._weight)
+            return {table: path[-2] if len(path) > 1 else None for table, path in paths.items()}
+
+        adjacency = self.graph.adj
+        parents = {source: None}
+        layer = [source]
+        while layer:
+            nextLayer = []
+            for table in layer:
+                for neighbour in adjacency[table]:
+                    if neighbour not in parents:
+                        parents[neighbour] = table
+                        nextLayer.append(neighbour)
+            layer = nextLayer
+        return parents
+
+    def cacheInfo(self, cache='plans'):
+        """Returns the hits, misses and size of the join plan cache.
+
+        Use ``cache='selects'`` for the cache of the SQLAlchemy constructs of
+        `getSelect` and `getCompiledSelect`.
+
+        """
+
+        cache = self._plans if cache == 'plans' else self._selects
+        if cache is None:
+            return {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0,
+                    'maxsize': 0, 'hit_rate': 0.0}
+        return cache.info()
+
+    def clearCache(self):
+        """Empties the join plan and SQLAlchemy construct caches."""
+
+        if self._plans is not None:
+            self._plans.clear()
+        if self._selects is not None:
+            self._selects.clear()
+
+    @property
+    def columnIndex(self):
+        """The `~brain.db.columnIndex.ColumnIndex` of the model columns, built on first use."""
+
+        if self._columnIndex is None:
+            models = [model for schemaModels in self.models.values() for model in schemaModels]
+            self._columnIndex = ColumnIndex(models, aliases=self.aliases)
+        return self._columnIndex
+
+    def addAliases(self, aliases):
+        """Adds short names of tables for filter strings.
+
+        E.g. ``graph.addAliases({'ifu': 'mangadatadb.ifudesign'})`` to use
+        ``'ifu.nfiber > 1'``.
+
+        """
+
+        if self._columnIndex is not None:
+            self._columnIndex.addAliases(aliases)
+        self.aliases.update(aliases)
+
+    def parseFilter(self, filterString, strict=True):
+        """Returns the tables referenced by a filter string.
+
+        See `~brain.db.columnIndex.ColumnIndex.parseFilter`.
+
+        """
+
+        return self.columnIndex.parseFilter(filterString, strict=strict)
+
+    def getJoinsFromFilter(self, filterString, format_out='tables', nexus=None,
+                           strategy='pairwise', strict=True, return_cost=False):
+        """Returns the joins needed by a filter string.
+
+        Finds the tables referenced by the filter, e.g.
+        ``'ifu.nfiber == 127 and nsa.z > 0.1'``, with `parseFilter` and
+        returns their joins with `getJoins`. Both steps are cached.
+
+        """
+
+        tables = self.parseFilter(filterString, strict=strict)
+        if not tables:
+            raise ValueError('the filter {0!r} does not reference any table.'.format(filterString))
+
+        return self.getJoins(tables, format_out=format_out, nexus=nexus, strategy=strategy,
+                             return_cost=return_cost)
+
+    def _cached(self, key, build):
+        """Returns the value of key in the construct cache, or builds and caches it."""
+
+        if self._selects is None:
+            return build()
+
+        try:
+            hash(key)
+        except TypeError:
+            raise ValueError('cannot cache the SQLAlchemy construct of {0}: the models and '
+                             'columns must be hashable, e.g. model attributes or Column '
+                             'objects.'.format(key[1:]))
+
+        value = self._selects.get(key)
+        if value is None:
+            value = build()
+            self._selects.set(key, value)
+        return value
+
+    def _getTable(self, table):
+        """Returns the SQLAlchemy Table of a table path."""
+        return self.graph.nodes[table]['model'].__table__
+
+    def getJoinClause(self, models, nexus=None, strategy='pairwise'):
+        """Returns the SQLAlchemy join of the tables needed to query models.
+
+        The join is built from the plan returned by
+        ``getJoins(format_out='plan')``, with explicit ON clauses on the
+        foreign key columns, so SQLAlchemy does not need to infer them. The
+        join is cached for each plan.
+
+        """
+
+        plan = self.getJoins(models, format_out='plan', nexus=nexus, strategy=strategy)
+        if plan:
+            start = plan[0].left
+        else:
+            start = self._asList(models)[0]
+            start = self.getTablePath(start) if isModel(start) else start
+
+        def build():
+            fromClause = self._getTable(start)
+            for step in plan:
+                left = self._getTable(step.left)
+                right = self._getTable(step.right)
+                onclause = and_(*[left.c[leftColumn] == right.c[rightColumn]
+                                  for leftColumn, rightColumn in step.columns])
+                fromClause = fromClause.join(right, onclause)
+            return fromClause
+
+        return self._cached(('join', start, tuple(plan)), build)
+
+    def getSelect(self, models, columns=None, nexus=None, strategy='pairwise'):
+        """Returns a SQLAlchemy select from the join of the tables needed to query models.
+
+        Parameters
+        ----------
+        models : list of model classes or tablenames
+            The models to query, as in `getJoins`.
+        columns : list or None
+            The columns to select. If None, all the columns of ``models``.
+        nexus, strategy :
+            As in `getJoins`.
+
+        Returns
+        -------
+        select : `sqlalchemy.sql.Select`
+            The select, cached for each set of inputs. Selects are immutable,
+            so it can be refined with e.g. ``.where()`` without changing the
+            cached one.
+
+        """
+
+        models = self._asList(models)
+        columns = tuple(columns) if columns is not None else None
+        key = ('select', tuple(models), columns, nexus, strategy)
+
+        def build():
+            selected = columns
+            if selected is None:
+                selected = [self._getTable(self.getTablePath(model) if isModel(model) else model)
+                            for model in models]
+            joins = self.getJoinClause(models, nexus=nexus, strategy=strategy)
+            return select(*selected).select_from(joins)
+
+        return self._cached(key, build)
+
+    def getCompiledSelect(self, models, dialect, columns=None, nexus=None, strategy='pairwise'):
+        """Returns the select of `getSelect` compiled for a dialect.
+
+        Parameters
+        ----------
+        models, columns, nexus, strategy :
+            As in `getSelect`.
+        dialect : string, Dialect or Engine
+            The dialect to compile for, e.g. ``'postgresql'``,
+            ``'postgresql+asyncpg'`` or an engine.
+
+        Returns
+        -------
+        compiled : `sqlalchemy.engine.Compiled`
+            The compiled select, cached for each set of inputs and dialect.
+            ``str(compiled)`` is the SQL statement. Dialects with different
+            drivers, and so different parameter styles, get different
+            compiled selects.
+
+        """
+
+        if isinstance(dialect, str):
+            name = dialect
+            dialect = self._cached(('dialect', name),
+                                   lambda: registry.load(name.replace('+', '.'))())
+        dialect = getattr(dialect, 'dialect', dialect)
+
+        models = self._asList(models)
+        columns = tuple(columns) if columns is not None else None
+        key = ('compiled', tuple(models), columns, nexus, strategy, type(dialect),
+               dialect.paramstyle, getattr(dialect, 'server_version_info', None))
+
+        return self._cached(key, lambda: self.getSelect(
+            models, columns=columns, nexus=nexus, strategy=strategy).compile(dialect=dialect))
+
     @property
     def nodes(self):
         """Shortcut to self.graph.nodes()."""
@@ -132,29 +634,200 @@ class ModelGraph(object):
         for model in self.models[schema.__name__]:
             self.graph.add_node(self.getTablePath(model), model=model)
 
-    def _createEdges(self, schema):
-        """Creates the edges between nodes in the table graph."""
+    def _createEdges(self, schema, referred=None):
+        """Creates the edges between nodes in the table graph.
+
+        If ``referred`` is a set of table paths, only the edges of the foreign
+        keys that refer to those tables are created.
+
+        """
 
         # We loop over each model, get the foreign keys, and create an edge
         # between parent and child. Networkx will automatically ignore inverse
         # edges (i.e., if we add an edge between Cube and Wavelength, and later
         # add the inverse edge between Wavelength and Cube, the latter edge
         # will be ignored, as a previous link between the two nodes already
-        # exists).
+        # exists). The columns of each foreign key are kept in the
+        # foreign_keys attribute of the edge, as tuples of
+        # (table, columns, referencedTable, referencedColumns).
         for model in self.models[schema.__name__]:
 
-            foreignKeys = list(model.__table__.foreign_keys)
-            for fKey in foreignKeys:
-                childSchemaName = fKey.column.table.schema
-                childTableName = fKey.column.table.name
+            # Sorted, so the edges are always added in the same order
+            constraints = sorted(model.__table__.foreign_key_constraints,
+                                 key=lambda constraint: tuple(constraint.column_keys))
+            for constraint in constraints:
+                childSchemaName = constraint.referred_table.schema
+                childTableName = constraint.referred_table.name
                 childFullPath = childSchemaName + '.' + childTableName
-                if childFullPath not in self.graph.nodes():
+                if childFullPath not in self.graph.nodes() or \
+                        (referred is not None and childFullPath not in referred):
                     continue
                 else:
                     parent = self.getTablePath(model)
+                    foreignKey = (parent,
+                                  tuple(fKey.parent.name for fKey in constraint.elements),
+                                  childFullPath,
+                                  tuple(fKey.column.name for fKey in constraint.elements))
                     self.graph.add_edge(parent, childFullPath)
+                    foreignKeys = self.graph.edges[parent, childFullPath].setdefault(
+                        'foreign_keys', [])
+                    if foreignKey not in foreignKeys:
+                        foreignKeys.append(foreignKey)
+
+    def addSchema(self, schema):
+        """Adds the models of a schema module to the graph.
+
+        The nodes and edges of the schema, including those of the foreign keys
+        between it and the schemas already in the graph, are added without
+        rebuilding the graph. Only the cached plans and precomputed paths of
+        the tables connected to the new ones are invalidated. If a schema with
+        the same name is already in the graph, e.g. a reloaded module, it is
+        replaced.
+
+        Parameters
+        ----------
+        schema : module
+            The schema module to add.
+
+        """
+
+        if schema.__name__ in self.models:
+            self.removeSchema(schema.__name__)
+
+        self.graph = self._networkxGraph()
+        components = self._getNetworkxComponents()
+        edges = set(self.graph.edges())
+
+        self._createNodes(schema)
+        tables = set(self.getTablePath(model) for model in self.models[schema.__name__])
+
+        # The edges of the new schema, and those of the foreign keys from the
+        # existing schemas to it.
+        self._createEdges(schema)
+        for other in self.schemas:
+            self._createEdges(other, referred=tables)
+
+        touched = set(components[table]
+                      for edge in self.graph.edges() if edge not in edges
+                      for table in edge if table in components)
+        affected = tables | set(table for table, component in components.items()
+                                if component in touched)
+
+        self.schemas = np.atleast_1d(list(self.schemas) + [schema])
+        if self._columnIndex is not None:
+            self._columnIndex.addModels(self.models[schema.__name__])
+
+        self._update(affected)
+
+    def removeSchema(self, schema):
+        """Removes the models of a schema module from the graph.
 
-    def getJoins(self, models, format_out='tables', nexus=None):
+        The nodes of the schema and all their edges, including those of the
+        foreign keys between it and the remaining schemas, are removed. Only
+        the cached plans and precomputed paths of the tables that were
+        connected to the removed ones are invalidated.
+
+        Parameters
+        ----------
+        schema : module or string
+            The schema module, or its name.
+
+        """
+
+        name = schema if isinstance(schema, str) else schema.__name__
+        if name not in self.models:
+            raise ValueError('schema {0} is not in the graph.'.format(name))
+
+        self.graph = self._networkxGraph()
+        components = self._getNetworkxComponents()
+
+        tables = set(self.getTablePath(model) for model in self.models.pop(name))
+        touched = set(components[table] for table in tables)
+        affected = set(table for table, component in components.items() if component in touched)
+
+        self.graph.remove_nodes_from(tables)
+
+        self.schemas = np.atleast_1d([ss for ss in self.schemas if ss.__name__ != name])
+        self.aliases = {alias: path for alias, path in self.aliases.items()
+                        if path not in tables}
+        self._columnIndex = None
+
+        self._update(affected)
+
+    def _networkxGraph(self):
+        """Returns the graph as a `networkx.Graph`, converting a CSRGraph."""
+
+        if not isinstance(self.graph, CSRGraph):
+            return self.graph
+
+        graph = nx.Graph()
+        graph.add_nodes_from(self.graph.nodes(data=True))
+        graph.add_edges_from(self.graph.edges(data=True))
+        return graph
+
+    def _getNetworkxComponents(self):
+        """Returns the connected component number of each node of a networkx graph."""
+
+        return {table: ii for ii, component in enumerate(nx.connected_components(self.graph))
+                for table in component}
+
+    def _update(self, affected):
+        """Finishes a change of the graph that affects the paths of some tables.
+
+        Sets the edge weights and the backend of the new graph, updates the
+        fingerprint, computes again the precomputed paths of the affected
+        tables, and removes the cached plans and SQLAlchemy constructs that
+        involve them.
+
+        """
+
+        if self.statistics is not None:
+            self._applyStatistics(self.statistics)
+
+        if self.backend == 'csr':
+            self.graph = CSRGraph.fromNetworkx(self.graph)
+
+        self.fingerprint = getSchemaFingerprint(self.schemas)
+
+        # The paths between tables in other components cannot have changed
+        if self._trees is not None:
+            self._components = self._getComponents()
+            for table in affected:
+                self._trees.pop(table, None)
+                if table in self.graph.nodes():
+                    self._trees[table] = self._bfsTree(table)
+
+        def isAffected(items):
+            return not affected.isdisjoint(self._tablePaths(items))
+
+        if self._plans is not None:
+            # Keys are (models, nexus, format_out, strategy)
+            self._plans.discard(lambda key: isAffected(list(key[0]) + [key[1]]))
+
+        if self._selects is not None:
+            def isStale(key):
+                if key[0] == 'dialect':
+                    return False
+                elif key[0] == 'join':
+                    return isAffected([key[1]] + list(key[2]))
+                return isAffected(list(key[1]) + [key[3]])
+            self._selects.discard(isStale)
+
+    def _tablePaths(self, items):
+        """Returns the set of table paths of a list of models, tables and join steps."""
+
+        paths = set()
+        for item in items:
+            if isinstance(item, JoinStep):
+                paths.update((item.left, item.right))
+            elif isModel(item):
+                paths.add(self.getTablePath(item))
+            elif isinstance(item, str):
+                paths.add(item)
+        return paths
+
+    def getJoins(self, models, format_out='tables', nexus=None, strategy='pairwise',
+                 return_cost=False):
         """Returns a list all model classes needed to perform a join.
 
         Given a list of ``models``, finds the shortest join paths between any
@@ -171,13 +844,31 @@ class ModelGraph(object):
         format_out : string
             Defines the type of elements in the returned list. If ``'models'``,
             the returned elements will be model classes, if ``'tables'`` they
-            will be the corresponding table paths (schema.table).
+            will be the corresponding table paths (schema.table). If
+            ``'plan'``, the returned elements are `JoinStep` tuples of
+            ``(left, right, columns)``, in the order the joins must be made,
+            with the foreign key columns of the ON clause of each join. The
+            left table of the first step is the first table (or ``nexus``).
+            If several foreign keys relate two tables, the first one in column
+            order is used; all of them are in the ``foreign_keys`` attribute
+            of the graph edge.
         nexus : string, model class, or None
             If None, the method will find the paths between each combination of
             two elements in the input ``model`` list. If a table is provided
             (either as a table path or as a model class), the returned list
             will be the shorted path between `nexus` and each on of the tables
             in ``models``. The ``nexus`` table won't be included in the output.
+        strategy : string
+            How the tables are connected. If ``'pairwise'`` (the default), the
+            union of the shortest paths between each pair of tables (or between
+            ``nexus`` and each table) is returned. If ``'steiner'``, the tables
+            are connected by a minimal subtree of the graph, grown from the
+            first table (or ``nexus``) by adding the path to the closest
+            remaining table at each step. This usually requires fewer
+            intermediate tables, and the output is ordered so each table can
+            be joined to one of the tables before it.
+        return_cost : bool
+            If True, returns the cost of the joins as well, see `getJoinCost`.
 
         Returns
         -------
@@ -185,14 +876,152 @@ class ModelGraph(object):
             A list of all the model classes or tablenames (depending on the
             value of ``format_out``) needed to connect all the elements in
             ``models``. The original elements in `models` are also included.
+        cost : float
+            The cost of the joins. Only returned if ``return_cost=True``.
+
+        """
+
+        models = self._asList(models)
+        format_out = format_out.lower()
+
+        assert format_out in ['models', 'tables', 'plan'], \
+            'format_out must be either \'models\', \'tables\' or \'plan\'.'
+
+        joins = self._getCachedJoins(models, format_out, nexus, strategy)
+
+        if return_cost:
+            return joins, self.getJoinCost(joins, nexus=nexus)
+        return joins
+
+    def getJoinsBatch(self, tableSets, format_out='tables', nexus=None, strategy='pairwise',
+                      workers=None, raise_errors=True):
+        """Returns the joins of many lists of tables at once.
+
+        Identical lists are only planned once. Without precomputed paths,
+        the shortest path trees and the connected components are computed
+        once and shared by all the lists, so the joins of a batch can differ
+        from those of `getJoins` when several paths have the same length.
+
+        Parameters
+        ----------
+        tableSets : list
+            A list of inputs for `getJoins`, i.e., of lists of tables or
+            model classes.
+        format_out, nexus, strategy :
+            As in `getJoins`, for all the lists.
+        workers : int or None
+            If set, the lists are planned on a pool of this many threads.
+        raise_errors : bool
+            If True (the default), the first error is raised. Otherwise, the
+            error is returned in place of the joins of the list that failed.
+
+        Returns
+        -------
+        joins : list
+            The output of `getJoins` for each list in ``tableSets``.
 
         """
 
-        models = np.atleast_1d(models)
         format_out = format_out.lower()
+        assert format_out in ['models', 'tables', 'plan'], \
+            'format_out must be either \'models\', \'tables\' or \'plan\'.'
+
+        keys = []
+        unique = {}
+        for models in tableSets:
+            models = self._asList(models)
+            key = tuple(models)
+            keys.append(key)
+            unique.setdefault(key, models)
+
+        shared = {'trees': {},
+                  'components': self._components if self._components is not None
+                  else self._getComponents()}
+
+        def plan(models):
+            try:
+                return self._getCachedJoins(models, format_out, nexus, strategy, shared=shared)
+            except (ValueError, AssertionError, nx.NetworkXNoPath) as ee:
+                if raise_errors:
+                    raise
+                return ee
+
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(unique, executor.map(plan, unique.values())))
+        else:
+            results = {key: plan(models) for key, models in unique.items()}
+
+        return [list(results[key]) if isinstance(results[key], list) else results[key]
+                for key in keys]
+
+    def _asList(self, models):
+        """Returns the input of getJoins as a list."""
+
+        # Fast path for the usual list inputs, avoiding a numpy array
+        if isinstance(models, (list, tuple)):
+            return list(models)
+        elif isModel(models) or isinstance(models, str):
+            return [models]
+        else:
+            return np.atleast_1d(models)
+
+    def _getCachedJoins(self, models, format_out, nexus, strategy, shared=None):
+        """Returns the joins from the plan cache, or finds and caches them."""
+
+        # The plan depends on the order of the input, so the key is a tuple
+        key = joins = None
+        if self._plans is not None:
+            try:
+                key = (tuple(models), nexus, format_out, strategy)
+                joins = self._plans.get(key)
+            except TypeError:
+                key = None
+
+        if joins is not None:
+            return list(joins)
+
+        if format_out == 'plan':
+            joins = self._getPlan(self._getJoins(models, 'tables', nexus, strategy, shared),
+                                  nexus)
+        else:
+            joins = self._getJoins(models, format_out, nexus, strategy, shared)
+        if key is not None:
+            self._plans.set(key, tuple(joins))
+
+        return joins
+
+    def getJoinCost(self, joins, nexus=None):
+        """Returns the cost of a list of joins, as returned by `getJoins`.
+
+        The cost is the sum of the weights of the edges used by the joins.
+        Without statistics, each edge weighs one, so the cost is the number of
+        joins.
+
+        """
 
-        assert format_out in ['models', 'tables'], \
-            'format_out must be either \'models\' or \'tables\'.'
+        if len(joins) == 0:
+            return 0.0
+
+        if isinstance(joins[0], JoinStep):
+            plan = joins
+        else:
+            tables = [self.getTablePath(join) if isModel(join) else join for join in joins]
+            plan = self._getPlan(tables, nexus)
+
+        return float(sum(self.graph.edges[step.left, step.right].get('weight', 1)
+                         for step in plan))
+
+    def _getJoins(self, models, format_out, nexus, strategy, shared=None):
+        """Finds the join plan. See `getJoins`.
+
+        ``shared`` is an optional dict of the path ``trees`` and the
+        ``components`` shared by a batch of plans, see `getJoinsBatch`.
+
+        """
+
+        assert strategy in ['pairwise', 'steiner'], \
+            'strategy must be either \'pairwise\' or \'steiner\'.'
 
         if len(models) == 0:
             raise ValueError('input list of models/tables to join is empty.')
@@ -205,7 +1034,7 @@ class ModelGraph(object):
         # Determines the type of input
         if isModel(models[0]):
             format_in = 'models'
-        elif isinstance(models[0], (str, np.unicode_)):
+        elif isinstance(models[0], (str, np.str_)):
             format_in = 'tables'
         else:
             raise ValueError('the format of the input list '
@@ -221,13 +1050,20 @@ class ModelGraph(object):
 
         if nexus and isModel(nexus):
             nexus = self.getTablePath(nexus)
-            assert nexus in self.graph.nodes(), \
+        if nexus:
+            assert nexus in self.graph, \
                 'nexus {0} is not a node in the model graph.'.format(nexus)
 
         for table in tables:
-            assert table in self.graph.nodes(), \
+            assert table in self.graph, \
                 'table {0} is not a node in the model graph.'.format(table)
 
+        # With the precomputed components, fails early if the tables are
+        # not connected.
+        components = shared['components'] if shared else self._components
+        if components is not None:
+            self._checkConnected(([nexus] if nexus else []) + list(tables), components)
+
         if len(models) == 1:
             # Simple case in which we only have one table to join. We just
             # return the same table / model, depending on format_out
@@ -250,19 +1086,29 @@ class ModelGraph(object):
             # If nexus is defined, we get the joins between nexus and each item
             # in tables.
 
+            if strategy == 'steiner':
+                roots = [nexus] if nexus else tables[:1]
+                joins = self._getSteinerTree(roots, tables)
+                if nexus:
+                    joins.remove(nexus)
+                if format_out == 'models':
+                    joins = [self.graph.nodes[table]['model'] for table in joins]
+                return joins
+
             joins = []
 
             if not nexus:
                 for tableA, tableB in itertools.combinations(tables, r=2):
                     newJoins = self._getShortestPath(tableA, tableB,
-                                                     format_out=format_out)
+                                                     format_out=format_out,
+                                                     shared=shared)
                     self._joinList(joins, newJoins)
 
             else:
                 for tableB in tables:
                     newJoins = self._getShortestPath(nexus, tableB,
                                                      format_out=format_out,
-                                                     removeA=True)
+                                                     removeA=True, shared=shared)
                     self._joinList(joins, newJoins)
 
             return joins
@@ -277,15 +1123,31 @@ class ModelGraph(object):
         return listA
 
     def _getShortestPath(self, tableA, tableB, format_out='tables',
-                         removeA=False):
+                         removeA=False, shared=None):
         """Gets the shortest path between two nodes."""
 
-        try:
-            path = nx.shortest_path(self.graph, tableA, tableB)
-        except nx.NetworkXNoPath:
-            raise nx.NetworkXNoPath(
-                'it is not possible to join tables {0} and {1}. '
-                'Please, review your query.'.format(tableA, tableB))
+        if self._trees is not None:
+            path = self._getTreePath(tableA, tableB)
+        elif shared is not None:
+            # Reuses the tree of either table, and only computes the tree of
+            # tableA if neither is known.
+            trees = shared['trees']
+            if tableA not in trees and tableB in trees:
+                path = self._getTreePath(tableB, tableA, trees)[::-1]
+            else:
+                if tableA not in trees:
+                    trees[tableA] = self._bfsTree(tableA)
+                path = self._getTreePath(tableA, tableB, trees)
+        else:
+            try:
+                if self.backend == 'csr':
+                    path = self.graph.shortestPath(tableA, tableB, weight=self._weight)
+                else:
+                    path = nx.shortest_path(self.graph, tableA, tableB, weight=self._weight)
+            except nx.NetworkXNoPath:
+                raise nx.NetworkXNoPath(
+                    'it is not possible to join tables {0} and {1}. '
+                    'Please, review your query.'.format(tableA, tableB))
 
         if removeA:
             path.remove(tableA)
@@ -296,3 +1158,125 @@ class ModelGraph(object):
             pathSet = [self.graph.nodes[table]['model'] for table in path]
 
         return pathSet
+
+    def _getSteinerTree(self, roots, tables):
+        """Connects tables with a greedy approximation of the Steiner tree.
+
+        Starting from the ``roots``, repeatedly finds the remaining table
+        closest to the tree with a multi-source breadth-first search, and
+        adds the path to it. Ties are broken by the order of ``tables``.
+        Returns the list of tables in the tree, in the order they were added.
+
+        """
+
+        tree = list(roots)
+        inTree = set(tree)
+        remaining = [table for table in tables if table not in inTree]
+
+        while remaining:
+            terminal, path = self._nearestTable(inTree, remaining)
+            if terminal is None:
+                raise nx.NetworkXNoPath(
+                    'it is not possible to join tables {0} and {1}. '
+                    'Please, review your query.'.format(tree[0], remaining[0]))
+            for table in path:
+                if table not in inTree:
+                    tree.append(table)
+                    inTree.add(table)
+            remaining = [table for table in remaining if table not in inTree]
+
+        return tree
+
+    def _nearestTable(self, sources, targets):
+        """Finds the target closest to any of the sources, and the path to it.
+
+        The returned path starts at one of the sources and ends at the target.
+        Returns ``(None, None)`` if no target can be reached. With statistics,
+        the closest target is the one with the cheapest path.
+
+        """
+
+        if self.backend == 'csr':
+            return self.graph.nearest(sources, targets, weight=self._weight)
+
+        if self._weight:
+            distances, paths = nx.multi_source_dijkstra(self.graph, set(sources),
+                                                        weight=self._weight)
+            found = [table for table in targets if table in distances]
+            if not found:
+                return None, None
+            target = min(found, key=lambda table: distances[table])
+            return target, paths[target]
+
+        adjacency = self.graph.adj
+        order = {table: ii for ii, table in enumerate(targets)}
+        parents = dict.fromkeys(sources)
+        layer = list(sources)
+
+        while layer:
+            found = [table for table in layer if table in order]
+            if found:
+                target = min(found, key=order.get)
+                path = [target]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return target, path[::-1]
+
+            nextLayer = []
+            for table in layer:
+                for neighbour in adjacency[table]:
+                    if neighbour not in parents:
+                        parents[neighbour] = table
+                        nextLayer.append(neighbour)
+            layer = nextLayer
+
+        return None, None
+
+    def _getTreePath(self, tableA, tableB, trees=None):
+        """Gets the shortest path between two nodes from the BFS tree of tableA."""
+
+        parents = (self._trees if trees is None else trees)[tableA]
+        if tableB not in parents:
+            raise nx.NetworkXNoPath(
+                'it is not possible to join tables {0} and {1}. '
+                'Please, review your query.'.format(tableA, tableB))
+
+        path = [tableB]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+
+        return path[::-1]
+
+    def _checkConnected(self, tables, components):
+        """Raises NetworkXNoPath if the tables are not all in the same component."""
+
+        first = components[tables[0]]
+        for table in tables[1:]:
+            if components[table] != first:
+                raise nx.NetworkXNoPath(
+                    'it is not possible to join tables {0} and {1}. '
+                    'Please, review your query.'.format(tables[0], table))
+
+    def _getPlan(self, tables, nexus=None):
+        """Converts an ordered list of tables into a list of `JoinStep`."""
+
+        if nexus and isModel(nexus):
+            nexus = self.getTablePath(nexus)
+
+        joined = [nexus] if nexus else list(tables[:1])
+        plan = []
+        for table in (tables if nexus else tables[1:]):
+            left = next(prev for prev in joined if self.graph.has_edge(prev, table))
+            plan.append(JoinStep(left, table, self._getJoinColumns(left, table)))
+            joined.append(table)
+
+        return plan
+
+    def _getJoinColumns(self, left, right):
+        """Returns the (leftColumn, rightColumn) pairs of the foreign key between two tables."""
+
+        table, columns, refTable, refColumns = self.graph.edges[left, right]['foreign_keys'][0]
+        if table == left:
+            return tuple(zip(columns, refColumns))
+        else:
+            return tuple(zip(refColumns, columns))
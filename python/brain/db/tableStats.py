@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+tableStats.py
+
+Licensed under a 3-clause BSD license.
+
+Table statistics used by `~brain.db.modelGraph.ModelGraph` to weight its
+edges, so the planner prefers joining through small, indexed tables over
+joining through large ones when several paths connect the same tables.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import contextlib
+import math
+from sqlalchemy import func, inspect, select, table as tableClause, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+
+__all__ = ['TableStatistics']
+
+
+def _tableName(table):
+    """Returns the schema.table path of a model class, Table or string."""
+
+    table = getattr(table, '__table__', table)
+    if isinstance(table, str):
+        return table
+    return '{0}.{1}'.format(table.schema, table.name) if table.schema else table.name
+
+
+class TableStatistics(object):
+    """Row counts and indexes of database tables.
+
+    The statistics can be supplied directly, or collected from a database
+    with `TableStatistics.collect`.
+
+    Parameters:
+        rows (dict):
+            The number of rows of each table, keyed by ``schema.table``
+        indexes (dict):
+            The indexed columns of each table, keyed by ``schema.table``, as a
+            list of tuples of column names, one per index.  The primary key
+            counts as an index.
+        default_rows (int):
+            The number of rows assumed for tables without statistics.
+            Default is 1000.
+        unindexed_penalty (float):
+            The extra cost of a join on foreign key columns that are not
+            indexed.  Default is 2.
+
+    Example:
+        >>> stats = TableStatistics.collect(engine, graph.graph.nodes)
+        >>> graph.setStatistics(stats)
+        >>> joins, cost = graph.getJoins([IFUDesign, Nsa], return_cost=True)
+
+    """
+
+    def __init__(self, rows=None, indexes=None, default_rows=1000, unindexed_penalty=2.0):
+        self.rows = dict(rows or {})
+        self.indexes = {table: [tuple(index) for index in tableIndexes]
+                        for table, tableIndexes in (indexes or {}).items()}
+        self.default_rows = default_rows
+        self.unindexed_penalty = unindexed_penalty
+
+    def __repr__(self):
+        return 'TableStatistics(tables={0})'.format(len(set(self.rows) | set(self.indexes)))
+
+    def __eq__(self, other):
+        return isinstance(other, TableStatistics) and self.toDict() == other.toDict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    @classmethod
+    def collect(cls, bind, tables, exact=True, **kwargs):
+        """Collects the statistics of tables from a database.
+
+        Tables that cannot be inspected, e.g. because they do not exist in
+        the database, are skipped with a warning.  Each table is inspected in
+        its own savepoint, so a failure does not affect the other tables.
+
+        Parameters:
+            bind (Engine or Connection):
+                The SQLAlchemy engine or connection of the database
+            tables (list):
+                The model classes, Table objects or ``schema.table`` paths
+            exact (bool):
+                If False, and the database is PostgreSQL, the row counts are the
+                planner estimates from ``pg_class`` instead of ``count(*)``.
+                Default is True.
+            kwargs:
+                Passed to `TableStatistics`
+
+        Returns:
+            A `TableStatistics`
+        """
+
+        connect = bind.connect() if isinstance(bind, Engine) else contextlib.nullcontext(bind)
+        rows = {}
+        indexes = {}
+        with connect as conn:
+            inspector = inspect(conn)
+            for table in tables:
+                path = _tableName(table)
+                schema, __, name = path.rpartition('.')
+                schema = schema or None
+                # each table in a savepoint, as a failed query aborts the whole
+                # transaction on e.g. PostgreSQL
+                try:
+                    with conn.begin_nested():
+                        count = cls._countRows(conn, schema, name, exact)
+                        pkey = inspector.get_pk_constraint(name, schema=schema)
+                        tableIndexes = [tuple(index['column_names'])
+                                        for index in inspector.get_indexes(name, schema=schema)]
+                except SQLAlchemyError as e:
+                    from brain import log
+                    log.warning('Skipping the statistics of table {0}: {1}'.format(path, e))
+                    continue
+                rows[path] = count
+                if pkey and pkey.get('constrained_columns'):
+                    tableIndexes.insert(0, tuple(pkey['constrained_columns']))
+                indexes[path] = tableIndexes
+
+        return cls(rows=rows, indexes=indexes, **kwargs)
+
+    @staticmethod
+    def _countRows(conn, schema, name, exact):
+        """Counts, or estimates, the rows of a table."""
+
+        if not exact and conn.dialect.name == 'postgresql':
+            estimate = conn.execute(
+                text('select c.reltuples::bigint from pg_class c join pg_namespace n '
+                     'on n.oid = c.relnamespace where n.nspname = :schema and c.relname = :name'),
+                {'schema': schema or 'public', 'name': name}).scalar()
+            if estimate is not None and estimate >= 0:
+                return int(estimate)
+
+        return conn.execute(select(func.count()).select_from(
+            tableClause(name, schema=schema))).scalar()
+
+    def rowCount(self, table):
+        """Returns the number of rows of a table, or the default."""
+        return self.rows.get(_tableName(table), self.default_rows)
+
+    def isIndexed(self, table, columns):
+        """Returns True if the columns lead an index, False if not, or None if unknown."""
+
+        tableIndexes = self.indexes.get(_tableName(table), None)
+        if tableIndexes is None:
+            return None
+        columns = tuple(columns)
+        return any(index[:len(columns)] == columns for index in tableIndexes)
+
+    def nodeCost(self, table):
+        """The cost of joining a table: one, plus the log of its number of rows."""
+        return 1.0 + math.log10(1.0 + self.rowCount(table))
+
+    def edgeCost(self, left, right, foreignKeys):
+        """The cost of the edge between two tables, related by a list of foreign keys.
+
+        Half of the cost of each table, so the cost of a path is the cost of
+        its intermediate tables plus half that of its ends, and the penalty
+        if the referencing columns of the first foreign key are not indexed.
+
+        """
+
+        cost = (self.nodeCost(left) + self.nodeCost(right)) / 2.0
+        if foreignKeys:
+            table, columns, refTable, refColumns = foreignKeys[0]
+            if self.isIndexed(table, columns) is False:
+                cost += self.unindexed_penalty
+        return cost
+
+    def toDict(self):
+        """Returns the statistics as a JSON-serializable dict."""
+        return {'rows': self.rows,
+                'indexes': {table: [list(index) for index in tableIndexes]
+                            for table, tableIndexes in self.indexes.items()},
+                'default_rows': self.default_rows,
+                'unindexed_penalty': self.unindexed_penalty}
+
+    @classmethod
+    def fromDict(cls, data):
+        """Creates the statistics from the output of `toDict`."""
+        return cls(**data)
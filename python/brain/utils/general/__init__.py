@@ -1,2 +1,5 @@
 from brain.utils.general.decorators import *
 from brain.utils.general.general import *
+from brain.utils.general.cache import *
+from brain.utils.general.framing import *
+from brain.utils.general.chunked import *
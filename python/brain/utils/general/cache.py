@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+cache.py
+
+Licensed under a 3-clause BSD license.
+
+A small thread-safe LRU cache with optional per-item expiry, shared by the
+Brain server-side caches.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import threading
+import time
+from collections import OrderedDict
+
+
+__all__ = ['TTLCache']
+
+
+_missing = object()
+
+
+class TTLCache(object):
+    ''' A thread-safe LRU cache with optional time-to-live
+
+    Parameters:
+        maxsize (int):
+            The maximum number of items.  The least recently used items are
+            evicted first.  Default is 128.
+        ttl (float):
+            The default lifetime, in seconds, of the cached items.  If None,
+            items never expire.  Default is None.
+        timer (callable):
+            The clock used for the expiry.  Default is time.time.
+
+    Example:
+        >>> cache = TTLCache(maxsize=1000, ttl=60)
+        >>> cache.set('key', 'value')
+        >>> cache.get('key')
+        'value'
+        >>> cache.info()
+        {'hits': 1, 'misses': 0, 'evictions': 0, 'size': 1, 'maxsize': 1000, 'hit_rate': 1.0}
+
+    '''
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.time):
+        assert maxsize > 0, 'maxsize must be positive'
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _missing, count=False) is not _missing
+
+    def __repr__(self):
+        return 'TTLCache(size={0}, maxsize={1}, ttl={2})'.format(len(self), self.maxsize, self.ttl)
+
+    def get(self, key, default=None, count=True):
+        ''' Returns the cached value of ``key``, or ``default`` if missing or expired '''
+
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is not _missing:
+                value, expires = item
+                if expires is not None and expires <= self.timer():
+                    del self._data[key]
+                else:
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=_missing, expires=None):
+        ''' Caches a value
+
+        Parameters:
+            key (hashable):
+                The cache key
+            value (object):
+                The value to cache
+            ttl (float):
+                The lifetime of this item in seconds.  Defaults to the cache ttl.
+            expires (float):
+                The absolute expiry time of this item.  Overrides ``ttl``.
+        '''
+
+        if expires is None:
+            ttl = self.ttl if ttl is _missing else ttl
+            expires = self.timer() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        ''' Removes a key from the cache and returns its value '''
+        with self._lock:
+            item = self._data.pop(key, _missing)
+        return default if item is _missing else item[0]
+
+    def keys(self):
+        ''' Returns a list of the cached keys, including expired ones not yet removed '''
+        with self._lock:
+            return list(self._data.keys())
+
+    def discard(self, match):
+        ''' Removes all keys for which ``match(key)`` is True and returns their number '''
+
+        with self._lock:
+            stale = [key for key in self._data if match(key)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def expire(self):
+        ''' Removes all the expired items '''
+        now = self.timer()
+        with self._lock:
+            stale = [key for key, (value, expires) in self._data.items()
+                     if expires is not None and expires <= now]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        ''' Removes all items and resets the statistics '''
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        ''' Returns the cache statistics '''
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self), 'maxsize': self.maxsize, 'hit_rate': self.hit_rate}
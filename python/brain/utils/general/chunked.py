@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+chunked.py
+
+Licensed under a 3-clause BSD license.
+
+Out-of-core processing of large arrays, e.g. full datacubes.  The input is
+read through a memory map and split into tiles along its first axis; the
+tiles are processed on a thread pool (numpy releases the GIL in its
+ufuncs) and written into output arrays, which can also be memory-mapped
+files.  Only the tiles in flight are ever in memory.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from brain.core.exceptions import BrainError
+from brain.utils.general.general import ivar_to_err, err_to_ivar
+
+
+__all__ = ['open_array', 'create_array', 'ChunkedEngine', 'chunked_ivar_to_err',
+           'chunked_err_to_ivar']
+
+
+def open_array(source, dtype=None, shape=None, offset=0, mode='r'):
+    ''' Opens an array without reading it into memory
+
+    Parameters:
+        source (str or ndarray):
+            An array, a memmap, the path of a .npy file or of a raw binary file
+        dtype (dtype):
+            The dtype of a raw binary file
+        shape (tuple):
+            The shape of a raw binary file.  Defaults to a 1-D array of the whole file.
+        offset (int):
+            The offset of the data in a raw binary file, in bytes
+        mode (str):
+            The memmap mode.  Default is read-only.
+
+    Returns:
+        An ndarray or np.memmap
+    '''
+
+    if isinstance(source, np.ndarray):
+        return source
+
+    path = os.path.expanduser(source)
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode=mode)
+    if dtype is None:
+        raise BrainError('a dtype is needed to open the raw binary file {0}'.format(path))
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape, offset=offset)
+
+
+def create_array(target, shape, dtype):
+    ''' Creates an output array
+
+    Parameters:
+        target (str or ndarray):
+            An existing array, or the path of a file to create.  Paths ending
+            in .npy create a .npy file, others a raw binary file.  If None, the
+            array is created in memory.
+        shape (tuple):
+            The shape of the array
+        dtype (dtype):
+            The dtype of the array
+
+    Returns:
+        An ndarray or np.memmap
+    '''
+
+    if target is None:
+        return np.empty(shape, dtype=dtype)
+    if isinstance(target, np.ndarray):
+        if target.shape != tuple(shape):
+            raise BrainError('output has shape {0} instead of {1}'.format(target.shape, shape))
+        return target
+
+    path = os.path.expanduser(target)
+    if path.endswith('.npy'):
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+    return np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
+
+
+class ChunkedEngine(object):
+    ''' Applies a function to an array tile by tile on a thread pool
+
+    Parameters:
+        chunk_bytes (int):
+            The target size of the input tiles in bytes.  Default is 32 MB.
+        workers (int):
+            The number of threads.  Defaults to the number of CPUs.
+
+    Attributes:
+        stats (dict):
+            The statistics of the last run: the number of chunks, the bytes
+            read and written, the elapsed seconds and the throughput in MB/s.
+
+    Example:
+        >>> engine = ChunkedEngine(workers=8)
+        >>> err, mask = engine.apply(masked_err, 'ivar.npy', outputs=['err.npy', 'mask.npy'],
+        >>>                          dtypes=[None, bool])
+        >>> engine.stats['throughput']
+
+    '''
+
+    def __init__(self, chunk_bytes=32 * 2 ** 20, workers=None):
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {}
+
+    def chunks(self, shape, itemsize):
+        ''' Returns the (start, stop) slices of the first axis for an array '''
+
+        if not shape:
+            return [(0, None)]
+        rowsize = itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        rows = max(1, self.chunk_bytes // max(rowsize, 1))
+        return [(start, min(start + rows, shape[0])) for start in range(0, shape[0], rows)]
+
+    def apply(self, func, source, outputs=None, dtypes=None, **kwargs):
+        ''' Applies a function to all the tiles of an array
+
+        Parameters:
+            func (callable):
+                Called as ``func(tile, *out_tiles)`` for each tile, it must write its
+                results into the output tiles.
+            source (str or ndarray):
+                The input array, or a path opened with `open_array`
+            outputs (list):
+                The output arrays or paths, see `create_array`.  Defaults to one
+                in-memory output.
+            dtypes (list):
+                The dtypes of the outputs.  None entries use the source dtype.
+            kwargs:
+                Passed to `open_array`
+
+        Returns:
+            The output array, or a tuple of them when there are several
+        '''
+
+        data = open_array(source, **kwargs)
+        outputs = [None] if outputs is None else list(outputs)
+        dtypes = [None] * len(outputs) if dtypes is None else list(dtypes)
+        if len(dtypes) != len(outputs):
+            raise BrainError('there must be one dtype per output')
+        outs = [create_array(target, data.shape, dtype or data.dtype)
+                for target, dtype in zip(outputs, dtypes)]
+
+        def run(chunk):
+            index = slice(*chunk) if data.ndim else Ellipsis
+            func(data[index], *[out[index] for out in outs])
+
+        chunks = self.chunks(data.shape, data.itemsize)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run, chunks))
+        for out in outs:
+            if isinstance(out, np.memmap):
+                out.flush()
+        elapsed = time.time() - start
+
+        written = sum(out.nbytes for out in outs)
+        throughput = (data.nbytes + written) / 2 ** 20 / elapsed if elapsed else 0.0
+        self.stats = {'chunks': len(chunks), 'bytes_read': data.nbytes, 'bytes_written': written,
+                      'seconds': elapsed, 'throughput': throughput}
+        return outs[0] if len(outs) == 1 else tuple(outs)
+
+
+def _convert(func, source, out, mask_out, engine, kwargs):
+    engine = engine or ChunkedEngine()
+
+    def tile(data, out, mask=None):
+        data = np.asarray(data)
+        if mask is not None:
+            np.logical_not(data > 0, out=mask)
+            mask |= ~np.isfinite(data)
+        func(data, out=out)
+
+    data = open_array(source, **kwargs)
+    if out is None and isinstance(data, np.memmap):
+        raise BrainError('an output array or path is needed to convert a memory-mapped array, '
+                         'otherwise the whole output is allocated in memory')
+    outputs, dtypes = [out], [data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64]
+    if mask_out is not None:
+        outputs.append(mask_out)
+        dtypes.append(bool)
+    return engine.apply(tile, data, outputs=outputs, dtypes=dtypes)
+
+
+def chunked_ivar_to_err(source, out=None, mask_out=None, engine=None, **kwargs):
+    ''' Converts inverse variances into errors, out of core
+
+    The chunked version of `~brain.utils.general.general.ivar_to_err`.
+
+    Parameters:
+        source (str or ndarray):
+            The inverse variances, e.g. a memmap or the path of a .npy file
+        out (str or ndarray):
+            The output errors, e.g. the path of a .npy file to create.  It is
+            required when the source is a file or a memmap; it can only be None,
+            for an in-memory output, when the source is already in memory.
+        mask_out (str or ndarray):
+            An optional output for the boolean mask of the bad inverse variances.
+            If None, no mask is computed.
+        engine (ChunkedEngine):
+            The engine to use.  Its ``stats`` hold the throughput of the conversion.
+        kwargs:
+            Passed to `open_array`
+
+    Returns:
+        The errors, or a tuple of the errors and the mask
+    '''
+
+    return _convert(ivar_to_err, source, out, mask_out, engine, kwargs)
+
+
+def chunked_err_to_ivar(source, out=None, mask_out=None, engine=None, **kwargs):
+    ''' Converts errors into inverse variances, out of core
+
+    The chunked version of `~brain.utils.general.general.err_to_ivar`.  See
+    `chunked_ivar_to_err` for the parameters.
+
+    '''
+
+    return _convert(err_to_ivar, source, out, mask_out, engine, kwargs)
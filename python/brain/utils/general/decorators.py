@@ -8,7 +8,8 @@ except ImportError:
     Path = None
 
 # General Decorators
-__all__ = ['public', 'parseRoutePath', 'checkPath']
+__all__ = ['public', 'ratelimit', 'ratelimit_exempt', 'cached', 'cache_control', 'parseRoutePath',
+           'parseParams', 'checkPath']
 
 
 def public(f):
@@ -17,21 +18,222 @@ def public(f):
     return f
 
 
+def ratelimit(rate, per=1.0, burst=None, key='auto', scope=None, cost=1):
+    ''' Decorator to set a specific rate limit on a route
+
+    Only takes effect when a `~brain.api.ratelimit.RateLimiter` is attached
+    to the view.  See `~brain.api.ratelimit.RateLimit` for the parameters.
+
+    Example:
+        >>>
+        >>> @ratelimit(5, per=60, key='token')
+        >>> @route('/query/', endpoint='query')
+        >>> def query(self):
+        >>>     ...
+        >>>
+
+    '''
+
+    from brain.api.ratelimit import RateLimit
+    limit = RateLimit(rate, per=per, burst=burst, key=key, scope=scope, cost=cost)
+
+    def decorator(f):
+        f.rate_limit = limit
+        return f
+    return decorator
+
+
+def ratelimit_exempt(f):
+    ''' Decorator to exempt a route from all the rate limits, e.g. for monitoring probes '''
+    f.rate_limit_exempt = True
+    return f
+
+
+def cache_control(max_age=0, public=None, must_revalidate=False):
+    ''' Decorator to set the HTTP cache lifetime of a route
+
+    Successful GET responses of the route get an ETag and a Cache-Control
+    header, and conditional requests with a matching If-None-Match are
+    answered with 304 Not Modified.  Routes decorated with ``@public`` get this
+    behaviour by default, with ``BrainBaseView.public_max_age``.
+
+    Parameters:
+        max_age (int):
+            The number of seconds clients and proxies can reuse the response without
+            revalidating it.  If 0, the response must be revalidated every time.
+            Default is 0.
+        public (bool):
+            If True, shared caches (e.g. reverse proxies) can store the response.
+            Otherwise it is private to the client.  If None, the default, only
+            the responses of ``@public`` routes are public, so the responses of
+            authenticated routes are never shared between users.
+        must_revalidate (bool):
+            If True, stale responses must not be used without revalidation.
+            Default is False.
+
+    '''
+
+    def decorator(f):
+        f.cache_control = {'max_age': max_age, 'public': public,
+                           'must_revalidate': must_revalidate}
+        return f
+    return decorator
+
+
+def cached(ttl=300, maxsize=256, backend=None, ignore=('session_id',), per_user=None):
+    ''' Decorator to cache the serialized response of a route
+
+    Caches the response bytes of a route, keyed on the endpoint, the release,
+    the route arguments and the normalized request parameters.  Repeated
+    requests are served from the cache without running the route or serializing
+    its results again.  Only successful (200) responses without an error in the
+    results are cached.  The cache of a route is cleared with
+    ``route.invalidate(release=None)``, which knows the endpoints of the route
+    once its view is registered, so it also clears a shared disk cache
+    from a worker that has not served the route yet.
+
+    Parameters:
+        ttl (float):
+            The lifetime of a cached response in seconds.  Default is 300.
+        maxsize (int):
+            The maximum number of cached responses.  Default is 256.
+        backend (object):
+            The cache backend, e.g. a `~brain.api.caching.DiskResponseCache`.
+            Defaults to a `~brain.api.caching.MemoryResponseCache` with ``ttl`` and ``maxsize``.
+        ignore (list):
+            The request parameters that do not change the response.  Default is
+            ("session_id",).
+        per_user (bool):
+            If True, responses are cached separately for each Authorization header.
+            If None, the default, only the responses of routes that are not
+            ``@public`` are cached per user.
+
+    Example:
+        >>>
+        >>> @public
+        >>> @cached(ttl=3600)
+        >>> @route('/getroutemap/', endpoint='getroutemap')
+        >>> def buildRouteMap(self):
+        >>>     ...
+        >>>
+
+    '''
+
+    import hashlib
+    from flask import request, current_app
+    from brain.api.caching import MemoryResponseCache, CachedResponse, response_cache_key
+    from brain.api.params import _request_form
+
+    cache = backend if backend is not None else MemoryResponseCache(maxsize=maxsize, ttl=ttl)
+    # filled in by BrainBaseView.register, and with the endpoint of each request
+    endpoints = set()
+
+    def invalidate(release=None):
+        ''' Removes the cached responses of the route, for one or all releases '''
+        return sum(cache.invalidate(endpoint=endpoint, release=release) for endpoint in endpoints)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(inst, *args, **kwargs):
+            endpoints.add(request.endpoint)
+            form = _request_form(request)
+            identity = None
+            by_user = per_user
+            if by_user is None:
+                view_func = current_app.view_functions.get(request.endpoint, None)
+                by_user = not getattr(view_func, 'is_public', False)
+            if by_user:
+                auth = request.headers.get('Authorization', '')
+                identity = hashlib.sha256(auth.encode('utf-8')).hexdigest()
+            key = response_cache_key(request.endpoint, form.get('release', None), form,
+                                     view_args=request.view_args, ignore=ignore,
+                                     identity=identity)
+
+            entry = cache.get(key)
+            if entry is not None:
+                # answer conditional requests without sending the body again
+                if request.method in ('GET', 'HEAD') and \
+                        request.if_none_match.contains(entry.etag):
+                    response = entry.to_response()
+                    response.status_code = 304
+                    response.set_data(b'')
+                    return response
+                return entry.to_response()
+
+            response = current_app.make_response(f(inst, *args, **kwargs))
+            results = getattr(inst, 'results', None) or {}
+            if response.status_code == 200 and not response.is_streamed and \
+                    not results.get('error', None):
+                entry = CachedResponse(response.get_data(), status=response.status_code,
+                                       mimetype=response.mimetype)
+                cache.set(key, entry)
+                response.set_etag(entry.etag)
+                response.headers['X-Brain-Cache'] = 'miss'
+            return response
+
+        decorated_function.response_cache = cache
+        decorated_function.cache_ttl = ttl
+        decorated_function.invalidate = invalidate
+        decorated_function.cache_endpoints = endpoints
+        return decorated_function
+    return decorator
+
+
 def parseRoutePath(f):
     ''' Decorator to parse generic route path '''
+    from brain.api.params import parse_route_path
+
     @wraps(f)
     def decorated_function(inst, *args, **kwargs):
         if 'path' in kwargs and kwargs['path']:
-            for kw in kwargs['path'].split('/'):
-                if len(kw) == 0:
-                    continue
-                var, value = kw.split('=')
-                kwargs[var] = value
+            kwargs.update(parse_route_path(kwargs['path']))
         kwargs.pop('path')
         return f(inst, *args, **kwargs)
     return decorated_function
 
 
+def parseParams(schema):
+    ''' Decorator to parse and validate the request parameters with a schema
+
+    Parses the form, JSON and generic route path parameters of the request
+    against a `~brain.api.params.ParamSchema`, and passes the typed values to the
+    route as keyword arguments.  The parsed values are cached on the request and
+    can be retrieved again with `~brain.api.params.get_params`.  Invalid parameters
+    return a 422 response listing the validation errors.
+
+    Parameters:
+        schema (ParamSchema):
+            The schema of the route parameters
+
+    Example:
+        >>>
+        >>> @route('/cubes/<name>/<path:path>', endpoint='getCube')
+        >>> @parseParams(ParamSchema(Param('release', required=True), Param('limit', int)))
+        >>> def getCube(self, name, release=None, limit=None):
+        >>>     ...
+        >>>
+
+    '''
+
+    from flask import request, jsonify
+    from brain.api.params import get_params, BrainValidationError
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(inst, *args, **kwargs):
+            try:
+                params = get_params(request, schema, path=kwargs.pop('path', None))
+            except BrainValidationError as e:
+                return jsonify({'error': str(e), 'status': -1,
+                                'validation_errors': e.errors}), 422
+            # the other route arguments are raw strings, so never override the parsed values
+            for key, val in kwargs.items():
+                params.setdefault(key, val)
+            return f(inst, *args, **params)
+        return decorated_function
+    return decorator
+
+
 def checkPath(func):
     '''Decorator that checks if sdss_access Path has been imported '''
 
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+framing.py
+
+Licensed under a 3-clause BSD license.
+
+A length-prefixed binary framing format for streamed API data.
+
+The legacy datastream format separates compressed rows with a literal
+``';\\n'``, which is unsafe for msgpack, whose packed rows can contain those
+bytes, and forces the client to decode and split the whole response.  A
+framed stream starts with a 4 byte header, ``b'BRN'`` and the format
+version, followed by frames of::
+
+    flags (1 byte) | payload length (4 bytes, big-endian) | payload
+
+The low bits of the flags give the codec of the payload (json or msgpack),
+and the high bit marks a zlib-compressed payload.  Each payload is a list of
+rows, so many rows are batched into one frame.  `FrameDecoder` parses the
+stream incrementally, as chunks arrive.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+import struct
+import zlib
+from brain.core.exceptions import BrainError
+from brain.utils.general.general import compress_data
+
+
+__all__ = ['FRAMED_MIMETYPE', 'encode_frames', 'FrameDecoder', 'decode_frames']
+
+
+FRAMED_MIMETYPE = 'application/x-brain-frames'
+MAGIC = b'BRN'
+VERSION = 1
+HEADER = MAGIC + struct.pack('>B', VERSION)
+
+_codecs = {'json': 0, 'msgpack': 1}
+_codec_names = {val: key for key, val in _codecs.items()}
+_ZLIB = 0x80
+_frame_header = struct.Struct('>BI')
+MAX_FRAME_SIZE = 2 ** 32 - 1
+
+
+def encode_frame(rows, compress_with='json', zlib_level=None):
+    ''' Encodes a list of rows into a single frame
+
+    Parameters:
+        rows (list):
+            The rows of data
+        compress_with (str):
+            The codec of the payload, json or msgpack.  Default is json.
+        zlib_level (int):
+            If set, the payload is also zlib-compressed with this level
+
+    Returns:
+        The frame bytes
+    '''
+
+    if compress_with not in _codecs:
+        raise BrainError('Unrecognized frame codec {0}'.format(compress_with))
+
+    payload = compress_data(list(rows), compress_with=compress_with)
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    flags = _codecs[compress_with]
+    if zlib_level is not None:
+        payload = zlib.compress(payload, zlib_level)
+        flags |= _ZLIB
+    if len(payload) > MAX_FRAME_SIZE:
+        raise BrainError('Frame payload too large; use a smaller batch size')
+    return _frame_header.pack(flags, len(payload)) + payload
+
+
+def encode_frames(rows, compress_with='json', batch_size=100, zlib_level=None):
+    ''' Encodes an iterable of rows into a framed stream
+
+    Meant to be used as the generator of a streamed Flask response, with the
+    `FRAMED_MIMETYPE` mimetype.
+
+    Parameters:
+        rows (iterable):
+            The rows of data, e.g. the results of a query
+        compress_with (str):
+            The codec of the payloads, json or msgpack.  Default is json.
+        batch_size (int):
+            The number of rows packed into each frame.  Default is 100.
+        zlib_level (int):
+            If set, the payloads are also zlib-compressed with this level
+
+    Returns:
+        A generator of the bytes of the stream header and of each frame
+
+    Example:
+        >>> stream = encode_frames(query.yield_per(1000), compress_with='msgpack')
+        >>> return Response(stream, mimetype=FRAMED_MIMETYPE)
+
+    '''
+
+    yield HEADER
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield encode_frame(batch, compress_with=compress_with, zlib_level=zlib_level)
+            batch = []
+    if batch:
+        yield encode_frame(batch, compress_with=compress_with, zlib_level=zlib_level)
+
+
+class FrameDecoder(object):
+    ''' Incrementally decodes a framed stream
+
+    Feed the chunks of the stream, as they are received, and get back the
+    rows of every complete frame.
+
+    Example:
+        >>> decoder = FrameDecoder()
+        >>> for chunk in response.iter_content(chunk_size=None):
+        >>>     rows.extend(decoder.feed(chunk))
+        >>> decoder.close()
+
+    '''
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._header = False
+        self.nframes = 0
+
+    def feed(self, chunk):
+        ''' Adds a chunk of the stream and returns the rows of the completed frames '''
+
+        self._buffer.extend(chunk)
+        rows = []
+
+        if not self._header:
+            if len(self._buffer) < len(HEADER):
+                return rows
+            if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+                raise BrainError('Data stream is not a Brain framed stream')
+            version = self._buffer[len(MAGIC)]
+            if version != VERSION:
+                raise BrainError('Unsupported Brain framing version {0}'.format(version))
+            del self._buffer[:len(HEADER)]
+            self._header = True
+
+        offset = 0
+        size = len(self._buffer)
+        view = memoryview(self._buffer)
+        try:
+            while size - offset >= _frame_header.size:
+                flags, length = _frame_header.unpack_from(self._buffer, offset)
+                end = offset + _frame_header.size + length
+                if end > size:
+                    break
+                payload = bytes(view[offset + _frame_header.size:end])
+                rows.extend(self._decode(flags, payload))
+                self.nframes += 1
+                offset = end
+        finally:
+            view.release()
+        del self._buffer[:offset]
+        return rows
+
+    @staticmethod
+    def _decode(flags, payload):
+        ''' Decodes the payload of a frame into its list of rows '''
+
+        if flags & _ZLIB:
+            payload = zlib.decompress(payload)
+        codec = _codec_names.get(flags & ~_ZLIB, None)
+        if codec is None:
+            raise BrainError('Unrecognized frame codec id {0}'.format(flags & ~_ZLIB))
+        return compress_data(payload, compress_with=codec, uncompress=True)
+
+    def close(self):
+        ''' Checks that the stream ended on a frame boundary '''
+
+        if self._buffer or not self._header:
+            raise BrainError('Data stream ended in the middle of a frame')
+
+
+def decode_frames(chunks):
+    ''' Decodes all the rows of a framed stream
+
+    Parameters:
+        chunks (bytes or iterable):
+            The whole stream, or an iterable of its chunks
+
+    Returns:
+        The list of rows
+    '''
+
+    if isinstance(chunks, (bytes, bytearray)):
+        chunks = [chunks]
+    decoder = FrameDecoder()
+    rows = []
+    for chunk in chunks:
+        rows.extend(decoder.feed(chunk))
+    decoder.close()
+    return rows
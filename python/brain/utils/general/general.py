@@ -1,12 +1,17 @@
 import os
+import hmac
+import atexit
 import decimal
 import datetime
+import inspect
+import threading
 import numpy as np
 import json
 import yaml
 from pkg_resources import parse_version
 from brain.core.exceptions import BrainError, BrainWarning
-from hashlib import md5
+from brain.utils.general.cache import TTLCache
+from hashlib import md5, sha256
 from passlib.apache import HtpasswdFile
 
 from flask import url_for
@@ -20,7 +25,9 @@ except ImportError:
 __all__ = ['getDbMachine', 'merge', 'convertIvarToErr', 'compress_data',
            'uncompress_data', 'inspection_authenticate', 'validate_user',
            'get_db_user', 'build_routemap', 'collaboration_authenticate',
-           'get_yaml_loader']
+           'get_yaml_loader', 'check_htpasswd', 'clear_login_cache',
+           'clear_collaboration_cache', 'UserStatsWriter', 'ivar_to_err', 'err_to_ivar',
+           'ivar_to_err_masked', 'err_to_ivar_masked']
 
 
 def getDbMachine():
@@ -90,18 +97,153 @@ def merge(user, default):
 
 
 def convertIvarToErr(ivar):
-    ''' Converts a list of inverse variance into an a list of standard errors '''
+    ''' Converts a list of inverse variance into an a list of standard errors
+
+    Returns a list for backwards compatibility.  Use `ivar_to_err` to work
+    directly with arrays.  As before, zero inverse variances give a zero
+    error, and negative or NaN ones give NaN.
+
+    '''
 
     assert isinstance(ivar, (list, np.ndarray)), 'Input ivar is not of type list or an Numpy ndarray'
 
-    if isinstance(ivar, list):
-        ivar = np.array(ivar)
+    ivar = np.asarray(ivar, dtype=np.float64)
+    error = ivar_to_err(ivar, fill=np.nan)
+    error[ivar == 0] = 0.0
+    return list(error)
+
+
+def _as_float_array(data):
+    ''' Returns data as an array, keeping floating dtypes and converting others to float64 '''
+
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    return data
+
+
+def _inverse_sqrt(data, out, square, fill):
+    ''' Computes 1/sqrt(data) or 1/data**2 where data > 0, and fill elsewhere '''
+
+    data = _as_float_array(data)
+    if out is None:
+        out = np.empty_like(data)
+    elif out.shape != data.shape:
+        raise ValueError('out has shape {0} instead of {1}'.format(out.shape, data.shape))
+
+    # the mask is computed first so out can be the input array itself
+    good = data > 0
+    if square:
+        np.square(data, out=out, where=good)
+    else:
+        np.sqrt(data, out=out, where=good)
+    np.reciprocal(out, out=out, where=good)
+    out[np.logical_not(good, out=good)] = fill
+    return out
+
+
+def ivar_to_err(ivar, out=None, fill=0.0):
+    ''' Converts inverse variances into standard errors
+
+    Works on arrays of any shape without copying them to Python objects.
+    Floating point inputs keep their dtype, e.g. float32 in gives float32 out,
+    and other inputs are converted to float64.
+
+    Parameters:
+        ivar (array_like):
+            The inverse variances
+        out (ndarray):
+            An optional output array, of the same shape as ivar.  Pass ivar itself
+            to convert it in place.
+        fill (float):
+            The error of zero, negative or NaN inverse variances.  Default is 0.
+
+    Returns:
+        The array of errors, 1 / sqrt(ivar)
+
+    Example:
+        >>> err = ivar_to_err(cube.ivar)
+        >>> ivar_to_err(flux_ivar, out=flux_ivar)
+
+    '''
+
+    return _inverse_sqrt(ivar, out, False, fill)
+
+
+def err_to_ivar(err, out=None, fill=0.0):
+    ''' Converts standard errors into inverse variances
+
+    The reverse of `ivar_to_err`, with the same dtype and ``out`` handling.
+
+    Parameters:
+        err (array_like):
+            The standard errors
+        out (ndarray):
+            An optional output array, of the same shape as err.  Pass err itself
+            to convert it in place.
+        fill (float):
+            The inverse variance of zero, negative or NaN errors.  Default is 0.
+
+    Returns:
+        The array of inverse variances, 1 / err**2
+
+    '''
+
+    return _inverse_sqrt(err, out, True, fill)
+
+
+def _masked(func, data, mask, out):
+    values = np.ma.getdata(data)
+    bad = ~np.isfinite(values)
+    bad |= ~(values > 0)
+    bad |= np.ma.getmaskarray(data)
+    if mask is not None:
+        bad |= np.asarray(mask, dtype=bool)
+    return np.ma.MaskedArray(func(values, out=out), mask=bad, copy=False)
 
-    error = np.zeros(ivar.shape)
-    notnull = ivar != 0.0
-    error[notnull] = 1 / np.sqrt(ivar[notnull])
-    error = list(error)
-    return error
+
+def ivar_to_err_masked(ivar, mask=None, out=None):
+    ''' Converts inverse variances into a masked array of standard errors
+
+    Zero, negative and non-finite inverse variances are masked, in addition
+    to the mask of ivar, if a masked array, and the ``mask`` argument.
+
+    Parameters:
+        ivar (array_like):
+            The inverse variances, optionally a masked array
+        mask (array_like):
+            An optional boolean mask, True for bad values
+        out (ndarray):
+            An optional output array for the errors
+
+    Returns:
+        A numpy masked array of the errors
+
+    '''
+
+    return _masked(ivar_to_err, ivar, mask, out)
+
+
+def err_to_ivar_masked(err, mask=None, out=None):
+    ''' Converts standard errors into a masked array of inverse variances
+
+    Zero, negative and non-finite errors are masked, in addition to the mask
+    of err, if a masked array, and the ``mask`` argument.
+
+    Parameters:
+        err (array_like):
+            The standard errors, optionally a masked array
+        mask (array_like):
+            An optional boolean mask, True for bad values
+        out (ndarray):
+            An optional output array for the inverse variances
+
+    Returns:
+        A numpy masked array of the inverse variances
+
+    '''
+
+    return _masked(err_to_ivar, err, mask, out)
 
 
 def alchemyencoder(obj):
@@ -246,16 +388,53 @@ def inspection_authenticate(session, username=None, password=None):
     return result
 
 
-def collaboration_authenticate(username=None, password=None, verbose=None):
+# The login caches are keyed on a salted digest of the credentials.  The salt
+# is random per process, so the digests are useless outside of it, and no
+# plaintext password is ever stored.
+_login_salt = os.urandom(32)
+
+# cache of the Trac authentication results; failed logins are only kept briefly
+_collab_cache = TTLCache(maxsize=1024, ttl=600)
+_collab_fail_cache = TTLCache(maxsize=1024, ttl=30)
+
+
+def _credential_digest(*parts):
+    ''' Returns a salted digest of a set of credentials '''
+    message = '\0'.join(str(part) for part in parts).encode('utf-8')
+    return hmac.new(_login_salt, message, sha256).hexdigest()
+
+
+def clear_collaboration_cache(username=None):
+    ''' Clears the cached Trac authentication results
+
+    Parameters:
+        username (str):
+            If set, only the results of this user are cleared
+    '''
+
+    if username is None:
+        _collab_cache.clear()
+        _collab_fail_cache.clear()
+    else:
+        _collab_cache.discard(lambda key: key[0] == username)
+        _collab_fail_cache.discard(lambda key: key[0] == username)
+
+
+def collaboration_authenticate(username=None, password=None, verbose=None, use_cache=True):
     ''' Authenticate with Trac using Collaboration
 
-    Authenticate using the SDSS collaboration python package
+    Authenticate using the SDSS collaboration python package.  Successful
+    authentications are cached for ten minutes, and failed ones for thirty
+    seconds, so repeated logins do not each make a remote call to Trac.  Use
+    `clear_collaboration_cache` to invalidate them.
 
     Parameters:
         username (str):
             The Trac username
         password (str):
             The Trac user password
+        use_cache (bool):
+            If False, always authenticate with Trac.  Default is True.
 
     Returns:
         A dictionary of user info specifying if the user has authenticated
@@ -263,6 +442,12 @@ def collaboration_authenticate(username=None, password=None, verbose=None):
 
     '''
 
+    key = (username, _credential_digest('trac', username, password))
+    if use_cache:
+        cached = _collab_cache.get(key) or _collab_fail_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
     result = {'is_valid': False, 'status': -1}
 
     # try to import the package
@@ -290,9 +475,75 @@ def collaboration_authenticate(username=None, password=None, verbose=None):
                 result['fullname'] = sdss4.fullname if sdss4 else ''
             else:
                 result['user'] = username
+
+        # only cache definite answers from Trac, not errors
+        if use_cache:
+            cache = _collab_cache if result['is_valid'] else _collab_fail_cache
+            cache.set(key, dict(result))
     return result
 
 
+# process-wide htpasswd files, reloaded only when the file changes on disk
+_htpass_files = {}
+_htpass_lock = threading.Lock()
+
+# short-lived cache of successful htpasswd logins
+_login_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+def _get_htpasswd(htpassfile):
+    ''' Returns the shared HtpasswdFile of a path, reloaded if the file changed '''
+
+    path = os.path.abspath(htpassfile)
+    with _htpass_lock:
+        htpass = _htpass_files.get(path, None)
+        if htpass is None:
+            htpass = HtpasswdFile(path)
+            _htpass_files[path] = htpass
+        elif htpass.load_if_changed():
+            # the file changed; forget the logins verified against the old one
+            _login_cache.discard(lambda key: key[0] == path)
+    return htpass
+
+
+def check_htpasswd(htpassfile, username, password):
+    ''' Checks a username and password against an htpasswd file
+
+    The htpasswd file is parsed once per process and only reloaded when it
+    changes on disk.  Successful checks are cached for a few minutes, keyed on
+    a salted digest of the credentials, so repeated logins skip the
+    deliberately slow password hash.
+
+    Parameters:
+        htpassfile (str):
+            The full path to the htpasswd file
+        username (str):
+            The login user id
+        password (str):
+            The login user password
+
+    Returns:
+        True if the password is valid for the user
+    '''
+
+    htpass = _get_htpasswd(htpassfile)
+    key = (htpass.path, _credential_digest(htpass.path, username, password))
+    if _login_cache.get(key):
+        return True
+
+    is_valid = bool(htpass.check_password(username, password))
+    if is_valid:
+        _login_cache.set(key, True)
+    return is_valid
+
+
+def clear_login_cache():
+    ''' Clears the cached htpasswd files and verified logins '''
+    with _htpass_lock:
+        _htpass_files.clear()
+    _login_cache.clear()
+
+
 def validate_user(username, password, htpassfile=None, request=None):
     ''' Validate the User with htpassfile or Trac
 
@@ -332,8 +583,7 @@ def validate_user(username, password, htpassfile=None, request=None):
     # validate user
     if username == 'sdss':
         if htpassfile:
-            htpass = HtpasswdFile(htpassfile)
-            is_valid = htpass.check_password(username, password)
+            is_valid = check_htpasswd(htpassfile, username, password)
             user = username
         else:
             result['error'] = 'No valid htpasswd file found!'
@@ -345,11 +595,178 @@ def validate_user(username, password, htpassfile=None, request=None):
     return is_valid, user, result
 
 
-def get_db_user(username, password, dbsession=None, user_model=None, request=None):
+def _snapshot_request(request):
+    ''' Returns a copy of a request that can be used after the request has ended '''
+
+    if request is None:
+        return None
+
+    from io import BytesIO
+    from werkzeug.wrappers import Request
+
+    environ = {key: val for key, val in request.environ.items()
+               if not key.startswith(('werkzeug.', 'brain.'))}
+    environ['wsgi.input'] = BytesIO()
+    environ['CONTENT_LENGTH'] = '0'
+    return Request(environ)
+
+
+class UserStatsWriter(object):
+    ''' Queues the login statistics of users and writes them in batches
+
+    Login statistics updates (``User.update_stats``) are queued in memory and
+    written by a background thread in a single transaction, every ``interval``
+    seconds or as soon as ``batch_size`` updates are queued.  Pending updates
+    are also written when the process exits.  Pass an instance as the
+    ``stats_writer`` of `get_db_user` to take the database write out of the
+    login request.  When a write fails, e.g. while the database is down, the
+    updates go back to the queue and are retried with the next batch.
+
+    The login time is taken when the update is queued.  It is passed as the
+    ``login_time`` of ``update_stats`` when the method accepts it, and
+    otherwise set as the ``last_login`` of the user after the update.
+
+    Parameters:
+        session_factory (callable):
+            A function returning a new SQLAlchemy session, e.g. a ``sessionmaker``.
+            The writer thread never shares the request sessions.
+        user_model (Model):
+            The SQLALchemy User ModelClass.  It must have the update_stats method.
+        interval (float):
+            The maximum number of seconds an update waits in the queue.  Default is 5.
+        batch_size (int):
+            The number of queued updates that triggers a write.  Default is 100.
+        start (bool):
+            If True, starts the writer thread right away.  Default is True.
+        max_queue (int):
+            The maximum number of queued updates.  When the queue is full, e.g.
+            after repeated write failures, the oldest updates are dropped.
+            Default is 10000.
+
+    '''
+
+    def __init__(self, session_factory, user_model, interval=5.0, batch_size=100, start=True,
+                 max_queue=10000):
+        assert hasattr(user_model, 'update_stats'), 'User Model must have the update_stats method!'
+        self.session_factory = session_factory
+        self.user_model = user_model
+        self._pass_time = 'login_time' in inspect.signature(user_model.update_stats).parameters
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._queue = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._atexit = False
+        if start:
+            self.start()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, username, request=None):
+        ''' Queues a login statistics update for a user '''
+
+        with self._lock:
+            self._queue.append((username, _snapshot_request(request), datetime.datetime.now()))
+            self._trim()
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        ''' Writes all the queued updates in a single transaction
+
+        Returns:
+            The number of updates written
+        '''
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._queue = self._queue, []
+            if not pending:
+                return 0
+
+            model = self.user_model
+            names = set(update[0] for update in pending)
+            session = None
+            try:
+                session = self.session_factory()
+                with session.begin():
+                    users = session.query(model).filter(model.username.in_(names)).all()
+                    users = {user.username: user for user in users}
+                    for username, req, login_time in pending:
+                        user = users.get(username, None)
+                        if user is None:
+                            continue
+                        if self._pass_time:
+                            user.update_stats(request=req, login_time=login_time)
+                        else:
+                            user.update_stats(request=req)
+                            if hasattr(user, 'last_login'):
+                                user.last_login = login_time
+            except Exception as e:
+                # put the updates back, ahead of the ones queued meanwhile
+                with self._lock:
+                    self._queue = pending + self._queue
+                    dropped = self._trim()
+                from brain import log
+                log.error('Could not write {0} user stats updates, retrying later ({1} dropped): '
+                          '{2}'.format(len(pending), dropped, e))
+                return 0
+            finally:
+                if session is not None:
+                    session.close()
+            return len(pending)
+
+    def _trim(self):
+        ''' Drops the oldest updates beyond max_queue.  Must hold the lock. '''
+
+        dropped = max(0, len(self._queue) - self.max_queue)
+        if dropped:
+            del self._queue[:dropped]
+        return dropped
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        ''' Starts the background writer thread '''
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='brain-user-stats')
+        self._thread.daemon = True
+        self._thread.start()
+        if not self._atexit:
+            atexit.register(self.stop)
+            self._atexit = True
+
+    def stop(self):
+        ''' Stops the writer thread and writes the pending updates '''
+
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+def get_db_user(username, password, dbsession=None, user_model=None, request=None,
+                stats_writer=None):
     ''' Get a User from a database session
 
     Gets a User object from the database User table.  If the User does not exists,
-    adds the User.
+    adds the User.  New users are always added right away, while the login
+    statistics of existing users can be deferred to a `UserStatsWriter`.
 
     Parameters:
         username (str):
@@ -362,6 +779,9 @@ def get_db_user(username, password, dbsession=None, user_model=None, request=Non
             The SQLALchemy User ModelClass
         request (Request):
             The Flask request object
+        stats_writer (UserStatsWriter):
+            If set, the login statistics update of an existing user is queued to
+            be written in a batch, instead of written in this call.
 
     Returns:
         The database User object.
@@ -376,6 +796,10 @@ def get_db_user(username, password, dbsession=None, user_model=None, request=Non
         assert hasattr(user_model, 'check_password'), 'User Model must have the check_password method!'
 
     user = dbsession.query(user_model).filter(user_model.username == username).one_or_none()
+    if user and stats_writer is not None:
+        stats_writer.add(username, request=request)
+        return user
+
     with dbsession.begin():
         if not user:
             # add new user
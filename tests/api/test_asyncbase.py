@@ -0,0 +1,134 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import asyncio
+import time
+import pytest
+from flask import Flask, jsonify, request
+
+from brain.api.asyncbase import AsyncBrainBaseView, asgi_app
+from brain.utils.general.decorators import public
+
+pytest.importorskip('asgiref')
+
+
+def slow(value):
+    time.sleep(0.1)
+    return value
+
+
+class AsyncView(AsyncBrainBaseView):
+    route_base = '/async/'
+
+    @public
+    async def index(self):
+        data = await self._gather(self._run_sync(slow, 1), self._run_sync(slow, 2))
+        self.update_results({'data': data, 'status': 1})
+        return jsonify(self.results)
+
+    @public
+    def sync(self):
+        self.update_results({'data': 'sync', 'status': 1})
+        return jsonify(self.results)
+
+    @public
+    async def nap(self):
+        await asyncio.sleep(0.3)
+        return jsonify({'data': 'nap', 'status': 1})
+
+    @public
+    async def path(self):
+        path = await self._run_sync(lambda: request.path)
+        return jsonify({'data': path, 'status': 1})
+
+    async def private(self):
+        return jsonify(self.results)
+
+
+@pytest.fixture()
+def client():
+    app = Flask(__name__)
+    AsyncView.register(app, route_prefix='/api/')
+    yield app.test_client()
+
+
+def test_async_view(client):
+    t0 = time.time()
+    resp = client.get('/api/async/')
+    assert time.time() - t0 < 0.18
+    assert resp.get_json()['data'] == [1, 2]
+    assert resp.get_json()['status'] == 1
+
+
+def test_sync_view(client):
+    resp = client.get('/api/async/sync/')
+    assert resp.get_json()['data'] == 'sync'
+
+
+def test_run_sync_context(client):
+    resp = client.get('/api/async/path/')
+    assert resp.get_json()['data'] == '/api/async/path/'
+
+
+def test_auth(client):
+    resp = client.get('/api/async/private/')
+    assert 'Brain Authorization Error' in resp.get_json()['error']
+
+
+def test_results_reset(client):
+    client.get('/api/async/')
+    resp = client.get('/api/async/private/', headers={'Authorization': 'Bearer x'})
+    assert resp.get_json()['data'] is None
+
+
+def test_asgi_app():
+    app = Flask(__name__)
+    assert callable(asgi_app(app))
+
+
+async def asgi_get(app, path):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'root_path': '',
+             'query_string': b'', 'headers': [], 'http_version': '1.1',
+             'server': ('testserver', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+def test_asgi_concurrent_requests():
+    app = Flask(__name__)
+    AsyncView.register(app, route_prefix='/api/')
+    asgi = asgi_app(app, workers=4)
+
+    async def run():
+        return await asyncio.gather(*[asgi_get(asgi, '/api/async/nap/') for i in range(4)])
+
+    t0 = time.time()
+    responses = asyncio.run(run())
+    # four 0.3 s requests, run concurrently and not one after another
+    assert time.time() - t0 < 0.9
+    assert [messages[0]['status'] for messages in responses] == [200] * 4
+    assert all(b'nap' in messages[1]['body'] for messages in responses)
+
+
+def test_asgi_workers():
+    app = Flask(__name__)
+    AsyncView.register(app, route_prefix='/api/')
+    asgi = asgi_app(app, workers=2)
+
+    async def run():
+        return await asyncio.gather(*[asgi_get(asgi, '/api/async/nap/') for i in range(4)])
+
+    t0 = time.time()
+    responses = asyncio.run(run())
+    # at most two requests at once, so two rounds of 0.3 s
+    assert 0.6 <= time.time() - t0 < 1.2
+    assert [messages[0]['status'] for messages in responses] == [200] * 4
@@ -0,0 +1,100 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+from flask import Flask, jsonify
+from flask_classful import route
+
+from brain.api.base import BrainBaseView
+from brain.api.caching import (MemoryResponseCache, DiskResponseCache, CachedResponse,
+                               response_cache_key)
+from brain.utils.general.decorators import cached, public
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def backend(request, tmpdir):
+    if request.param == 'memory':
+        yield MemoryResponseCache()
+    else:
+        yield DiskResponseCache(str(tmpdir.join('cache')))
+
+
+@pytest.fixture()
+def client(backend):
+
+    class CachedView(BrainBaseView):
+        route_base = '/cached/'
+        calls = []
+
+        @public
+        @cached(backend=backend)
+        @route('/<name>/', endpoint='getname')
+        def getName(self, name):
+            self.calls.append(name)
+            self.update_results({'data': name, 'status': 1})
+            return jsonify(self.results)
+
+        @cached(backend=backend)
+        @route('/private/<name>/', endpoint='getprivate')
+        def getPrivate(self, name):
+            self.calls.append(name)
+            self.update_results({'data': name, 'status': 1})
+            return jsonify(self.results)
+
+    app = Flask(__name__)
+    CachedView.register(app, route_prefix='/api/')
+    client = app.test_client()
+    client.view = CachedView
+    client.func = app.view_functions['getname']
+    yield client
+
+
+def test_key():
+    prefix, key = response_cache_key('ep', 'MPL-5', {'b': 1, 'a': 2, 'session_id': 'x'},
+                                     ignore=('session_id',))
+    assert prefix == ('ep', 'MPL-5')
+    assert key == response_cache_key('ep', 'MPL-5', {'a': 2, 'b': 1})[1]
+
+
+def test_backend(backend):
+    key = response_cache_key('ep', 'MPL-5', {'a': 1})
+    assert backend.get(key) is None
+    backend.set(key, CachedResponse(b'{"a": 1}'))
+    assert backend.get(key).body == b'{"a": 1}'
+    assert backend.invalidate(release='MPL-4') == 0
+    assert backend.invalidate(endpoint='ep', release='MPL-5') == 1
+    assert backend.get(key) is None
+
+
+def test_cached_route(client):
+    resp = client.get('/api/cached/a/?release=MPL-5&session_id=1')
+    assert resp.headers['X-Brain-Cache'] == 'miss'
+    resp = client.get('/api/cached/a/?release=MPL-5&session_id=2')
+    assert resp.headers['X-Brain-Cache'] == 'hit'
+    assert resp.get_json()['data'] == 'a'
+    client.get('/api/cached/a/?release=MPL-4')
+    client.get('/api/cached/b/?release=MPL-5')
+    assert client.view.calls == ['a', 'a', 'b']
+
+
+def test_invalidate(client):
+    client.get('/api/cached/a/?release=MPL-5')
+    assert client.func.invalidate(release='MPL-5') == 1
+    resp = client.get('/api/cached/a/?release=MPL-5')
+    assert resp.headers['X-Brain-Cache'] == 'miss'
+
+
+def test_invalidate_unserved(client, backend):
+    # e.g. a response cached on disk by another worker
+    backend.set(response_cache_key('getname', 'MPL-5', {'release': 'MPL-5'},
+                                   view_args={'name': 'a'}), CachedResponse(b'{}'))
+    assert client.func.cache_endpoints == {'getname'}
+    assert client.func.invalidate(release='MPL-5') == 1
+
+
+def test_per_user(client):
+    for token in ('a', 'b', 'a'):
+        resp = client.get('/api/cached/private/x/', headers={'Authorization': 'Bearer ' + token})
+        assert resp.get_json()['data'] == 'x'
+    assert client.view.calls == ['x', 'x']
@@ -0,0 +1,84 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+from flask import jsonify
+from flask_classful import route
+
+from brain.api.base import BrainBaseView
+from brain.utils.general.decorators import cache_control, cached, public
+
+
+class ConditionalView(BrainBaseView):
+    route_base = '/cond/'
+    calls = []
+
+    @cache_control(max_age=3600)
+    def index(self):
+        self.update_results({'data': 'controlled', 'status': 1})
+        return jsonify(self.results)
+
+    @public
+    @cached()
+    @route('/cached/', endpoint='condcached')
+    def getCached(self):
+        self.calls.append(1)
+        self.update_results({'data': 'cached', 'status': 1})
+        return jsonify(self.results)
+
+    def private(self):
+        return jsonify(self.results)
+
+    @cache_control(max_age=60, public=True)
+    def shared(self):
+        self.update_results({'data': 'shared', 'status': 1})
+        return jsonify(self.results)
+
+
+@pytest.fixture()
+def client(app):
+    ConditionalView.register(app, route_prefix='/api/')
+    yield app.test_client()
+
+
+def test_public_route(client):
+    resp = client.get('/api/general/getroutemap/')
+    etag = resp.headers['ETag']
+    assert 'public' in resp.headers['Cache-Control']
+    assert 'no-cache' in resp.headers['Cache-Control']
+    resp = client.get('/api/general/getroutemap/', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_cache_control(client):
+    resp = client.get('/api/cond/', headers={'Authorization': 'Bearer x'})
+    assert 'max-age=3600' in resp.headers['Cache-Control']
+    assert 'private' in resp.headers['Cache-Control']
+    assert 'public' not in resp.headers['Cache-Control']
+    assert 'ETag' in resp.headers
+
+
+def test_cache_control_public_opt_in(client):
+    resp = client.get('/api/cond/shared/', headers={'Authorization': 'Bearer x'})
+    assert 'public' in resp.headers['Cache-Control']
+    assert 'max-age=60' in resp.headers['Cache-Control']
+
+
+def test_not_cacheable(client):
+    resp = client.get('/api/cond/private/', headers={'Authorization': 'Bearer x'})
+    assert 'ETag' not in resp.headers
+    assert 'Cache-Control' not in resp.headers
+
+
+def test_cached_304(client):
+    resp = client.get('/api/cond/cached/')
+    etag = resp.headers['ETag']
+    resp = client.get('/api/cond/cached/')
+    assert resp.headers['ETag'] == etag
+    assert 'Last-Modified' in resp.headers
+    resp = client.get('/api/cond/cached/', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert 'public' in resp.headers['Cache-Control']
+    assert ConditionalView.calls == [1]
@@ -0,0 +1,115 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import os
+import threading
+import pytest
+
+from brain.api.base import BrainBaseView
+from brain.api.metrics import Metrics
+
+
+@pytest.fixture()
+def metrics(monkeypatch):
+    mm = Metrics()
+    monkeypatch.setattr(BrainBaseView, 'metrics', mm)
+    yield mm
+
+
+def test_observe():
+    mm = Metrics(buckets=(0.1, 1.0))
+    mm.observe('ep', 'GET', 200, 0.05, size=10)
+    mm.observe('ep', 'GET', 200, 0.5, size=30)
+    mm.observe('ep', 'GET', 500, 5.0)
+    data = mm.collect()
+    assert data['requests'] == {'ep|GET|200': 2, 'ep|GET|500': 1}
+    assert data['latency']['ep']['buckets'] == [1, 1]
+    assert data['latency']['ep']['count'] == 3
+    assert data['sizes']['ep'] == {'sum': 40, 'count': 2}
+
+
+def test_aggregate_processes(tmpdir):
+    path = str(tmpdir.join('metrics'))
+    worker = Metrics(path=path, flush_interval=0)
+    worker.observe('ep', 'GET', 200, 0.01)
+    # fake two other worker processes
+    for pid in (1, 2):
+        tmpdir.join('metrics', 'metrics_{0}.json'.format(pid)).write(
+            open(worker._process_file).read())
+
+    mm = Metrics(path=path)
+    mm.observe('ep', 'GET', 200, 0.01)
+    assert mm.collect()['requests']['ep|GET|200'] == 3
+
+
+def test_concurrent_flush(tmpdir):
+    path = str(tmpdir.join('metrics'))
+    mm = Metrics(path=path, flush_interval=0)
+    threads = [threading.Thread(target=lambda: [mm.observe('ep', 'GET', 200, 0.01)
+                                                for i in range(50)]) for j in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    mm.flush()
+    assert os.listdir(path) == [os.path.basename(mm._process_file)]
+    assert mm.collect()['requests']['ep|GET|200'] == 400
+
+
+def test_flush_error(tmpdir, mocker):
+    mm = Metrics(path=str(tmpdir.join('metrics')), flush_interval=0)
+    mocker.patch('brain.api.metrics.os.replace', side_effect=OSError('disk full'))
+    mm.observe('ep', 'GET', 200, 0.01)
+    assert mm.snapshot()['requests'] == {'ep|GET|200': 1}
+    assert tmpdir.join('metrics').listdir() == []
+    with pytest.raises(OSError):
+        mm.flush()
+
+
+def test_render():
+    mm = Metrics(buckets=(0.1,))
+    mm.observe('ep', 'POST', 404, 0.05, size=5)
+    text = mm.render()
+    assert 'brain_requests_total{endpoint="ep",method="POST",status="404"} 1' in text
+    assert 'brain_request_errors_total{endpoint="ep",status="404"} 1' in text
+    assert 'brain_request_duration_seconds_bucket{endpoint="ep",le="0.1"} 1' in text
+    assert 'brain_request_duration_seconds_bucket{endpoint="ep",le="+Inf"} 1' in text
+    assert 'brain_response_size_bytes_sum{endpoint="ep"} 5' in text
+
+
+def test_metrics_route(client, metrics):
+    client.get('/api/general/getroutemap/')
+    client.get('/api/general/')
+    resp = client.get('/api/general/metrics/', headers={'Authorization': 'Bearer abc'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    text = resp.get_data(as_text=True)
+    assert 'endpoint="getroutemap",method="GET",status="200"' in text
+    assert 'endpoint="BrainGeneralRequestsView:index",method="GET",status="200"' in text
+
+
+def test_metrics_requires_auth(client, metrics):
+    client.get('/api/general/getroutemap/')
+    resp = client.get('/api/general/metrics/')
+    assert resp.mimetype == 'application/json'
+    assert 'Authorization is required' in resp.json['error']
+    assert 'brain_requests_total' not in resp.get_data(as_text=True)
+
+
+def test_metrics_disabled(client):
+    resp = client.get('/api/general/metrics/', headers={'Authorization': 'Bearer abc'})
+    assert resp.status_code == 404
+
+
+def test_view_error(app, client, metrics, mocker):
+    mocker.patch('brain.api.general.build_routemap', side_effect=RuntimeError('boom'))
+    # propagated exceptions are recorded at teardown
+    with pytest.raises(RuntimeError):
+        client.get('/api/general/getroutemap/')
+    assert metrics.snapshot()['requests'] == {'getroutemap|GET|500': 1}
+    # and the error responses by the app after_request
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    resp = client.get('/api/general/getroutemap/')
+    assert resp.status_code == 500
+    assert metrics.snapshot()['requests'] == {'getroutemap|GET|500': 2}
@@ -0,0 +1,112 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from flask import Flask, Request
+from flask_classful import route
+
+from brain.api.base import BrainBaseView
+from brain.api.params import (Param, ParamSchema, BrainValidationError, parse_route_path,
+                              get_params)
+from brain.utils.general.decorators import parseParams, public
+
+
+schema = ParamSchema(Param('release', required=True),
+                     Param('limit', int, default=100),
+                     Param('ratio', float),
+                     Param('flag', bool, default=False),
+                     Param('names', multiple=True),
+                     Param('mode', choices=['local', 'remote']))
+
+
+class ParamView(BrainBaseView):
+    route_base = '/params/'
+
+    @public
+    @route('/<path:path>', endpoint='getparams')
+    @parseParams(schema)
+    def getParams(self, **kwargs):
+        self.update_results({'data': kwargs, 'status': 1})
+        return self.results['data']
+
+    @public
+    @route('/typed/<limit>/<name>/', endpoint='gettyped')
+    @parseParams(schema)
+    def getTyped(self, **kwargs):
+        return kwargs
+
+
+@pytest.fixture()
+def client():
+    app = Flask(__name__)
+    ParamView.register(app, route_prefix='/api/')
+    yield app.test_client()
+
+
+def test_parse():
+    out = schema.parse({'release': 'MPL-5', 'limit': '10', 'flag': 'true',
+                        'names': ['a', 'b'], 'mode': 'local'})
+    assert out == {'release': 'MPL-5', 'limit': 10, 'ratio': None, 'flag': True,
+                   'names': ['a', 'b'], 'mode': 'local'}
+
+
+def test_parse_override():
+    out = schema.parse({'release': 'MPL-4', 'names': 'a,b'}, {'release': 'MPL-5'})
+    assert out['release'] == 'MPL-5'
+    assert out['names'] == ['a', 'b']
+
+
+def test_parse_errors():
+    with pytest.raises(BrainValidationError) as cm:
+        schema.parse({'limit': 'ten', 'mode': 'bad'})
+    assert set(cm.value.errors) == {'release', 'limit', 'mode'}
+
+
+def test_route_path():
+    assert parse_route_path('a=1/b=2/') == {'a': '1', 'b': '2'}
+    assert parse_route_path('') == {}
+    assert parse_route_path('a=b=c') == {'a': 'b=c'}
+
+
+@pytest.mark.parametrize('path', ['a', 'a=1/b', '=1'])
+def test_route_path_invalid(path):
+    with pytest.raises(BrainValidationError):
+        parse_route_path(path)
+
+
+def test_get_params_cached():
+    ee = EnvironBuilder(method='POST', path='post', json={'release': 'MPL-5', 'limit': 5})
+    rr = Request(ee.get_environ())
+    out = get_params(rr, schema)
+    assert out['limit'] == 5
+    out['limit'] = 0
+    assert get_params(rr, schema)['limit'] == 5
+    assert len(rr.environ['brain.params']) == 1
+
+
+def test_view(client):
+    resp = client.get('/api/params/limit=3/ratio=0.5/?release=MPL-5&names=a&names=b')
+    data = resp.get_json()
+    assert data['limit'] == 3
+    assert data['ratio'] == 0.5
+    assert data['names'] == ['a', 'b']
+
+
+def test_view_invalid(client):
+    resp = client.get('/api/params/limit=x/')
+    assert resp.status_code == 422
+    assert 'release' in resp.get_json()['validation_errors']
+
+
+def test_view_invalid_path(client):
+    resp = client.get('/api/params/limit=3/oops/?release=MPL-5')
+    assert resp.status_code == 422
+    assert 'oops' in resp.get_json()['validation_errors']
+
+
+def test_view_route_kwargs(client):
+    data = client.get('/api/params/typed/3/cube/?release=MPL-5&limit=7').get_json()
+    assert data['limit'] == 7
+    assert data['name'] == 'cube'
@@ -0,0 +1,73 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import os
+import threading
+import time
+import pytest
+
+from brain.api.base import BrainBaseView
+from brain.api.profiling import RequestProfiler, SamplingProfiler
+
+
+@pytest.fixture()
+def profiler(monkeypatch, tmpdir):
+    pp = RequestProfiler(secret='sekret', path=str(tmpdir.join('profiles')))
+    monkeypatch.setattr(BrainBaseView, 'profiler', pp)
+    yield pp
+
+
+def test_sampling():
+    sp = SamplingProfiler(interval=0.001)
+    sp.start()
+    end = time.time() + 0.05
+    while time.time() < end:
+        sum(range(100))
+    sp.stop()
+    assert sp.nsamples > 0
+    assert 'test_sampling' in sp.report()
+
+
+def test_not_profiled(client, profiler):
+    resp = client.get('/api/general/getroutemap/')
+    assert 'X-Brain-Profile-Id' not in resp.headers
+    resp = client.get('/api/general/getroutemap/', headers={'X-Brain-Profile': 'wrong'})
+    assert 'X-Brain-Profile-Id' not in resp.headers
+
+
+@pytest.mark.parametrize('mode, ext', [('deterministic', 'prof'), ('sampling', 'folded')])
+def test_stored(client, profiler, mode, ext):
+    resp = client.get('/api/general/getroutemap/',
+                      headers={'X-Brain-Profile': 'sekret', 'X-Request-ID': 'abc123',
+                               'X-Brain-Profile-Mode': mode})
+    assert resp.status_code == 200
+    assert resp.headers['X-Brain-Profile-Id'] == 'abc123'
+    assert os.path.exists(os.path.join(profiler.path, 'abc123.{0}'.format(ext)))
+
+
+def test_attached(client, profiler):
+    resp = client.get('/api/general/getroutemap/?profile=sekret&profile_output=attach')
+    assert resp.mimetype == 'text/plain'
+    assert 'attachment' in resp.headers['Content-Disposition']
+    assert resp.headers['X-Brain-Profile-Status'] == '200'
+    assert 'buildRouteMap' in resp.get_data(as_text=True)
+
+
+def test_strip(profiler):
+    form = profiler.strip({'release': 'MPL-5', 'profile': 'sekret'})
+    assert form == {'release': 'MPL-5'}
+
+
+@pytest.mark.parametrize('mode', ['deterministic', 'sampling'])
+def test_view_error(client, profiler, mocker, mode):
+    mocker.patch('brain.api.general.build_routemap', side_effect=RuntimeError('boom'))
+    headers = {'X-Brain-Profile': 'sekret', 'X-Brain-Profile-Mode': mode}
+    with pytest.raises(RuntimeError):
+        client.get('/api/general/getroutemap/', headers=headers)
+    assert 'brain-sampling-profiler' not in [tt.name for tt in threading.enumerate()]
+
+    # the profiler was stopped, so this thread can be profiled again
+    mocker.stopall()
+    resp = client.get('/api/general/getroutemap/', headers=headers)
+    assert 'X-Brain-Profile-Id' in resp.headers
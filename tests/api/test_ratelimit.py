@@ -0,0 +1,120 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from flask import Request
+
+from brain.api.base import BrainBaseView
+from brain.api.ratelimit import RateLimit, RateLimiter, MemoryBucketStore, SQLiteBucketStore
+
+
+def make_request(headers=None, remote_addr='1.2.3.4'):
+    ee = EnvironBuilder(method='GET', path='get', headers=headers,
+                        environ_base={'REMOTE_ADDR': remote_addr})
+    return Request(ee.get_environ())
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmpdir):
+    if request.param == 'memory':
+        yield MemoryBucketStore()
+    else:
+        yield SQLiteBucketStore(str(tmpdir.join('buckets.db')))
+
+
+@pytest.fixture()
+def limited(monkeypatch):
+    limiter = RateLimiter(default=RateLimit(2, per=60))
+    monkeypatch.setattr(BrainBaseView, 'limiter', limiter)
+    yield limiter
+
+
+def test_bucket_refill(store):
+    limiter = RateLimiter(default=RateLimit(1, burst=2), store=store)
+    rr = make_request()
+    assert limiter.check(rr, 'ep', now=0)[0] is True
+    assert limiter.check(rr, 'ep', now=0)[0] is True
+    allowed, wait = limiter.check(rr, 'ep', now=0)
+    assert allowed is False
+    assert wait == pytest.approx(1.0)
+    assert limiter.check(rr, 'ep', now=1.0)[0] is True
+
+
+@pytest.mark.parametrize('key, headers, exp',
+                         [('auto', {'Authorization': 'Bearer abc'}, 'token:'),
+                          ('auto', None, 'ip:1.2.3.4'),
+                          ('ip', {'Authorization': 'Bearer abc'}, 'ip:1.2.3.4'),
+                          ('user', {'Authorization': 'Basic dGVzdDp0ZXN0'}, 'user:test')],
+                         ids=['token', 'auto-ip', 'ip', 'user'])
+def test_identify(key, headers, exp):
+    limit = RateLimit(1, key=key)
+    ident = limit.identify(make_request(headers=headers))
+    assert ident.startswith(exp)
+    assert 'abc' not in ident
+
+
+def test_separate_clients():
+    limiter = RateLimiter(default=RateLimit(1, per=60))
+    assert limiter.check(make_request(remote_addr='1.1.1.1'), 'ep', now=0)[0] is True
+    assert limiter.check(make_request(remote_addr='2.2.2.2'), 'ep', now=0)[0] is True
+    assert limiter.check(make_request(remote_addr='1.1.1.1'), 'ep', now=0)[0] is False
+
+
+def test_view_429(client, limited):
+    for i in range(2):
+        resp = client.get('/api/general/getroutemap/')
+        assert resp.status_code == 200
+    resp = client.get('/api/general/getroutemap/')
+    assert resp.status_code == 429
+    assert int(resp.headers['Retry-After']) > 0
+    assert resp.get_json()['status'] == -1
+
+
+def test_endpoint_limit(client, limited):
+    limited.limits['getroutemap'] = RateLimit(1, per=60)
+    assert client.get('/api/general/getroutemap/').status_code == 200
+    assert client.get('/api/general/getroutemap/').status_code == 429
+
+
+def test_prune_own_rate():
+    store = MemoryBucketStore(maxsize=2, prune_interval=0)
+    store.consume('slow', 1 / 100, 1, now=0)
+    store.consume('fast', 1, 1, now=0)
+    # at t=10 the fast bucket has refilled but the slow one has not
+    store.consume('new', 1, 1, now=10)
+    assert sorted(store._buckets) == ['new', 'slow']
+
+
+def test_prune_interval():
+    store = MemoryBucketStore(maxsize=2, prune_interval=60)
+    for ii, key in enumerate('abc'):
+        store.consume(key, 1, 10, now=ii)
+    assert sorted(store._buckets) == ['b', 'c']
+    # not scanned again yet, so the idle c is kept and the least recently used b goes
+    store.consume('a', 1, 10, now=30)
+    assert sorted(store._buckets) == ['a', 'c']
+
+
+def test_ip_limit_before_auth(client, monkeypatch):
+    limiter = RateLimiter(ip_limit=RateLimit(2, per=60))
+    monkeypatch.setattr(BrainBaseView, 'limiter', limiter)
+    # changing the unverified Authorization header does not give a new bucket
+    headers = {'Authorization': 'Bearer abc'}
+    assert client.get('/api/general/getroutemap/').status_code == 200
+    assert client.get('/api/general/getroutemap/', headers=headers).status_code == 200
+    resp = client.get('/api/general/getroutemap/', headers={'Authorization': 'Bearer xyz'})
+    assert resp.status_code == 429
+
+
+def test_exempt_route(client, monkeypatch):
+    limiter = RateLimiter(default=RateLimit(1, per=60), ip_limit=RateLimit(1, per=60))
+    monkeypatch.setattr(BrainBaseView, 'limiter', limiter)
+    headers = {'Authorization': 'Bearer abc'}
+    for __ in range(3):
+        resp = client.get('/api/general/metrics/', headers=headers)
+        assert resp.status_code != 429
+    # the scrapes did not use the address bucket of the other routes
+    assert client.get('/api/general/getroutemap/', headers=headers).status_code == 200
+    assert client.get('/api/general/getroutemap/', headers=headers).status_code == 429
@@ -0,0 +1,120 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+
+from brain.api.base import BrainBaseView
+from brain.api.tokens import TokenVerifier
+from brain.core.exceptions import BrainError
+
+
+class Clock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Decoder(object):
+    ''' a fake token decoder counting its calls '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        if token.startswith('bad'):
+            raise ValueError('Signature verification failed')
+        return {'sub': token, 'jti': token + '-id', 'exp': 100}
+
+
+@pytest.fixture()
+def decoder():
+    yield Decoder()
+
+
+def test_cached(decoder):
+    tv = TokenVerifier(decoder, timer=Clock())
+    assert tv.verify('abc')['sub'] == 'abc'
+    assert tv.verify('abc')['sub'] == 'abc'
+    assert decoder.calls == 1
+    assert tv.stats['hits'] == 1
+    assert tv.stats['misses'] == 1
+
+
+def test_invalid(decoder):
+    tv = TokenVerifier(decoder)
+    with pytest.raises(BrainError, match='Signature verification failed'):
+        tv.verify('bad')
+
+
+def test_expiry(decoder):
+    clock = Clock()
+    tv = TokenVerifier(decoder, ttl=1000, timer=clock)
+    tv.verify('abc')
+    clock.now = 100
+    with pytest.raises(BrainError, match='expired'):
+        tv.verify('abc')
+    assert decoder.calls == 2
+
+
+@pytest.mark.parametrize('by', ['token', 'jti'])
+def test_revoke(decoder, by):
+    tv = TokenVerifier(decoder, timer=Clock())
+    tv.verify('abc')
+    if by == 'token':
+        tv.revoke(token='abc')
+    else:
+        tv.revoke(jti='abc-id')
+    with pytest.raises(BrainError, match='revoked'):
+        tv.verify('abc')
+
+
+def test_revocations_not_evicted(decoder):
+    clock = Clock()
+    tv = TokenVerifier(decoder, maxsize=2, timer=clock)
+    tokens = ['tok{0}'.format(ii) for ii in range(5)]
+    for token in tokens:
+        tv.verify(token)
+        tv.revoke(token=token, expires=50)
+    for token in tokens:
+        with pytest.raises(BrainError, match='revoked'):
+            tv.verify(token)
+
+    # expired revocations are forgotten
+    clock.now = 60
+    tv.revoke(jti='other-id')
+    assert list(tv._revoked) == [('jti', 'other-id')]
+    assert tv.verify('tok0')['sub'] == 'tok0'
+
+
+def test_revoke_same_expiry(decoder):
+    clock = Clock()
+    tv = TokenVerifier(decoder, timer=clock)
+    tv.revoke(token='abc', jti='xyz-id', expires=50)
+    tv.revoke(token='def', expires=50)
+    for token in ['abc', 'def', 'xyz']:
+        with pytest.raises(BrainError, match='revoked'):
+            tv.verify(token)
+
+    clock.now = 60
+    tv.revoke(jti='other-id')
+    assert list(tv._revoked) == [('jti', 'other-id')]
+
+
+def test_is_revoked(decoder):
+    tv = TokenVerifier(decoder, timer=Clock(), is_revoked=lambda claims: claims['sub'] == 'abc')
+    with pytest.raises(BrainError, match='revoked'):
+        tv.verify('abc')
+
+
+def test_view(monkeypatch, app, decoder):
+    monkeypatch.setattr(BrainBaseView, 'token_verifier', TokenVerifier(decoder, timer=Clock()))
+    client = app.test_client()
+    resp = client.get('/api/general/', headers={'Authorization': 'Bearer bad'})
+    assert 'Invalid token' in resp.get_json()['error']
+    for i in range(2):
+        resp = client.get('/api/general/', headers={'Authorization': 'Bearer abc'})
+        assert resp.get_json()['data'] == 'this is a general Brain Function!'
+    assert decoder.calls == 2
@@ -12,11 +12,26 @@ from __future__ import print_function, division, absolute_import
 
 import os
 import pytest
+from flask import Flask
 from brain import bconfig
+from brain.api.general import BrainGeneralRequestsView
 from requests.utils import get_netrc_auth
 
 
 
+@pytest.fixture()
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    BrainGeneralRequestsView.register(app, route_prefix='/api/')
+    yield app
+
+
+@pytest.fixture()
+def client(app):
+    yield app.test_client()
+
+
 @pytest.fixture()
 def netrc(monkeypatch, tmpdir):
     tmpnet = tmpdir.mkdir('netrc').join('.netrc')
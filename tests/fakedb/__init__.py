@@ -0,0 +1,11 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Licensed under a 3-clause BSD license.
+#
+# A small set of model classes, split in two schemas, used to test the
+# ModelGraph without a database.
+
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
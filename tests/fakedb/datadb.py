@@ -0,0 +1,69 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Licensed under a 3-clause BSD license.
+
+from sqlalchemy import Column, Integer, Float, String, ForeignKey
+from tests.fakedb import Base
+from tests.fakedb import sampledb  # noqa, the foreign keys refer to its tables
+
+schema = 'datadb'
+
+
+class IFUDesign(Base):
+    __tablename__ = 'ifudesign'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    name = Column(String)
+    nfiber = Column(Integer)
+
+
+class Wavelength(Base):
+    __tablename__ = 'wavelength'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    bintype = Column(String)
+
+
+class Cube(Base):
+    __tablename__ = 'cube'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    plateifu = Column(String)
+    ifudesign_pk = Column(Integer, ForeignKey('datadb.ifudesign.pk'))
+    wavelength_pk = Column(Integer, ForeignKey('datadb.wavelength.pk'))
+    manga_target_pk = Column(Integer, ForeignKey('sampledb.manga_target.pk'))
+    replaced_ifudesign_pk = Column(Integer, ForeignKey('datadb.ifudesign.pk'))
+
+
+class Fibers(Base):
+    __tablename__ = 'fibers'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    fiberid = Column(Integer)
+    ifudesign_pk = Column(Integer, ForeignKey('datadb.ifudesign.pk'))
+    wavelength_pk = Column(Integer, ForeignKey('datadb.wavelength.pk'))
+
+
+class Flux(Base):
+    __tablename__ = 'flux'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    value = Column(Float)
+    wavelength_pk = Column(Integer, ForeignKey('datadb.wavelength.pk'))
+
+
+class Spaxel(Base):
+    __tablename__ = 'spaxel'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    x = Column(Integer)
+    y = Column(Integer)
+    cube_pk = Column(Integer, ForeignKey('datadb.cube.pk'))
+
+
+class MaskBit(Base):
+    __tablename__ = 'maskbit'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    bit = Column(Integer)
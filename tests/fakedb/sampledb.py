@@ -0,0 +1,40 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Licensed under a 3-clause BSD license.
+
+from sqlalchemy import Column, Integer, Float, String, ForeignKey
+from tests.fakedb import Base
+
+schema = 'sampledb'
+
+
+class MangaTarget(Base):
+    __tablename__ = 'manga_target'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    mangaid = Column(String)
+
+
+class Nsa(Base):
+    __tablename__ = 'nsa'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    z = Column(Float)
+    elpetro_mass = Column(Float)
+
+
+class MangaTargetToNsa(Base):
+    __tablename__ = 'manga_target_to_nsa'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    manga_target_pk = Column(Integer, ForeignKey('sampledb.manga_target.pk'))
+    nsa_pk = Column(Integer, ForeignKey('sampledb.nsa.pk'))
+
+
+class Character(Base):
+    __tablename__ = 'character'
+    __table_args__ = {'schema': schema}
+    pk = Column(Integer, primary_key=True)
+    name = Column(String)
+    manga_target_pk = Column(Integer, ForeignKey('sampledb.manga_target.pk'))
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+test_modelGraph_local.py
+
+Licensed under a 3-clause BSD license.
+
+Tests the ModelGraph with the local model classes in tests.fakedb, without
+a database.
+
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import StaticPool
+
+from brain.db.modelGraph import ModelGraph, JoinStep, nx
+from brain.db.tableStats import TableStatistics
+from tests.fakedb import Base, datadb, sampledb
+
+
+@pytest.fixture(params=['networkx', 'csr'])
+def graph(request):
+    return ModelGraph([datadb, sampledb], backend=request.param)
+
+
+class TestSteiner(object):
+
+    def test_fewer_tables(self, graph):
+        tables = ['datadb.fibers', 'datadb.flux', 'datadb.cube']
+        pairwise = graph.getJoins(tables)
+        steiner = graph.getJoins(tables, strategy='steiner')
+        assert steiner == ['datadb.fibers', 'datadb.wavelength', 'datadb.flux', 'datadb.cube']
+        assert len(steiner) < len(pairwise)
+
+    def test_ordered(self, graph):
+        tables = ['datadb.fibers', 'sampledb.nsa', 'datadb.spaxel']
+        joins = graph.getJoins(tables, strategy='steiner')
+        assert set(tables) <= set(joins)
+        for ii, table in enumerate(joins[1:], 1):
+            assert any(graph.graph.has_edge(table, prev) for prev in joins[:ii])
+
+    def test_nexus(self, graph):
+        joins = graph.getJoins([datadb.Fibers, sampledb.Nsa], nexus=datadb.Cube,
+                               strategy='steiner', format_out='models')
+        assert datadb.Cube not in joins
+        assert joins[0] in (datadb.IFUDesign, datadb.Wavelength)
+        assert joins[-1] is sampledb.Nsa
+
+    def test_nopath(self, graph):
+        with pytest.raises(nx.NetworkXNoPath):
+            graph.getJoins(['datadb.cube', 'datadb.maskbit'], strategy='steiner')
+
+    def test_bad_strategy(self, graph):
+        with pytest.raises(AssertionError):
+            graph.getJoins(['datadb.cube', 'datadb.flux'], strategy='bad')
+
+
+class TestPrecompute(object):
+
+    @pytest.fixture()
+    def pgraph(self):
+        return ModelGraph([datadb, sampledb], precompute=True)
+
+    @pytest.mark.parametrize('tables', [['datadb.fibers', 'sampledb.nsa'],
+                                        ['datadb.spaxel', 'datadb.flux', 'sampledb.character']])
+    def test_same_length(self, graph, pgraph, tables):
+        joins = pgraph.getJoins(tables)
+        assert len(joins) == len(graph.getJoins(tables))
+        assert set(tables) <= set(joins)
+
+    def test_nopath(self, pgraph, mocker):
+        spy = mocker.spy(pgraph, '_getShortestPath')
+        with pytest.raises(nx.NetworkXNoPath):
+            pgraph.getJoins(['datadb.cube', 'datadb.fibers', 'datadb.maskbit'])
+        assert spy.call_count == 0
+
+    def test_cache(self, graph):
+        tables = ['datadb.fibers', 'sampledb.nsa']
+        joins = graph.getJoins(tables)
+        joins.append('mutated')
+        assert graph.getJoins(tables) == joins[:-1]
+        assert graph.getJoins(tables, format_out='models')[-1] is sampledb.Nsa
+        info = graph.cacheInfo()
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        graph.clearCache()
+        assert graph.cacheInfo()['size'] == 0
+
+    def test_no_cache(self):
+        graph = ModelGraph([datadb, sampledb], cache_size=0)
+        assert graph.getJoins('datadb.cube') == ['datadb.cube']
+        assert graph.cacheInfo()['maxsize'] == 0
+
+    def test_bad_nexus(self, pgraph):
+        with pytest.raises(AssertionError):
+            pgraph.getJoins(['datadb.cube'], nexus='datadb.bad')
+
+
+class TestSnapshot(object):
+
+    @pytest.mark.parametrize('precompute', [False, True])
+    def test_roundtrip(self, tmpdir, precompute):
+        path = str(tmpdir.join('graph.json'))
+        graph = ModelGraph([datadb, sampledb], precompute=precompute)
+        graph.save(path)
+
+        loaded = ModelGraph.load(path)
+        assert list(loaded.nodes) == list(graph.nodes)
+        assert sorted(loaded.edges) == sorted(graph.edges)
+        assert loaded.models == graph.models
+        assert (loaded._trees is not None) == precompute
+        tables = ['datadb.fibers', 'sampledb.nsa']
+        joins = loaded.getJoins(tables, format_out='models')
+        assert len(joins) == len(graph.getJoins(tables))
+        assert joins[-1] is sampledb.Nsa
+        if precompute:
+            assert joins == graph.getJoins(tables, format_out='models')
+
+    def test_stale(self, tmpdir, mocker):
+        path = str(tmpdir.join('graph.json'))
+        ModelGraph([datadb, sampledb]).save(path)
+
+        fingerprint = [['tests.fakedb.datadb', 'datadb.py', 0, 0]]
+        mocker.patch('brain.db.modelGraph.getSchemaFingerprint', return_value=fingerprint)
+        with pytest.raises(ValueError, match='out of date'):
+            ModelGraph.load(path, [datadb, sampledb], rebuild=False)
+
+        graph = ModelGraph.load(path, [datadb, sampledb])
+        assert 'datadb.cube' in graph.nodes
+        with open(path) as ff:
+            assert json.load(ff)['fingerprint'] == fingerprint
+
+    def test_missing(self, tmpdir):
+        path = str(tmpdir.join('graph.json'))
+        with pytest.raises(ValueError):
+            ModelGraph.load(path)
+        graph = ModelGraph.load(path, [datadb, sampledb])
+        assert 'datadb.cube' in graph.nodes
+        assert tmpdir.join('graph.json').check()
+
+
+class TestPlan(object):
+
+    def test_foreign_keys(self, graph):
+        assert graph.graph.edges['datadb.cube', 'datadb.ifudesign']['foreign_keys'] == [
+            ('datadb.cube', ('ifudesign_pk',), 'datadb.ifudesign', ('pk',)),
+            ('datadb.cube', ('replaced_ifudesign_pk',), 'datadb.ifudesign', ('pk',))]
+
+    @pytest.mark.parametrize('strategy', ['pairwise', 'steiner'])
+    def test_plan(self, graph, strategy):
+        tables = ['datadb.ifudesign', 'sampledb.nsa']
+        plan = graph.getJoins(tables, format_out='plan', strategy=strategy)
+        assert plan == [
+            JoinStep('datadb.ifudesign', 'datadb.cube', (('pk', 'ifudesign_pk'),)),
+            JoinStep('datadb.cube', 'sampledb.manga_target', (('manga_target_pk', 'pk'),)),
+            JoinStep('sampledb.manga_target', 'sampledb.manga_target_to_nsa',
+                     (('pk', 'manga_target_pk'),)),
+            JoinStep('sampledb.manga_target_to_nsa', 'sampledb.nsa', (('nsa_pk', 'pk'),))]
+
+    def test_plan_nexus(self, graph):
+        plan = graph.getJoins([datadb.Spaxel], nexus=datadb.Cube, format_out='plan')
+        assert plan == [JoinStep('datadb.cube', 'datadb.spaxel', (('pk', 'cube_pk'),))]
+        assert graph.getJoins(['datadb.cube'], format_out='plan') == []
+
+    def test_snapshot(self, graph, tmpdir):
+        path = str(tmpdir.join('graph.json'))
+        graph.save(path)
+        loaded = ModelGraph.load(path)
+        tables = ['datadb.spaxel', 'sampledb.character']
+        assert loaded.getJoins(tables, format_out='plan') == \
+            graph.getJoins(tables, format_out='plan')
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ':memory:' AS datadb")
+        conn.exec_driver_sql("ATTACH DATABASE ':memory:' AS sampledb")
+        Base.metadata.create_all(conn)
+        conn.exec_driver_sql('CREATE INDEX datadb.ix_fibers_ifudesign ON fibers (ifudesign_pk)')
+        conn.execute(datadb.Wavelength.__table__.insert(), [{'pk': ii} for ii in range(5000)])
+        conn.execute(datadb.IFUDesign.__table__.insert(), [{'pk': ii} for ii in range(10)])
+    return engine
+
+
+class TestStatistics(object):
+
+    tables = ['datadb.fibers', 'datadb.cube']
+
+    def test_collect(self, engine):
+        stats = TableStatistics.collect(engine, [datadb.Wavelength, 'datadb.fibers',
+                                                 'datadb.missing'])
+        assert stats.rows == {'datadb.wavelength': 5000, 'datadb.fibers': 0}
+        assert stats.isIndexed('datadb.fibers', ['ifudesign_pk'])
+        assert stats.isIndexed('datadb.fibers', ['wavelength_pk']) is False
+        assert stats.isIndexed('datadb.missing', ['pk']) is None
+        assert TableStatistics.fromDict(stats.toDict()) == stats
+
+    def test_collect_failure(self, engine, mocker):
+        warning = mocker.patch('brain.log.warning')
+        nested = mocker.spy(Connection, 'begin_nested')
+        with engine.connect() as conn:
+            stats = TableStatistics.collect(conn, ['datadb.missing', datadb.Wavelength])
+        assert stats.rows == {'datadb.wavelength': 5000}
+        assert nested.call_count == 2
+        assert 'datadb.missing' in warning.call_args[0][0]
+
+    @pytest.mark.parametrize('precompute', [False, True])
+    def test_cheapest_path(self, engine, precompute):
+        graph = ModelGraph([datadb, sampledb], precompute=precompute)
+        graph.collectStatistics(engine)
+        joins, cost = graph.getJoins(self.tables, return_cost=True)
+        assert joins == ['datadb.fibers', 'datadb.ifudesign', 'datadb.cube']
+
+        rows = {'datadb.wavelength': 1, 'datadb.ifudesign': 10 ** 8}
+        graph.setStatistics(TableStatistics(rows=rows))
+        joins, newcost = graph.getJoins(self.tables, return_cost=True)
+        assert joins == ['datadb.fibers', 'datadb.wavelength', 'datadb.cube']
+        assert newcost != cost
+
+    def test_steiner(self, graph):
+        graph.setStatistics(TableStatistics(rows={'datadb.wavelength': 10 ** 8}))
+        joins = graph.getJoins(self.tables, strategy='steiner')
+        assert joins == ['datadb.fibers', 'datadb.ifudesign', 'datadb.cube']
+
+    def test_cost_without_statistics(self, graph):
+        joins, cost = graph.getJoins(['datadb.spaxel', 'sampledb.nsa'], return_cost=True)
+        assert cost == len(joins) - 1
+        assert graph.getJoinCost(graph.getJoins(['datadb.spaxel', 'sampledb.nsa'],
+                                                format_out='plan')) == cost
+
+    def test_snapshot(self, graph, tmpdir):
+        graph.setStatistics(TableStatistics(rows={'datadb.wavelength': 10 ** 8}))
+        path = str(tmpdir.join('graph.json'))
+        graph.save(path)
+        loaded = ModelGraph.load(path)
+        assert loaded.statistics == graph.statistics
+        assert loaded.getJoins(self.tables, return_cost=True) == \
+            graph.getJoins(self.tables, return_cost=True)
+
+
+class TestCSR(object):
+
+    @pytest.fixture()
+    def graphs(self):
+        return ModelGraph([datadb, sampledb]), ModelGraph([datadb, sampledb], backend='csr')
+
+    def test_api(self, graphs):
+        nxgraph, csrgraph = graphs
+        assert list(csrgraph.nodes) == list(nxgraph.nodes)
+        assert sorted(map(sorted, csrgraph.edges)) == sorted(map(sorted, nxgraph.edges))
+        assert 'datadb.cube' in csrgraph.nodes
+        assert csrgraph.graph.nodes['datadb.cube']['model'] is datadb.Cube
+        assert csrgraph.graph.has_edge('datadb.ifudesign', 'datadb.cube')
+        assert not csrgraph.graph.has_edge('datadb.maskbit', 'datadb.cube')
+        assert csrgraph.graph.edges['datadb.ifudesign', 'datadb.cube'] == \
+            nxgraph.graph.edges['datadb.ifudesign', 'datadb.cube']
+
+    @pytest.mark.parametrize('precompute', [False, True])
+    def test_same_path_lengths(self, graphs, precompute):
+        nxgraph, csrgraph = graphs
+        if precompute:
+            csrgraph.precomputePaths()
+        tables = [table for table in nxgraph.nodes if table != 'datadb.maskbit']
+        for tableA in tables:
+            for tableB in tables:
+                joins = csrgraph.getJoins([tableA, tableB])
+                assert len(joins) == len(nxgraph.getJoins([tableA, tableB]))
+                assert joins[0] == tableA and joins[-1] == tableB
+
+    def test_nopath(self, graphs):
+        csrgraph = graphs[1]
+        with pytest.raises(nx.NetworkXNoPath):
+            csrgraph.getJoins(['datadb.cube', 'datadb.maskbit'])
+        csrgraph.precomputePaths()
+        assert len(set(csrgraph._components.values())) == 2
+
+    def test_statistics(self):
+        stats = TableStatistics(rows={'datadb.ifudesign': 10 ** 8})
+        graph = ModelGraph([datadb, sampledb], backend='csr', statistics=stats)
+        joins, cost = graph.getJoins(['datadb.fibers', 'datadb.cube'], return_cost=True)
+        assert joins == ['datadb.fibers', 'datadb.wavelength', 'datadb.cube']
+        graph.setStatistics(TableStatistics(rows={'datadb.wavelength': 10 ** 8}))
+        assert graph.getJoins(['datadb.fibers', 'datadb.cube'], strategy='steiner') == \
+            ['datadb.fibers', 'datadb.ifudesign', 'datadb.cube']
+
+    def test_snapshot(self, tmpdir):
+        path = str(tmpdir.join('graph.json'))
+        ModelGraph([datadb, sampledb], precompute=True).save(path)
+        graph = ModelGraph.load(path, backend='csr')
+        assert graph.backend == 'csr'
+        assert graph.getJoins(['datadb.spaxel', 'sampledb.nsa'])[-1] == 'sampledb.nsa'
+
+
+class TestBatch(object):
+
+    sets = [['datadb.spaxel', 'sampledb.nsa'],
+            ['datadb.fibers', 'sampledb.character', 'datadb.flux'],
+            ['datadb.spaxel', 'sampledb.nsa'],
+            [datadb.Cube, sampledb.Nsa]]
+
+    @pytest.mark.parametrize('workers', [None, 3])
+    @pytest.mark.parametrize('format_out', ['tables', 'models', 'plan'])
+    def test_batch(self, graph, workers, format_out):
+        batch = graph.getJoinsBatch(self.sets, format_out=format_out, workers=workers)
+        assert len(batch) == len(self.sets)
+        for tables, joins in zip(self.sets, batch):
+            single = ModelGraph([datadb, sampledb]).getJoins(tables, format_out=format_out)
+            assert len(joins) == len(single)
+            if format_out != 'plan':
+                assert joins[-1] == single[-1]
+        assert batch[0] == batch[2] and batch[0] is not batch[2]
+
+    def test_dedupe(self, graph, mocker):
+        spy = mocker.spy(graph, '_getJoins')
+        graph.getJoinsBatch(self.sets * 3)
+        assert spy.call_count == 3
+        assert graph.cacheInfo()['size'] == 3
+
+    def test_shared_trees(self, mocker):
+        graph = ModelGraph([datadb, sampledb], cache_size=0)
+        spy = mocker.spy(graph, '_bfsTree')
+        graph.getJoinsBatch([['datadb.spaxel', 'sampledb.nsa'],
+                             ['datadb.spaxel', 'sampledb.character'],
+                             ['sampledb.character', 'datadb.spaxel']])
+        assert spy.call_count == 1
+
+    def test_errors(self, graph):
+        sets = [['datadb.cube', 'datadb.maskbit'], ['datadb.cube', 'datadb.spaxel']]
+        with pytest.raises(nx.NetworkXNoPath):
+            graph.getJoinsBatch(sets)
+        batch = graph.getJoinsBatch(sets, raise_errors=False)
+        assert isinstance(batch[0], nx.NetworkXNoPath)
+        assert batch[1] == ['datadb.cube', 'datadb.spaxel']
+
+
+class TestFilter(object):
+
+    @pytest.fixture()
+    def fgraph(self, graph):
+        graph.addAliases({'ifu': 'datadb.ifudesign'})
+        return graph
+
+    @pytest.mark.parametrize('filterString, tables',
+                             [('ifu.nfiber == 127 and nsa.z > 0.1',
+                               ['datadb.ifudesign', 'sampledb.nsa']),
+                              ('datadb.cube.plateifu = "8485-1901" or x < 1e5',
+                               ['datadb.cube', 'datadb.spaxel']),
+                              ("fiberid in (1, 2) and mangaid == 'ifu.nfiber and pk'",
+                               ['datadb.fibers', 'sampledb.manga_target']),
+                              ('abs(elpetro_mass) > 10 and nsa.pk is not null',
+                               ['sampledb.nsa']),
+                              ('IFU.NFIBER > 1', ['datadb.ifudesign'])])
+    def test_parse(self, fgraph, filterString, tables):
+        assert fgraph.parseFilter(filterString) == tables
+
+    def test_lookup(self, fgraph):
+        index = fgraph.columnIndex
+        assert index.lookup('name') == ['datadb.ifudesign', 'sampledb.character']
+        assert index.lookup('ifu.name') == ['datadb.ifudesign']
+        assert index.lookup('sampledb.nsa.z') == ['sampledb.nsa']
+
+    def test_errors(self, fgraph):
+        with pytest.raises(ValueError, match='not a column'):
+            fgraph.parseFilter('nsa.bad > 1')
+        assert fgraph.parseFilter('nsa.z > 1 and bad > 2', strict=False) == ['sampledb.nsa']
+        with pytest.raises(ValueError, match='ambiguous'):
+            fgraph.parseFilter('name == "a"')
+        assert fgraph.parseFilter('name == "a" and ifu.nfiber > 1') == ['datadb.ifudesign']
+        with pytest.raises(ValueError):
+            fgraph.addAliases({'bad': 'datadb.nothere'})
+
+    def test_joins(self, fgraph):
+        joins = fgraph.getJoinsFromFilter('ifu.nfiber == 127 and nsa.z > 0.1')
+        assert joins == fgraph.getJoins(['datadb.ifudesign', 'sampledb.nsa'])
+        fgraph.getJoinsFromFilter('ifu.nfiber == 127 and nsa.z > 0.1')
+        assert fgraph.columnIndex.cacheInfo()['hits'] == 1
+        with pytest.raises(ValueError, match='does not reference'):
+            fgraph.getJoinsFromFilter('1 > 0')
+
+
+class TestSelect(object):
+
+    def test_join_clause(self, graph):
+        joins = graph.getJoinClause([datadb.Fibers, sampledb.Nsa])
+        sql = str(joins)
+        assert sql.count('JOIN') == 5
+        assert 'ON datadb.fibers.ifudesign_pk = datadb.ifudesign.pk' in sql
+        assert graph.getJoinClause([datadb.Fibers, sampledb.Nsa]) is joins
+        assert graph.getJoinClause(['datadb.cube']) is datadb.Cube.__table__
+
+    def test_select(self, graph, engine):
+        with engine.begin() as conn:
+            conn.execute(datadb.Cube.__table__.insert(), [
+                {'pk': 1, 'plateifu': '8485-1901', 'ifudesign_pk': 3},
+                {'pk': 2, 'plateifu': '7443-12701', 'ifudesign_pk': 4}])
+            stmt = graph.getSelect([datadb.Cube, datadb.IFUDesign],
+                                   columns=[datadb.Cube.plateifu])
+            assert stmt is graph.getSelect([datadb.Cube, datadb.IFUDesign],
+                                           columns=[datadb.Cube.plateifu])
+            rows = conn.execute(stmt.where(datadb.IFUDesign.pk == 4)).fetchall()
+        assert [row.plateifu for row in rows] == ['7443-12701']
+        assert len(graph.getSelect([datadb.Cube, datadb.IFUDesign]).selected_columns) == 9
+
+    def test_compiled(self, graph, engine):
+        compiled = graph.getCompiledSelect(['datadb.spaxel', 'sampledb.character'], 'postgresql')
+        assert compiled.dialect.name == 'postgresql'
+        assert 'JOIN sampledb.character ON' in str(compiled)
+        assert graph.getCompiledSelect(['datadb.spaxel', 'sampledb.character'],
+                                       'postgresql') is compiled
+        other = graph.getCompiledSelect(['datadb.spaxel', 'sampledb.character'], engine)
+        assert other is not compiled
+        assert other.dialect.name == 'sqlite'
+        graph.clearCache()
+        assert graph.cacheInfo('selects')['size'] == 0
+
+    def test_compiled_drivers(self, graph):
+        tables = ['datadb.ifudesign', 'datadb.cube']
+        columns = [datadb.Cube.plateifu, datadb.IFUDesign.nfiber]
+        psycopg = graph.getCompiledSelect(tables, 'postgresql+psycopg2', columns=columns)
+        asyncpg = graph.getCompiledSelect(tables, 'postgresql+asyncpg', columns=columns)
+        assert asyncpg is not psycopg
+        assert asyncpg.dialect.driver == 'asyncpg'
+        assert graph.getCompiledSelect(tables, 'postgresql+asyncpg', columns=columns) is asyncpg
+
+    def test_unhashable_columns(self, graph):
+        with pytest.raises(ValueError, match='must be hashable'):
+            graph.getSelect(['datadb.cube'], columns=[[datadb.Cube.plateifu]])
+
+
+class TestSchemas(object):
+
+    @staticmethod
+    def edges(graph):
+        return sorted((sorted(edge), sorted(data['foreign_keys']))
+                      for *edge, data in graph.graph.edges(data=True))
+
+    @pytest.mark.parametrize('backend', ['networkx', 'csr'])
+    def test_add(self, backend):
+        graph = ModelGraph([datadb], backend=backend)
+        graph.addSchema(sampledb)
+        full = ModelGraph([datadb, sampledb])
+        assert sorted(graph.nodes) == sorted(full.nodes)
+        assert self.edges(graph) == self.edges(full)
+        assert [schema.__name__ for schema in graph.schemas] == \
+            [schema.__name__ for schema in full.schemas]
+        assert graph.fingerprint == full.fingerprint
+        assert len(graph.getJoins(['datadb.spaxel', 'sampledb.nsa'])) == \
+            len(full.getJoins(['datadb.spaxel', 'sampledb.nsa']))
+
+    @pytest.mark.parametrize('backend', ['networkx', 'csr'])
+    def test_remove(self, backend):
+        graph = ModelGraph([datadb, sampledb], backend=backend)
+        graph.removeSchema(sampledb)
+        assert sorted(graph.nodes) == sorted(ModelGraph([datadb]).nodes)
+        assert self.edges(graph) == self.edges(ModelGraph([datadb]))
+        assert list(graph.models) == ['tests.fakedb.datadb']
+        with pytest.raises(ValueError):
+            graph.removeSchema('tests.fakedb.sampledb')
+
+    def test_replace(self):
+        graph = ModelGraph([datadb, sampledb])
+        graph.addSchema(datadb)
+        assert self.edges(graph) == self.edges(ModelGraph([datadb, sampledb]))
+        assert len(graph.schemas) == 2
+
+    def test_invalidation(self, graph):
+        graph.getJoins(['datadb.maskbit'])
+        graph.getJoins(['sampledb.nsa', 'sampledb.character'])
+        graph.getJoinClause(['datadb.maskbit'])
+        graph.getJoins(['datadb.fibers', 'datadb.cube'])
+        graph.getJoinClause(['datadb.fibers', 'datadb.cube'])
+        graph.removeSchema(sampledb)
+        assert sorted(graph._plans.keys()) == [(('datadb.maskbit',), None, 'plan', 'pairwise'),
+                                       (('datadb.maskbit',), None, 'tables', 'pairwise')]
+        assert len(graph._selects.keys()) == 1
+        with pytest.raises(AssertionError):
+            graph.getJoins(['sampledb.nsa'])
+
+    def test_precomputed(self):
+        graph = ModelGraph([datadb], precompute=True)
+        maskbitTree = graph._trees['datadb.maskbit']
+        graph.addSchema(sampledb)
+        assert graph._trees['datadb.maskbit'] is maskbitTree
+        assert 'sampledb.nsa' in graph._trees['datadb.cube']
+        assert graph._components['datadb.cube'] == graph._components['sampledb.nsa']
+        assert graph.getJoins(['datadb.spaxel', 'sampledb.nsa'])[-1] == 'sampledb.nsa'
+
+    def test_column_index(self):
+        graph = ModelGraph([datadb])
+        graph.addAliases({'ifu': 'datadb.ifudesign'})
+        assert graph.parseFilter('ifu.nfiber > 1', strict=False) == ['datadb.ifudesign']
+        graph.addSchema(sampledb)
+        assert graph.parseFilter('nsa.z > 0.1') == ['sampledb.nsa']
+        graph.addAliases({'nsa': 'sampledb.nsa'})
+        graph.removeSchema(sampledb)
+        assert graph.aliases == {'ifu': 'datadb.ifudesign'}
+        with pytest.raises(ValueError):
+            graph.parseFilter('nsa.z > 0.1')
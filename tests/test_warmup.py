@@ -0,0 +1,119 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import threading
+import time
+import pytest
+from flask import current_app
+
+from brain.api.base import BrainBaseView
+from brain.api.ratelimit import RateLimit, RateLimiter
+from brain.core.exceptions import BrainError
+from brain.core.warmup import WarmupRegistry
+
+
+@pytest.fixture()
+def registry():
+    yield WarmupRegistry()
+
+
+def test_order(registry):
+    calls = []
+    registry.register(lambda: calls.append('a'), name='a')
+    registry.register(lambda: calls.append('b'), name='b', after=['a'])
+    registry.register(lambda: calls.append('c'), name='c', after=['b'])
+    status = registry.run()
+    assert calls == ['a', 'b', 'c']
+    assert all(val['state'] == 'done' for val in status.values())
+    assert registry.ready
+
+
+def test_parallel(registry):
+    threads = set()
+
+    def task():
+        threads.add(threading.get_ident())
+        time.sleep(0.05)
+
+    for name in 'abcd':
+        registry.register(task, name=name)
+    t0 = time.time()
+    registry.run()
+    assert time.time() - t0 < 0.15
+    assert len(threads) > 1
+
+
+def test_failure(registry):
+    def bad():
+        raise ValueError('no database')
+
+    registry.register(bad, name='db')
+    registry.register(lambda: None, name='pool', after=['db'])
+    status = registry.run()
+    assert status['db']['state'] == 'failed'
+    assert 'no database' in status['db']['error']
+    assert status['pool']['state'] == 'skipped'
+    assert not registry.ready
+    with pytest.raises(BrainError, match='warmup failed'):
+        registry.run(raise_errors=True)
+
+
+def test_bad_dependencies(registry):
+    registry.register(lambda: None, name='a', after=['b'])
+    registry.register(lambda: None, name='b', after=['a'])
+    with pytest.raises(BrainError, match='circular'):
+        registry.run()
+    assert registry.status()['a']['state'] == 'failed'
+    assert not registry.ready
+
+
+def test_background_cycle(app, registry):
+    registry.register(lambda: None, name='a', after=['b'])
+    registry.register(lambda: None, name='b', after=['a'])
+    registry.init_app(app)
+    assert registry.wait(5)
+    assert not registry.ready
+    status = registry.status()
+    assert status['a']['state'] == 'failed'
+    assert 'circular' in status['b']['error']
+    client = app.test_client()
+    resp = client.get('/api/general/ready/')
+    assert resp.status_code == 503
+    # the error messages are only reported to authenticated requests
+    assert resp.get_json()['data']['warmup']['b'] == {'state': 'failed', 'required': True}
+    resp = client.get('/api/general/ready/', headers={'Authorization': 'Bearer abc'})
+    assert 'circular' in resp.get_json()['data']['warmup']['b']['error']
+
+
+def test_ready_route(app, registry):
+    event = threading.Event()
+
+    @registry.register
+    def slow():
+        assert current_app.name == app.name
+        event.wait(5)
+
+    client = app.test_client()
+    registry.init_app(app)
+    resp = client.get('/api/general/ready/')
+    assert resp.status_code == 503
+    assert resp.get_json()['data']['ready'] is False
+    event.set()
+    assert registry.wait(5)
+    resp = client.get('/api/general/ready/')
+    assert resp.status_code == 200
+    assert resp.get_json()['data']['warmup']['slow']['state'] == 'done'
+    assert resp.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in resp.headers
+
+
+def test_ready_not_rate_limited(app, registry, monkeypatch):
+    limiter = RateLimiter(default=RateLimit(1, per=60), ip_limit=RateLimit(1, per=60),
+                          exempt_public=False)
+    monkeypatch.setattr(BrainBaseView, 'limiter', limiter)
+    registry.init_app(app)
+    assert registry.wait(5)
+    client = app.test_client()
+    for __ in range(3):
+        assert client.get('/api/general/ready/').status_code == 200
@@ -0,0 +1,52 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+from brain.utils.general.cache import TTLCache
+
+
+class Clock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.keys() == ['a', 'c']
+    assert cache.evictions == 1
+
+
+def test_ttl():
+    clock = Clock()
+    cache = TTLCache(ttl=10, timer=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=None)
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+
+def test_info():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    info = cache.info()
+    assert info['hits'] == 1
+    assert info['misses'] == 1
+    assert info['hit_rate'] == 0.5
+
+
+def test_discard():
+    cache = TTLCache()
+    for key in ['a1', 'a2', 'b1']:
+        cache.set(key, 0)
+    assert cache.discard(lambda key: key.startswith('a')) == 2
+    assert cache.keys() == ['b1']
@@ -0,0 +1,67 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import numpy as np
+import pytest
+
+from brain.core.exceptions import BrainError
+from brain.utils.general import ivar_to_err
+from brain.utils.general.chunked import (ChunkedEngine, chunked_ivar_to_err, chunked_err_to_ivar,
+                                         open_array)
+
+
+@pytest.fixture()
+def ivar(tmpdir):
+    data = np.random.uniform(0.5, 10, size=(50, 6, 6)).astype(np.float32)
+    data[3, 2, 1] = 0.
+    data[7, 0, 0] = -2.
+    path = str(tmpdir.join('ivar.npy'))
+    np.save(path, data)
+    return path, data
+
+
+def test_ivar_to_err_files(ivar, tmpdir):
+    path, data = ivar
+    engine = ChunkedEngine(chunk_bytes=144 * 5, workers=3)
+    err, mask = chunked_ivar_to_err(path, out=str(tmpdir.join('err.npy')),
+                                    mask_out=str(tmpdir.join('mask.npy')), engine=engine)
+    assert isinstance(err, np.memmap)
+    assert err.dtype == np.float32
+    assert np.array_equal(np.load(str(tmpdir.join('err.npy'))), ivar_to_err(data))
+    assert np.load(str(tmpdir.join('mask.npy'))).sum() == 2
+    assert engine.stats['chunks'] == 10
+    assert engine.stats['bytes_read'] == data.nbytes
+    assert engine.stats['bytes_written'] == data.nbytes * 5 // 4
+
+
+def test_roundtrip_memory(ivar):
+    path, data = ivar
+    good = data > 0
+    ivar2 = chunked_err_to_ivar(chunked_ivar_to_err(np.load(path)))
+    assert ivar2[good] == pytest.approx(data[good], rel=1e-5)
+
+
+def test_out_required(ivar):
+    path, data = ivar
+    with pytest.raises(BrainError, match='output array or path is needed'):
+        chunked_ivar_to_err(open_array(path))
+
+
+def test_raw_file(tmpdir):
+    path = str(tmpdir.join('ivar.dat'))
+    np.arange(1, 11, dtype=np.float64).tofile(path)
+    err = chunked_ivar_to_err(path, out=np.empty(10), dtype=np.float64,
+                              engine=ChunkedEngine(chunk_bytes=16))
+    assert err == pytest.approx(1 / np.sqrt(np.arange(1, 11)))
+    with pytest.raises(BrainError, match='dtype is needed'):
+        chunked_ivar_to_err(path)
+
+
+def test_apply_generic():
+    engine = ChunkedEngine(chunk_bytes=8, workers=2)
+    data = np.arange(10.)
+    out = engine.apply(lambda tile, out: np.multiply(tile, 2, out=out), data)
+    assert out.tolist() == (data * 2).tolist()
+    with pytest.raises(BrainError):
+        engine.apply(lambda tile, out: None, data, outputs=[None], dtypes=[None, None])
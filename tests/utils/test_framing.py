@@ -0,0 +1,63 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import pytest
+
+from brain.core.exceptions import BrainError
+from brain.utils.general.framing import (FRAMED_MIMETYPE, encode_frames, FrameDecoder,
+                                         decode_frames)
+from brain.api.api import BrainInteraction
+
+
+rows = [{'a': i, 'b': 'x;\n' * i} for i in range(25)]
+
+
+@pytest.mark.parametrize('codec', ['json', 'msgpack'])
+@pytest.mark.parametrize('zlib_level', [None, 6])
+def test_roundtrip(codec, zlib_level):
+    stream = b''.join(encode_frames(rows, compress_with=codec, batch_size=10,
+                                    zlib_level=zlib_level))
+    assert stream.startswith(b'BRN\x01')
+    assert decode_frames(stream) == rows
+
+
+def test_incremental():
+    stream = b''.join(encode_frames(rows, compress_with='msgpack', batch_size=4))
+    decoder = FrameDecoder()
+    out = []
+    for i in range(0, len(stream), 7):
+        out.extend(decoder.feed(stream[i:i + 7]))
+    decoder.close()
+    assert out == rows
+    assert decoder.nframes == 7
+
+
+def test_truncated():
+    stream = b''.join(encode_frames(rows))
+    with pytest.raises(BrainError, match='middle of a frame'):
+        decode_frames(stream[:-1])
+
+
+def test_bad_header():
+    with pytest.raises(BrainError, match='not a Brain framed stream'):
+        decode_frames(b'{"a": 1};\n')
+
+
+class FakeResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {'Content-Type': FRAMED_MIMETYPE}
+
+    def iter_content(self, chunk_size=None):
+        for i in range(0, len(self.content), 5):
+            yield self.content[i:i + 5]
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_interaction(stream):
+    ii = BrainInteraction('/test/', send=False, auth=None, stream=stream,
+                          base='https://lore.sdss.utah.edu/test/')
+    content = b''.join(encode_frames(rows, compress_with='msgpack'))
+    assert ii._get_content(FakeResponse(content)) == {'data': rows}
@@ -10,11 +10,16 @@
 
 from __future__ import print_function, division, absolute_import
 import os
+import numpy as np
 import pytest
 import yaml
+from passlib.apache import HtpasswdFile
 from brain.utils.general import (getDbMachine, compress_data, uncompress_data, merge,
                                  convertIvarToErr, inspection_authenticate,
-                                 collaboration_authenticate, get_yaml_loader)
+                                 collaboration_authenticate, get_yaml_loader,
+                                 validate_user, check_htpasswd, clear_login_cache,
+                                 clear_collaboration_cache, ivar_to_err, err_to_ivar,
+                                 ivar_to_err_masked, err_to_ivar_masked)
 
 
 class TestGetDbMachine(object):
@@ -89,6 +94,45 @@ def test_convertivar():
     assert exp == pytest.approx(data)
 
 
+def test_convertivar_invalid():
+    data = convertIvarToErr(np.array([4., 0., -1., np.nan]))
+    assert data[:2] == [0.5, 0.]
+    assert np.isnan(data[2:]).all()
+
+
+class TestIvarErr(object):
+
+    def test_ivar_to_err(self):
+        ivar = np.array([[4., 0.], [-1., np.nan]], dtype=np.float32)
+        err = ivar_to_err(ivar)
+        assert err.dtype == np.float32
+        assert err.tolist() == [[0.5, 0.], [0., 0.]]
+        assert ivar_to_err([1, 4]).dtype == np.float64
+
+    def test_inplace(self):
+        ivar = np.array([4., 16., 0.])
+        out = ivar_to_err(ivar, out=ivar)
+        assert out is ivar
+        assert ivar.tolist() == [0.5, 0.25, 0.]
+
+    def test_roundtrip(self):
+        ivar = np.random.uniform(0.1, 100, size=(3, 4, 5))
+        assert err_to_ivar(ivar_to_err(ivar)) == pytest.approx(ivar)
+
+    def test_bad_out(self):
+        with pytest.raises(ValueError):
+            ivar_to_err(np.ones(3), out=np.empty(4))
+
+    def test_masked(self):
+        ivar = np.ma.MaskedArray([4., 0., -1., np.inf, 1.], mask=[0, 0, 0, 0, 1])
+        err = ivar_to_err_masked(ivar)
+        assert err.mask.tolist() == [False, True, True, True, True]
+        assert err[0] == 0.5
+        ivar = err_to_ivar_masked(np.array([0.5, 2., 0.]), mask=[False, True, False])
+        assert ivar.mask.tolist() == [False, True, True]
+        assert ivar[0] == 4.
+
+
 def test_inspect_auth():
     data = inspection_authenticate({}, 'test', 'test')
     assert data == {'ready': True, 'message': 'Logged in as test. ',
@@ -98,6 +142,99 @@ def test_collab_auth():
     data = collaboration_authenticate('test', 'test')
     assert data == {'is_valid': False, 'status': -1, 'message': "No module named 'collaboration'"}
 
+
+class TestCollabCache(object):
+
+    @pytest.fixture()
+    def credential(self, monkeypatch):
+        ''' a fake collaboration package counting the calls to Trac '''
+
+        import sys
+        import types
+
+        class Credential(object):
+            calls = 0
+
+            def __init__(self, username=None, password=None, verbose=None):
+                self.password = password
+                self.member = None
+
+            def authenticate_via_trac(self):
+                Credential.calls += 1
+                self.authenticated = self.password == 'good'
+
+            def set_member(self):
+                pass
+
+        wiki = types.ModuleType('collaboration.wiki')
+        wiki.Credential = Credential
+        monkeypatch.setitem(sys.modules, 'collaboration', types.ModuleType('collaboration'))
+        monkeypatch.setitem(sys.modules, 'collaboration.wiki', wiki)
+        clear_collaboration_cache()
+        yield Credential
+        clear_collaboration_cache()
+
+    def test_cached(self, credential):
+        data = collaboration_authenticate('test', 'good')
+        assert data == {'is_valid': True, 'status': 1, 'member': None, 'user': 'test'}
+        data['user'] = 'changed'
+        assert collaboration_authenticate('test', 'good')['user'] == 'test'
+        assert collaboration_authenticate('test', 'bad')['is_valid'] is False
+        assert collaboration_authenticate('test', 'bad')['is_valid'] is False
+        assert credential.calls == 2
+
+    def test_invalidate(self, credential):
+        collaboration_authenticate('test', 'good')
+        clear_collaboration_cache('other')
+        collaboration_authenticate('test', 'good')
+        assert credential.calls == 1
+        clear_collaboration_cache('test')
+        collaboration_authenticate('test', 'good')
+        assert credential.calls == 2
+
+    def test_no_cache(self, credential):
+        collaboration_authenticate('test', 'good', use_cache=False)
+        collaboration_authenticate('test', 'good', use_cache=False)
+        assert credential.calls == 2
+
+
 def test_get_yaml():
     loader = get_yaml_loader()
-    assert issubclass(loader, yaml.FullLoader)
\ No newline at end of file
+    assert issubclass(loader, yaml.FullLoader)
+
+
+class TestHtpasswd(object):
+
+    @pytest.fixture()
+    def htpass(self, tmpdir):
+        path = str(tmpdir.join('.htpasswd'))
+        ht = HtpasswdFile(path, new=True)
+        ht.set_password('sdss', 'secret')
+        ht.save()
+        clear_login_cache()
+        yield path
+        clear_login_cache()
+
+    def test_validate(self, htpass):
+        assert validate_user('sdss', 'secret', htpassfile=htpass) == (True, 'sdss', {})
+        assert validate_user('sdss', 'wrong', htpassfile=htpass)[0] is False
+
+    def test_cached_check(self, mocker, htpass):
+        spy = mocker.spy(HtpasswdFile, 'check_password')
+        assert check_htpasswd(htpass, 'sdss', 'secret') is True
+        assert check_htpasswd(htpass, 'sdss', 'secret') is True
+        assert spy.call_count == 1
+        assert check_htpasswd(htpass, 'sdss', 'wrong') is False
+        assert check_htpasswd(htpass, 'sdss', 'wrong') is False
+        assert spy.call_count == 3
+
+    def test_reload(self, htpass):
+        assert check_htpasswd(htpass, 'sdss', 'secret') is True
+        ht = HtpasswdFile(htpass)
+        ht.set_password('sdss', 'newsecret')
+        ht.save()
+        # force a different mtime
+        stat = os.stat(htpass)
+        os.utime(htpass, (stat.st_atime, stat.st_mtime + 10))
+        assert check_htpasswd(htpass, 'sdss', 'secret') is False
+        assert check_htpasswd(htpass, 'sdss', 'newsecret') is True
@@ -0,0 +1,133 @@
+# !usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+
+import datetime
+import time
+import pytest
+from werkzeug.test import EnvironBuilder
+from flask import Request
+from sqlalchemy import Column, DateTime, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from brain.utils.general import UserStatsWriter, get_db_user
+
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    username = Column(String)
+    login_count = Column(Integer)
+    last_ip = Column(String)
+    last_login = Column(DateTime)
+
+    def set_password(self, password):
+        pass
+
+    def check_password(self, password):
+        return True
+
+    def update_stats(self, request=None):
+        self.login_count += 1
+        self.last_ip = request.remote_addr if request else None
+        self.last_login = datetime.datetime.now()
+
+
+@pytest.fixture()
+def factory():
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False},
+                           poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    with session.begin():
+        session.add(User(username='test', login_count=1))
+    session.close()
+    yield factory
+
+
+def make_request(ip='1.2.3.4'):
+    ee = EnvironBuilder(method='POST', path='login', environ_base={'REMOTE_ADDR': ip})
+    return Request(ee.get_environ())
+
+
+def get_user(factory):
+    session = factory()
+    user = session.query(User).filter(User.username == 'test').one()
+    session.close()
+    return user
+
+
+def test_batch(factory):
+    writer = UserStatsWriter(factory, User, start=False)
+    for i in range(3):
+        writer.add('test', request=make_request('10.0.0.{0}'.format(i)))
+    writer.add('unknown')
+    assert get_user(factory).login_count == 1
+    assert writer.flush() == 4
+    user = get_user(factory)
+    assert user.login_count == 4
+    assert user.last_ip == '10.0.0.2'
+    assert writer.flush() == 0
+
+
+class TimedUser(User):
+    def update_stats(self, request=None, login_time=None):
+        super(TimedUser, self).update_stats(request=request)
+        self.last_login = login_time
+
+
+@pytest.mark.parametrize('model', [User, TimedUser])
+def test_login_time(factory, model):
+    writer = UserStatsWriter(factory, model, start=False)
+    before = datetime.datetime.now()
+    writer.add('test')
+    after = datetime.datetime.now()
+    time.sleep(0.05)
+    writer.flush()
+    assert before <= get_user(factory).last_login <= after
+
+
+def test_batch_size(factory):
+    writer = UserStatsWriter(factory, User, interval=60, batch_size=2)
+    writer.add('test')
+    writer.add('test')
+    writer.stop()
+    assert get_user(factory).login_count == 3
+
+
+def test_get_db_user(factory):
+    writer = UserStatsWriter(factory, User, start=False)
+    session = factory()
+    user = get_db_user('test', 'pass', dbsession=session, user_model=User,
+                       request=make_request(), stats_writer=writer)
+    session.close()
+    assert user.username == 'test'
+    assert len(writer) == 1
+    writer.flush()
+    assert get_user(factory).login_count == 2
+
+
+def test_retry(factory):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is down')
+        return factory()
+
+    writer = UserStatsWriter(flaky, User, start=False, max_queue=3)
+    writer.add('test')
+    writer.add('test')
+    assert writer.flush() == 0
+    assert len(writer) == 2
+    writer.add('test')
+    writer.add('test')
+    assert len(writer) == 3
+    assert writer.flush() == 3
+    assert get_user(factory).login_count == 4